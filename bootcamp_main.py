@@ -4,22 +4,30 @@ Bootcamp F2025
 Main process to setup and manage all the other working processes
 """
 
-import multiprocessing as mp
 import time
 
-from pymavlink import mavutil
-
 from modules.common.modules.logger import logger
 from modules.common.modules.logger import logger_main_setup
 from modules.common.modules.read_yaml import read_yaml
 from modules.command import command
 from modules.command import command_worker
+from modules.heartbeat import heartbeat_receiver
 from modules.heartbeat import heartbeat_receiver_worker
 from modules.heartbeat import heartbeat_sender_worker
+from modules.mavlink_io import mavlink_link_worker
+from modules.mavlink_io import mavlink_reader
+from modules.telemetry import telemetry
 from modules.telemetry import telemetry_worker
+from utilities.workers import managed_queues
+from utilities.workers import message_codec
+from utilities.workers import queue_doorbell
 from utilities.workers import queue_proxy_wrapper
+from utilities.workers import queue_selector
+from utilities.workers import worker_backends
 from utilities.workers import worker_controller
 from utilities.workers import worker_manager
+from utilities.workers import worker_pipeline
+from utilities.workers import worker_scheduling
 
 
 # MAVLink connection
@@ -31,26 +39,103 @@ CONNECTION_STRING = "tcp:localhost:12345"
 # Set queue max sizes (<= 0 for infinity)
 COMMAND_QUEUE_SIZE = 5
 HB_QUEUE_SIZE = 5
-TELEMETRY_QUEUE_SIZE = 10
+HEARTBEAT_MESSAGE_QUEUE_SIZE = 5
+OUTBOUND_QUEUE_SIZE = 20
+TELEMETRY_QUEUE_SIZE = 10  # Only 1 is used while the telemetry queue is conflating
 # Set worker counts
 HEARTBEAT_SENDER_WORKER_COUNT = 1
 HEARTBEAT_RECEIVER_WORKER_COUNT = 1
+# Most workers while resizing at runtime with `WorkerManager.scale_to()`
+HEARTBEAT_RECEIVER_WORKER_MAX_COUNT = 2
 TELEMETRY_WORKER_COUNT = 1
+# Command averages the velocity over the whole trip and reads a conflating queue, so 1 only
 COMMAND_WORKER_COUNT = 1
+# Longest time the command worker waits for space before dropping its output
+COMMAND_QUEUE_PUT_TIMEOUT = 1  # seconds
 
 # Any other constants
+# Only the MAVLink link reads from the connection, it routes each message type to its subscribers
+HEARTBEAT_MESSAGE_TYPES = ["HEARTBEAT"]
+TELEMETRY_MESSAGE_TYPES = ["ATTITUDE", "LOCAL_POSITION_NED"]
+HEARTBEAT_RECEIVER_PERIOD = 1  # seconds
+# Every frame received and sent is captured to this tlog file, None for no capture
+CAPTURE_PATH = None  # e.g. "logs/capture.tlog"
+# Replays this capture instead of connecting to the drone, None to connect
+# For benchmarking the workers offline against real traffic
+REPLAY_PATH = None
+# Multiple of the captured rate, e.g. 1.0 for real time or math.inf for as fast as possible
+REPLAY_SPEED = 1.0
 RUN_TIME = 100  # number of seconds for test to run for
+# Queue statistics and worker resource usage
+STATISTICS_LOG_PERIOD = 10  # seconds
+# Longest time main waits for worker outputs before checking the run time again
+MAIN_WAIT_TIME = 1  # seconds
+# Longest time waiting for the workers to start running
+START_TIMEOUT = 10  # seconds
+# Longest time waiting for the workers to exit, before they are terminated and then killed
+STOP_TIMEOUT = 5  # seconds
+# How workers are started: "fork", "spawn", or "forkserver"
+# The others need picklable work arguments
+# Under fork, crashed worker processes are not restarted while thread workers run in main,
+# since forking can copy a lock held by one of their threads
+START_METHOD = "fork"
+# Imported once by the forkserver instead of in every worker
+PRELOAD_MODULES = [
+    "modules.command.command_worker",
+    "modules.heartbeat.heartbeat_receiver_worker",
+    "modules.heartbeat.heartbeat_sender_worker",
+    "modules.mavlink_io.mavlink_link_worker",
+    "modules.telemetry.telemetry_worker",
+]
 TARGET = command.Position(0, 20, 10)
+# Latency critical workers are kept ahead of the rest
+# Real time and negative nice need root or CAP_SYS_NICE, otherwise they are skipped with a warning
+# Set cpus to reserve cores on the companion computer, e.g. {2} and {3}
+HEARTBEAT_SENDER_SCHEDULING = worker_scheduling.WorkerScheduling(
+    cpus=None, policy=worker_scheduling.SchedulingPolicy.FIFO, priority=10
+)
+TELEMETRY_SCHEDULING = worker_scheduling.WorkerScheduling(cpus=None, nice=-5)
+# The link mostly waits on the socket, its reader and writer threads use this too
+MAVLINK_LINK_SCHEDULING = worker_scheduling.WorkerScheduling(cpus=None)
+# Heartbeat workers mostly wait, so they run as threads of main instead of their own processes
+# Use PROCESS for workers which keep a core busy
+# Threads cannot be terminated if they hang on stop, and while they run under fork,
+# crashed worker processes are not restarted, see START_METHOD
+HEARTBEAT_WORKER_BACKEND = worker_backends.WorkerBackend.THREAD
+# Messages through the manager queues are packed instead of pickled
+MESSAGE_CODEC = message_codec.MessageCodec(
+    [
+        telemetry.TELEMETRY_DATA_LAYOUT,
+        command.POSITION_LAYOUT,
+        heartbeat_receiver.HEARTBEAT_STATUS_LAYOUT,
+    ]
+)
 
 # =================================================================================================
 #                            ↑ BOOTCAMPERS MODIFY ABOVE THIS COMMENT ↑
 # =================================================================================================
 
 
+def log_queue_statistics(
+    queues: "dict[str, queue_proxy_wrapper.QueueProxyWrapper]", local_logger: logger.Logger
+) -> None:
+    """
+    Logs the depths, drops and timings of each queue, for sizing the queues.
+
+    queues: Queues by name.
+    local_logger: Existing logger from process.
+    """
+    for name, queue in queues.items():
+        local_logger.info(f"{name} queue: {queue.get_statistics()}")
+
+
 def main() -> int:
     """
     Main function.
     """
+    # Must be before anything which creates processes or locks
+    worker_manager.configure_start_method(START_METHOD, PRELOAD_MODULES)
+
     # Configuration settings
     result, config = read_yaml.open_config(logger.CONFIG_FILE_PATH)
     if not result:
@@ -69,157 +154,242 @@ def main() -> int:
     # Get Pylance to stop complaining
     assert main_logger is not None
 
-    # Create a connection to the drone. Assume that this is safe to pass around to all processes
-    # In reality, this will not work, but to simplify the bootamp, preetend it is allowed
-    # To test, you will run each of your workers individually to see if they work
-    # (test "drones" are provided for you test your workers)
-    # NOTE: If you want to have type annotations for the connection, it is of type mavutil.mavfile
-    connection = mavutil.mavlink_connection(CONNECTION_STRING)
-    connection.wait_heartbeat(timeout=30)  # Wait for the "drone" to connect
-
     # =============================================================================================
     #                          ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
     # =============================================================================================
     # Create a worker controller
     wc = worker_controller.WorkerController()
     # Create a multiprocess manager for synchronized queues
-    mp_manager = mp.Manager()
-
-    # Create queues
-    telemetry_queue = queue_proxy_wrapper.QueueProxyWrapper(mp_manager, TELEMETRY_QUEUE_SIZE)
-    heartbeat_queue = queue_proxy_wrapper.QueueProxyWrapper(mp_manager, HB_QUEUE_SIZE)
-    command_queue = queue_proxy_wrapper.QueueProxyWrapper(mp_manager, COMMAND_QUEUE_SIZE)
-
-    # Create worker properties for each worker type (what inputs it takes, how many workers)
-    # Heartbeat sender
-    flag, heartbeat_sender_worker_properties = worker_manager.WorkerProperties.create(
-        count=HEARTBEAT_SENDER_WORKER_COUNT,
-        target=heartbeat_sender_worker.heartbeat_sender_worker,  # function to run
-        work_arguments=(connection,),
-        input_queues=[],
-        output_queues=[],
-        controller=wc,
-        local_logger=main_logger,
-    )
-    if not flag:
-        main_logger.error("Failed to create heartbeat sender worker properties")
+    # The queues it creates can move batches of items in one round trip
+    # Manager lives until main returns
+    mp_manager = managed_queues.QueueSyncManager()
+    # pylint: disable-next=consider-using-with
+    mp_manager.start()
+
+    # Declare the pipeline: stages (worker types, how many workers) and the queues between them
+    # The pipeline creates the queues and workers, and stops them in the right order
+    result, pipeline = worker_pipeline.Pipeline.create(mp_manager, wc, main_logger)
+    if not result:
+        main_logger.error("Failed to create pipeline")
         return -1
 
-    # Heartbeat receiver
-    flag, heartbeat_receiver_worker_properties = worker_manager.WorkerProperties.create(
-        count=HEARTBEAT_RECEIVER_WORKER_COUNT,
-        target=heartbeat_receiver_worker.heartbeat_receiver_worker,  # function to run
-        work_arguments=(connection,),
-        input_queues=[],
-        output_queues=[heartbeat_queue],
-        controller=wc,
-        local_logger=main_logger,
+    # Get Pylance to stop complaining
+    assert pipeline is not None
+
+    # Only the MAVLink link writes to the connection, the other workers queue their messages
+    # Heartbeats are sent ahead of commands, and a full queue never blocks a sender
+    outbound_queue = queue_proxy_wrapper.QueueProxyWrapper(
+        mp_manager,
+        OUTBOUND_QUEUE_SIZE,
+        mode=queue_proxy_wrapper.QueueMode.PRIORITY,
+        policy=queue_proxy_wrapper.BackpressurePolicy.DROP_OLDEST,
+        instrumented=True,
     )
-    if not flag:
-        main_logger.error("Failed to create heartbeat receiver worker properties")
-        return -1
 
-    # Telemetry
-    flag, telemetry_worker_properties = worker_manager.WorkerProperties.create(
-        count=TELEMETRY_WORKER_COUNT,
-        target=telemetry_worker.telemetry_worker,  # function to run
-        work_arguments=(connection,),
-        input_queues=[],
-        output_queues=[telemetry_queue],
-        controller=wc,
-        local_logger=main_logger,
+    # Worker arguments are the work arguments, then the input queues and the output queues
+    # in order of declaration, then the controller
+    pipeline.add_stage(
+        "Heartbeat sender",
+        heartbeat_sender_worker.heartbeat_sender_worker,  # function to run
+        (outbound_queue,),
+        HEARTBEAT_SENDER_WORKER_COUNT,
+        scheduling=HEARTBEAT_SENDER_SCHEDULING,
+        backend=HEARTBEAT_WORKER_BACKEND,
     )
-    if not flag:
-        main_logger.error("Failed to create telemetry worker properties")
-        return -1
-
-    # Command
-    flag, command_worker_properties = worker_manager.WorkerProperties.create(
-        count=COMMAND_WORKER_COUNT,
-        target=command_worker.command_worker,  # function to run
-        work_arguments=(TARGET, connection),
-        input_queues=[
-            telemetry_queue,
-        ],
-        output_queues=[command_queue],
-        controller=wc,
-        local_logger=main_logger,
+    # Owns the connection to the drone, and reconnects it when the link drops
+    connection_string = CONNECTION_STRING
+    replay_speed = None
+    if REPLAY_PATH is not None:
+        connection_string = REPLAY_PATH
+        replay_speed = REPLAY_SPEED
+
+    pipeline.add_stage(
+        "MAVLink link",
+        mavlink_link_worker.mavlink_link_worker,
+        (
+            connection_string,
+            [HEARTBEAT_MESSAGE_TYPES, TELEMETRY_MESSAGE_TYPES],
+            outbound_queue,
+            CAPTURE_PATH,
+            replay_speed,
+        ),
+        1,
+        scheduling=MAVLINK_LINK_SCHEDULING,
     )
-    if not flag:
-        main_logger.error("Failed to create command worker properties")
-        return -1
-
-    # Create the workers (processes) and obtain their managers
-    # hb sender
-    result, heartbeat_sender_manager = worker_manager.WorkerManager.create(
-        heartbeat_sender_worker_properties, main_logger
+    pipeline.add_stage(
+        "Heartbeat receiver",
+        heartbeat_receiver_worker.heartbeat_receiver_worker,
+        (HEARTBEAT_RECEIVER_PERIOD,),
+        HEARTBEAT_RECEIVER_WORKER_COUNT,
+        max_count=HEARTBEAT_RECEIVER_WORKER_MAX_COUNT,
+        backend=HEARTBEAT_WORKER_BACKEND,
     )
-    if not result:
-        main_logger.error("Failed to create heartbeat sender manager")
-
-    # Start worker processes
-
-    # hb receiver
-    result, heartbeat_receiver_manager = worker_manager.WorkerManager.create(
-        heartbeat_receiver_worker_properties, main_logger
+    pipeline.add_stage(
+        "Telemetry",
+        telemetry_worker.telemetry_worker,
+        (),
+        TELEMETRY_WORKER_COUNT,
+        scheduling=TELEMETRY_SCHEDULING,
+    )
+    pipeline.add_stage(
+        "Command",
+        command_worker.command_worker,
+        (outbound_queue, TARGET),
+        COMMAND_WORKER_COUNT,
     )
-    if not result:
-        main_logger.error("Failed to create heartbeat receiver manager")
 
-    # telemetry
-    result, telemetry_manager = worker_manager.WorkerManager.create(
-        telemetry_worker_properties, main_logger
+    # Messages routed by the link, in the order of its subscriptions
+    # The link never waits on a slow subscriber
+    pipeline.add_queue(
+        "Heartbeat messages",
+        HEARTBEAT_MESSAGE_QUEUE_SIZE,
+        producer="MAVLink link",
+        consumer="Heartbeat receiver",
+        policy=queue_proxy_wrapper.BackpressurePolicy.DROP_OLDEST,
+    )
+    # Only the newest message of each type is kept
+    # The link and telemetry are fused into 1 process, each keeping its own scheduling,
+    # so telemetry messages skip the manager
+    pipeline.add_queue(
+        "Telemetry messages",
+        producer="MAVLink link",
+        consumer="Telemetry",
+        fuse=True,
+        mode=queue_proxy_wrapper.QueueMode.CONFLATING,
+        key_function=mavlink_reader.get_message_type,
     )
-    if not result:
-        main_logger.error("Failed to create telemetry manager")
 
-    # command
-    # hb sender
-    result, command_manager = worker_manager.WorkerManager.create(
-        command_worker_properties, main_logger
+    # Queues which output to main share a doorbell, so main can wait on all of them at once
+    main_doorbell = queue_doorbell.QueueDoorbell()
+    # Telemetry is a fixed layout record, so it is handed off through shared memory
+    # Only the newest telemetry is kept so commands are always made on the freshest state
+    pipeline.add_queue(
+        "Telemetry",
+        TELEMETRY_QUEUE_SIZE,
+        producer="Telemetry",
+        consumer="Command",
+        layout=telemetry.TELEMETRY_DATA_LAYOUT,
+        mode=queue_proxy_wrapper.QueueMode.CONFLATING,
+        instrumented=True,
     )
-    if not result:
-        main_logger.error("Failed to create command worker manager")
+    # Producers must not stall when main falls behind
+    # Old statuses are worthless once a newer one arrives
+    # A disconnect is delivered ahead of routine statuses, and is never evicted by one
+    pipeline.add_queue(
+        "Heartbeat",
+        HB_QUEUE_SIZE,
+        producer="Heartbeat receiver",
+        mode=queue_proxy_wrapper.QueueMode.PRIORITY,
+        policy=queue_proxy_wrapper.BackpressurePolicy.DROP_OLDEST,
+        instrumented=True,
+        codec=MESSAGE_CODEC,
+        doorbell=main_doorbell,
+    )
+    pipeline.add_queue(
+        "Command",
+        COMMAND_QUEUE_SIZE,
+        producer="Command",
+        policy=queue_proxy_wrapper.BackpressurePolicy.BLOCK_WITH_TIMEOUT,
+        policy_timeout=COMMAND_QUEUE_PUT_TIMEOUT,
+        instrumented=True,
+        codec=MESSAGE_CODEC,
+        doorbell=main_doorbell,
+    )
+
+    # Create the queues and the workers (processes)
+    if not pipeline.build():
+        main_logger.error("Failed to build pipeline")
+        return -1
+
+    queues = pipeline.get_queues()
+    queues["Outbound"] = outbound_queue
+    heartbeat_queue = queues["Heartbeat"]
+    command_queue = queues["Command"]
+    worker_managers = pipeline.get_worker_managers()
 
     # Start worker processes
-    heartbeat_sender_manager.start_workers()
-    heartbeat_receiver_manager.start_workers()
-    telemetry_manager.start_workers()
-    command_manager.start_workers()
+    start_time = time.monotonic()
+    is_started = pipeline.start(START_TIMEOUT)
+    if not is_started:
+        main_logger.error("Workers did not start in time")
+
+    main_logger.info(f"Started workers in {(time.monotonic() - start_time) * 1000:.1f}ms")
+    for manager in worker_managers:
+        main_logger.info(f"{manager.get_target_name()} spawn times: {manager.get_spawn_times()}")
+        manager.check_scheduling()
+
+    # Restart any worker which crashes, so one crash does not silently stall the pipeline
+    result, supervisor = worker_manager.WorkerSupervisor.create(worker_managers, wc, main_logger)
+    if not result:
+        main_logger.error("Failed to create worker supervisor")
+        return -1
+
+    # Get Pylance to stop complaining
+    assert supervisor is not None
 
     main_logger.info("Started")
 
     # Main's work: read from all queues that output to main, and log any commands that we make
     # Continue running for 100 seconds or until the drone disconnects
     starting_time = time.time()
+    statistics_time = starting_time
     while time.time() - starting_time < RUN_TIME:
-        command_data = command_queue.queue.get(block=True, timeout=3)
-        if command_data is not None:
-            main_logger.info(f"received command:{command_data}")
-
-        hb_data = heartbeat_queue.queue.get(block=True, timeout=5)
-        if hb_data is not None:
-            if hb_data == "Disconnected":
+        if time.time() - statistics_time >= STATISTICS_LOG_PERIOD:
+            log_queue_statistics(queues, main_logger)
+            statistics_time = time.time()
+
+            for manager in worker_managers:
+                manager.log_resource_summary()
+
+        # Crashes are seen between reading the queues, so up to MAIN_WAIT_TIME late
+        # Worker processes are not restarted under fork while the heartbeat threads run,
+        # see START_METHOD
+        supervisor.supervise()
+
+        # Wake up as soon as any output arrives, statuses first when both are ready
+        ready_queue = queue_selector.wait_any([heartbeat_queue, command_queue], MAIN_WAIT_TIME)
+
+        if ready_queue is heartbeat_queue:
+            # Most urgent first, so a disconnect is seen no matter how many statuses are queued
+            # Also reported if the drone never sends a heartbeat
+            statuses = heartbeat_queue.get_many(HB_QUEUE_SIZE, timeout=0.0)
+            if any(status is not None and status.state == "Disconnected" for status in statuses):
                 break
-            main_logger.info(f"received status:{hb_data}")
 
-    # Stop the processes
-    wc.request_exit()
-    main_logger.info("Requested exit")
+            for status in statuses:
+                if status is not None:
+                    main_logger.info(f"received status:{status}")
 
-    # Fill and drain queues from END TO START
-    command_queue.fill_and_drain_queue()
-    heartbeat_queue.fill_and_drain_queue()
-    telemetry_queue.fill_and_drain_queue()
-    main_logger.info("Queues cleared")
+        if ready_queue is command_queue:
+            for command_data in command_queue.get_many(COMMAND_QUEUE_SIZE, timeout=0.0):
+                if command_data is not None:
+                    main_logger.info(f"received command:{command_data}")
 
-    # Clean up worker processes
-    heartbeat_sender_manager.join_workers()
-    heartbeat_receiver_manager.join_workers()
-    telemetry_manager.join_workers()
-    command_manager.join_workers()
+    # Stop the processes
+    # Fill and drain queues from END TO START until the workers have exited
+    stop_start_time = time.monotonic()
+    main_logger.info("Requested exit")
+    # The outbound queue has several producers, so it is created outside the pipeline
+    # Drained last since the link, the first stage, consumes it
+    is_stopped, stop_times = pipeline.stop(STOP_TIMEOUT, [outbound_queue])
+    if not is_stopped:
+        main_logger.error("Workers did not exit, see the stop times")
+
+    for stop_time in stop_times:
+        if stop_time.phase == worker_manager.StopPhase.EXIT_REQUEST:
+            main_logger.info(str(stop_time))
+        else:
+            main_logger.warning(str(stop_time))
+
+    main_logger.info(f"Stopped in {(time.monotonic() - stop_start_time) * 1000:.1f}ms")
+
+    main_logger.info(
+        f"Telemetry samples overwritten before use: {queues['Telemetry'].get_overwritten_count()}"
+    )
+    log_queue_statistics(queues, main_logger)
 
-    main_logger.info("Stopped")
+    # Free shared memory
+    pipeline.close()
 
     # We can reset controller in case we want to reuse it
     # Alternatively, create a new WorkerController instance
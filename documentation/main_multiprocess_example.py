@@ -5,7 +5,6 @@ python -m documentation.main_multiprocess_example
 ```
 """
 
-import multiprocessing as mp
 import time
 
 from documentation.multiprocess_example.add_random import add_random_worker
@@ -14,26 +13,71 @@ from documentation.multiprocess_example.countup import countup_worker
 from modules.common.modules.logger import logger
 from modules.common.modules.logger import logger_main_setup
 from modules.common.modules.read_yaml import read_yaml
-from utilities.workers import queue_proxy_wrapper
+from utilities.workers import managed_queues
 from utilities.workers import worker_controller
 from utilities.workers import worker_manager
+from utilities.workers import worker_pipeline
 
 
 # Play with these numbers to see queue bottlenecks
 COUNTUP_TO_ADD_RANDOM_QUEUE_MAX_SIZE = 5
 ADD_RANDOM_TO_CONCATENATOR_QUEUE_MAX_SIZE = 5
 
+# Play with these numbers to see the effect of batching
+# Number of items moved per queue round trip
+COUNTUP_TO_ADD_RANDOM_QUEUE_BATCH_SIZE = 1
+ADD_RANDOM_TO_CONCATENATOR_QUEUE_BATCH_SIZE = 1
+
 # Play with these numbers to see process bottlenecks
 COUNTUP_WORKER_COUNT = 2
 ADD_RANDOM_WORKER_COUNT = 2
 CONCATENATOR_WORKER_COUNT = 2
 
+# Play with these numbers to see autoscaling
+# Workers are added while their input queue backs up and removed while they wait for input
+ADD_RANDOM_WORKER_MAX_COUNT = 4
+ADD_RANDOM_WORKER_MIN_COUNT = 1
+CONCATENATOR_WORKER_MIN_COUNT = 1
+AUTOSCALE_PERIOD = 0.5  # seconds
+
+# Play with this and set all worker counts and max counts to 1 to see stage fusion
+# Adjacent single worker stages run as threads of 1 process, without a manager queue between them
+FUSE_STAGES = True
+
+# Longest time waiting for the workers to exit, before they are terminated and then killed
+STOP_TIMEOUT = 5  # seconds
+
+# Play with this to see the effect on worker spawn time: "fork", "spawn", or "forkserver"
+# The forkserver imports the worker modules once instead of in every worker
+START_METHOD = "forkserver"
+PRELOAD_MODULES = [
+    "documentation.multiprocess_example.add_random.add_random_worker",
+    "documentation.multiprocess_example.concatenator.concatenator_worker",
+    "documentation.multiprocess_example.countup.countup_worker",
+]
+
+
+def run_and_autoscale(
+    duration: float, worker_managers: "list[worker_manager.WorkerManager]"
+) -> None:
+    """
+    Waits for the duration, scaling the workers with their load.
+    """
+    end_time = time.monotonic() + duration
+    while time.monotonic() < end_time:
+        time.sleep(AUTOSCALE_PERIOD)
+        for manager in worker_managers:
+            manager.autoscale()
+
 
 # main() is required for early return
 def main() -> int:
     """
     Main function.
     """
+    # Must be before anything which creates processes or locks
+    worker_manager.configure_start_method(START_METHOD, PRELOAD_MODULES)
+
     # Configuration settings
     result, config = read_yaml.open_config(logger.CONFIG_FILE_PATH)
     if not result:
@@ -60,156 +104,124 @@ def main() -> int:
     # caused by its implementation (background thread work)
     # so a queue from a SyncManager is used instead
     # See 2nd note: https://docs.python.org/3/library/multiprocessing.html#pipes-and-queues
-    mp_manager = mp.Manager()
+    # QueueSyncManager is a SyncManager whose queues can also move batches in one round trip
+    # Manager lives until main returns
+    mp_manager = managed_queues.QueueSyncManager()
+    # pylint: disable-next=consider-using-with
+    mp_manager.start()
+
+    # The pipeline declares the stages (what each worker runs and how many workers)
+    # and the queues between them, then creates the queues and workers
+    # It starts producers first, and on stop drains the queues from END TO START
+    result, pipeline = worker_pipeline.Pipeline.create(mp_manager, controller, main_logger)
+    if not result:
+        print("Failed to create pipeline")
+        return -1
 
-    # Queue maxsize should always be >= the larger of producers/consumers count
-    # Example: Producers 3, consumers 2, so queue maxsize minimum is 3
-    countup_to_add_random_queue = queue_proxy_wrapper.QueueProxyWrapper(
-        mp_manager,
-        COUNTUP_TO_ADD_RANDOM_QUEUE_MAX_SIZE,
-    )
-    add_random_to_concatenator_queue = queue_proxy_wrapper.QueueProxyWrapper(
-        mp_manager,
-        ADD_RANDOM_TO_CONCATENATOR_QUEUE_MAX_SIZE,
-    )
+    # Get Pylance to stop complaining
+    assert pipeline is not None
 
-    # Worker properties
-    result, countup_worker_properties = worker_manager.WorkerProperties.create(
-        count=COUNTUP_WORKER_COUNT,  # How many workers
-        target=countup_worker.countup_worker,  # What's the function that this worker runs
-        work_arguments=(  # The function's arguments excluding input/output queues and controller
+    # Data path: countup_worker to add_random_worker to concatenator_workers
+    pipeline.add_stage(
+        "Countup",
+        countup_worker.countup_worker,  # What's the function that this worker runs
+        (  # The function's arguments excluding input/output queues and controller
             3,
             100,
         ),
-        input_queues=[],  # Note that input/output queues must be in the proper order
-        output_queues=[countup_to_add_random_queue],
-        controller=controller,  # Worker controller
-        local_logger=main_logger,  # Main logger to log any failures during worker creation
+        COUNTUP_WORKER_COUNT,  # How many workers
     )
-    if not result:
-        print("Failed to create arguments for Countup")
-        return -1
-
-    # Get Pylance to stop complaining
-    assert countup_worker_properties is not None
-
-    result, add_random_worker_properties = worker_manager.WorkerProperties.create(
-        count=ADD_RANDOM_WORKER_COUNT,
-        target=add_random_worker.add_random_worker,
-        work_arguments=(
+    pipeline.add_stage(
+        "Add Random",
+        add_random_worker.add_random_worker,
+        (
             252,
             10,
             5,
         ),
-        input_queues=[countup_to_add_random_queue],
-        output_queues=[add_random_to_concatenator_queue],
-        controller=controller,
-        local_logger=main_logger,
+        ADD_RANDOM_WORKER_COUNT,
+        min_count=ADD_RANDOM_WORKER_MIN_COUNT,
+        max_count=ADD_RANDOM_WORKER_MAX_COUNT,
     )
-    if not result:
-        print("Failed to create arguments for Add Random")
-        return -1
-
-    # Get Pylance to stop complaining
-    assert add_random_worker_properties is not None
-
-    result, concatenator_worker_properties = worker_manager.WorkerProperties.create(
-        count=CONCATENATOR_WORKER_COUNT,
-        target=concatenator_worker.concatenator_worker,
-        work_arguments=(
+    pipeline.add_stage(
+        "Concatenator",
+        concatenator_worker.concatenator_worker,
+        (
             "Hello ",
             " world!",
         ),
-        input_queues=[add_random_to_concatenator_queue],
-        output_queues=[],
-        controller=controller,
-        local_logger=main_logger,
+        CONCATENATOR_WORKER_COUNT,
+        min_count=CONCATENATOR_WORKER_MIN_COUNT,
     )
-    if not result:
-        print("Failed to create arguments for Concatenator")
-        return -1
 
-    # Get Pylance to stop complaining
-    assert concatenator_worker_properties is not None
-
-    # Prepare processes
-    # Data path: countup_worker to add_random_worker to concatenator_workers
-    worker_managers: list[worker_manager.WorkerManager] = []  # List of all worker managers
-
-    result, countup_manager = worker_manager.WorkerManager.create(
-        worker_properties=countup_worker_properties,
-        local_logger=main_logger,
+    # Queue maxsize should always be >= the larger of producers/consumers count
+    # Example: Producers 3, consumers 2, so queue maxsize minimum is 3
+    # Input/output queues are passed to the workers in the order they are declared
+    pipeline.add_queue(
+        "Countup to Add Random",
+        COUNTUP_TO_ADD_RANDOM_QUEUE_MAX_SIZE,
+        producer="Countup",
+        consumer="Add Random",
+        batch_size=COUNTUP_TO_ADD_RANDOM_QUEUE_BATCH_SIZE,
+        instrumented=True,  # Consumer wait times are used for autoscaling
     )
-    if not result:
-        print("Failed to create manager for Countup")
-        return -1
-
-    # Get Pylance to stop complaining
-    assert countup_manager is not None
-
-    worker_managers.append(countup_manager)
-
-    result, add_random_manager = worker_manager.WorkerManager.create(
-        worker_properties=add_random_worker_properties,
-        local_logger=main_logger,
+    pipeline.add_queue(
+        "Add Random to Concatenator",
+        ADD_RANDOM_TO_CONCATENATOR_QUEUE_MAX_SIZE,
+        producer="Add Random",
+        consumer="Concatenator",
+        batch_size=ADD_RANDOM_TO_CONCATENATOR_QUEUE_BATCH_SIZE,
+        instrumented=True,
     )
-    if not result:
-        print("Failed to create manager for Add Random")
-        return -1
-
-    # Get Pylance to stop complaining
-    assert add_random_manager is not None
 
-    worker_managers.append(add_random_manager)
-
-    result, concatenator_manager = worker_manager.WorkerManager.create(
-        worker_properties=concatenator_worker_properties,
-        local_logger=main_logger,
-    )
-    if not result:
-        print("Failed to create manager for Concatenator")
+    # Prepare processes
+    # Logs the reason for any failure
+    if not pipeline.build(FUSE_STAGES):
+        print("Failed to build pipeline")
         return -1
 
-    # Get Pylance to stop complaining
-    assert concatenator_manager is not None
-
-    worker_managers.append(concatenator_manager)
+    worker_managers = pipeline.get_worker_managers()
 
     # Start worker processes
-    for manager in worker_managers:
-        manager.start_workers()
+    # Waits until every worker is running
+    pipeline.start()
 
     main_logger.info("Started", True)
 
+    for manager in worker_managers:
+        main_logger.info(f"{manager.get_target_name()} spawn times: {manager.get_spawn_times()}")
+
     # Run for some time and then pause
-    time.sleep(2)
+    run_and_autoscale(2, worker_managers)
     controller.request_pause()
 
     main_logger.info("Paused", True)
 
+    # No autoscaling while paused, the queues back up without the workers being busy
+    # Resize by hand instead, the other stages keep running
+    # Removed workers finish their current item and exit
+    add_random_manager = pipeline.get_worker_manager("Add Random")
+    if add_random_manager is not None:
+        add_random_manager.scale_to(ADD_RANDOM_WORKER_MIN_COUNT)
+
     time.sleep(4)
     controller.request_resume()
     main_logger.info("Resumed", True)
 
-    time.sleep(2)
+    run_and_autoscale(2, worker_managers)
 
     # Stop the processes
-    controller.request_exit()
-
     main_logger.info("Requested exit", True)
 
-    # Fill and drain queues from END TO START
-    countup_to_add_random_queue.fill_and_drain_queue()
-    add_random_to_concatenator_queue.fill_and_drain_queue()
-
-    main_logger.info("Queues cleared", True)
-
-    # Clean up worker processes
-    for manager in worker_managers:
-        manager.join_workers()
+    # Fill and drain queues from END TO START until the workers have exited
+    # Workers still running after the timeout are terminated and then killed
+    _, stop_times = pipeline.stop(STOP_TIMEOUT)
 
     main_logger.info("Stopped", True)
 
+    for stop_time in stop_times:
+        main_logger.info(str(stop_time), True)
+
     # We can reset controller in case we want to reuse it
     # Alternatively, create a new WorkerController instance
     controller.clear_exit()
@@ -49,25 +49,34 @@ def add_random_worker(
         # Method blocks worker if pause has been requested
         controller.check_pause()
 
-        # Get an item from the queue
+        # Get a batch of items from the queue
         # If the queue is empty, the worker process will block
         # until the queue is non-empty
-        term = input_queue.queue.get()
+        terms = input_queue.get_many()
 
-        # Exit on sentinel
-        if term is None:
-            break
+        values = []
+        is_sentinel_received = False
+        for term in terms:
+            # Exit on sentinel
+            if term is None:
+                is_sentinel_received = True
+                break
+
+            # All of the work should be done within the class
+            # Getting the output is as easy as calling a single method
+            # The class is reponsible for packing the intermediate type
+            result, value = add_random_instance.run_add_random(term)
 
-        # All of the work should be done within the class
-        # Getting the output is as easy as calling a single method
-        # The class is reponsible for packing the intermediate type
-        result, value = add_random_instance.run_add_random(term)
+            # Check result
+            if not result:
+                continue
 
-        # Check result
-        if not result:
-            continue
+            values.append(value)
 
-        # Put an item into the queue
+        # Put the batch into the queue
         # If the queue is full, the worker process will block
-        # until the queue is non-empty
-        output_queue.queue.put(value)
+        # until the queue is non-full
+        output_queue.put_many(values)
+
+        if is_sentinel_received:
+            break
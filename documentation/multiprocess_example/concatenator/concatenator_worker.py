@@ -45,23 +45,29 @@ def concatenator_worker(
         # Method blocks worker if pause has been requested
         controller.check_pause()
 
-        # Get an item from the queue
+        # Get a batch of items from the queue
         # If the queue is empty, the worker process will block
         # until the queue is non-empty
-        input_data = input_queue.queue.get()
+        batch = input_queue.get_many()
 
-        # Exit on sentinel
-        if input_data is None:
-            break
+        is_sentinel_received = False
+        for input_data in batch:
+            # Exit on sentinel
+            if input_data is None:
+                is_sentinel_received = True
+                break
+
+            # All of the work should be done within the class
+            # Getting the output is as easy as calling a single method
+            # The class is reponsible for unpacking the intermediate type
+            result, value = concatenator_instance.run_concatenation(input_data)
 
-        # All of the work should be done within the class
-        # Getting the output is as easy as calling a single method
-        # The class is reponsible for unpacking the intermediate type
-        result, value = concatenator_instance.run_concatenation(input_data)
+            # Check result
+            if not result:
+                continue
 
-        # Check result
-        if not result:
-            continue
+            # Print just the string
+            local_logger.info(str(value), None)
 
-        # Print just the string
-        local_logger.info(str(value), None)
+        if is_sentinel_received:
+            break
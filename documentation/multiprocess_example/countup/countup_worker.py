@@ -11,6 +11,12 @@ from utilities.workers import worker_controller
 from . import countup
 
 
+# Longest time an output waits for its batch to fill
+BATCH_MAX_WAIT = 1  # seconds
+# Longest time waiting for space to send the last batch when exiting
+FLUSH_TIMEOUT = 1  # seconds
+
+
 def countup_worker(
     start_thousands: int,
     max_iterations: int,
@@ -42,6 +48,10 @@ def countup_worker(
     # Instantiate class object
     countup_instance = countup.Countup(start_thousands, max_iterations, local_logger)
 
+    # Outputs are sent in batches of the output queue's batch size,
+    # or sooner once the first output has waited the max wait
+    batch = queue_proxy_wrapper.OutputBatch(output_queue, BATCH_MAX_WAIT)
+
     # Loop forever until exit has been requested (producer)
     while not controller.is_exit_requested():
         # Method blocks worker if pause has been requested
@@ -53,9 +63,14 @@ def countup_worker(
 
         # Check result
         if not result:
+            batch.put_if_due()
             continue
 
-        # Put an item into the queue
+        # Put the batch into the queue once it is full or due
         # If the queue is full, the worker process will block
-        # until the queue is non-empty
-        output_queue.queue.put(value)
+        # until the queue is non-full
+        batch.add(value)
+
+    # Outputs of a partial batch are still sent
+    # The consumers may have stopped, so do not block forever
+    batch.flush(FLUSH_TIMEOUT)
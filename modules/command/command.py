@@ -6,6 +6,7 @@ import math
 
 from pymavlink import mavutil
 
+from utilities.workers import record_layout
 from ..common.modules.logger import logger
 from ..telemetry import telemetry
 
@@ -21,6 +22,17 @@ class Position:
         self.z = z
 
 
+# Fixed layout for passing Position through a message codec
+POSITION_LAYOUT = record_layout.RecordLayout(
+    Position,
+    [
+        ("x", "d"),
+        ("y", "d"),
+        ("z", "d"),
+    ],
+)
+
+
 # =================================================================================================
 #                            ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
 # =================================================================================================
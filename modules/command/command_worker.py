@@ -11,13 +11,14 @@ from utilities.workers import queue_proxy_wrapper
 from utilities.workers import worker_controller
 from . import command
 from ..common.modules.logger import logger
+from ..mavlink_io import mavlink_writer
 
 
 # =================================================================================================
 #                            ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
 # =================================================================================================
 def command_worker(
-    connection: mavutil.mavfile,
+    connection: mavutil.mavfile | queue_proxy_wrapper.QueueProxyWrapper,
     target: command.Position,
     input_queue: queue_proxy_wrapper.QueueProxyWrapper,
     output_queue: queue_proxy_wrapper.QueueProxyWrapper,
@@ -27,6 +28,7 @@ def command_worker(
 ) -> None:
     """
     Worker process.
+    connection: connection instance, or the input queue of the MAVLink writer
     target:target position
     input:recieve telemetry data
     output:output to other processes
@@ -53,6 +55,10 @@ def command_worker(
     # =============================================================================================
     #                          ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
     # =============================================================================================
+    # Sent through the writer the same way as through the connection
+    if isinstance(connection, queue_proxy_wrapper.QueueProxyWrapper):
+        connection = mavlink_writer.MessagePublisher(connection)
+
     # Instantiate class object (command.Command)
     flag, command_instance = command.Command.create(connection, target, local_logger)
 
@@ -61,15 +67,17 @@ def command_worker(
 
     while not controller.is_exit_requested():
         controller.check_pause()
-        if input_queue.queue.empty():
-            continue  # nothing to input
+        # Block for a batch of telemetry instead of spinning on an empty queue
+        messages = input_queue.get_many(timeout=1.0)
 
-        msg = input_queue.queue.get(timeout=1.0)
-        if msg is None:
-            continue
-        result = command_instance.run(msg)
-        if result != "":
-            output_queue.queue.put(result)
+        results = []
+        for msg in messages:
+            if msg is None:
+                continue
+            result = command_instance.run(msg)
+            if result != "":
+                results.append(result)
+        output_queue.put_many(results)
 
 
 # =================================================================================================
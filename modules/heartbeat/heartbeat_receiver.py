@@ -2,14 +2,40 @@
 Heartbeat receiving logic.
 """
 
+import time
+
 from pymavlink import mavutil
 
+from utilities.workers import record_layout
 from ..common.modules.logger import logger
 
 
 # =================================================================================================
 #                            ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
 # =================================================================================================
+class HeartbeatStatus:
+    """
+    Connection state at a point in time.
+    """
+
+    def __init__(self, state: str, timestamp: float) -> None:
+        self.state = state
+        self.timestamp = timestamp  # s, time.time()
+
+    def __str__(self) -> str:
+        return f"{self.state} at {time.strftime('%H:%M:%S', time.localtime(self.timestamp))}"
+
+
+# Fixed layout for passing HeartbeatStatus through a message codec
+HEARTBEAT_STATUS_LAYOUT = record_layout.RecordLayout(
+    HeartbeatStatus,
+    [
+        ("state", "12s"),
+        ("timestamp", "d"),
+    ],
+)
+
+
 class HeartbeatReceiver:
     """
     HeartbeatReceiver class to send a heartbeat
@@ -44,7 +70,8 @@ class HeartbeatReceiver:
         self._log = local_logger
         self._log.info("heartbeat reciever initialized")
         self._missed = 0
-        self.state = "Disconnected"
+        # Until the first heartbeat, so a slow start is not reported as a disconnect
+        self.state = "Unknown"
 
     def run(
         self,
@@ -54,6 +81,8 @@ class HeartbeatReceiver:
         Attempt to recieve a heartbeat message.
         If disconnected for over a threshold number of periods,
         the connection is considered disconnected.
+        The state is Unknown until the first heartbeat, and Disconnected if none arrives
+        within the same threshold.
         """
         message = self.connection.recv_match(type="HEARTBEAT")
         if message:
@@ -12,6 +12,7 @@ from utilities.workers import queue_proxy_wrapper
 from utilities.workers import worker_controller
 from . import heartbeat_receiver
 from ..common.modules.logger import logger
+from ..mavlink_io import mavlink_reader
 
 
 # =================================================================================================
@@ -19,13 +20,14 @@ from ..common.modules.logger import logger
 # =================================================================================================
 def heartbeat_receiver_worker(
     heartbeat_time: float,
-    connection: mavutil.mavfile,
+    connection: mavutil.mavfile | queue_proxy_wrapper.QueueProxyWrapper,
     output_queue: queue_proxy_wrapper.QueueProxyWrapper,
     controller: worker_controller.WorkerController,
 ) -> None:
     """
 
-    connection: connection instance
+    heartbeat_time: period of checking for a heartbeat in seconds
+    connection: connection instance, or the input queue of messages routed by the MAVLink reader
     output_queue: output to the main process
     controller: how the main process communicates to this worker
     """
@@ -49,18 +51,28 @@ def heartbeat_receiver_worker(
     # =============================================================================================
     #                          ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
     # =============================================================================================
+    # Routed messages are read the same way as from the connection
+    if isinstance(connection, queue_proxy_wrapper.QueueProxyWrapper):
+        connection = mavlink_reader.MessageSubscription(connection)
+
     # Instantiate class object (heartbeat_receiver.HeartbeatReceiver)
     flag, reciever = heartbeat_receiver.HeartbeatReceiver.create(connection, local_logger)
     if not flag:
         local_logger.error("failed to create reciever instance")
         return
-    local_logger.info("reciever worker started" + flag)
+    local_logger.info("reciever worker started", True)
 
     while not controller.is_exit_requested():
+        controller.check_pause()
         status = reciever.run()
         # Always put the status in the queue so the main process knows the current state
-        output_queue.queue.put(f"{status} at {time.strftime('%H:%M:%S')}")
-        time.sleep(heartbeat_time)
+        # A lost link is delivered ahead of any routine statuses still queued
+        priority = queue_proxy_wrapper.PRIORITY_ROUTINE
+        if status == "Disconnected":
+            priority = queue_proxy_wrapper.PRIORITY_CRITICAL
+        output_queue.put(heartbeat_receiver.HeartbeatStatus(status, time.time()), priority=priority)
+        # Returns early on exit or pause
+        controller.wait(heartbeat_time)
     local_logger.info("reciever worker stopped")
 
     # Main loop: do work.
@@ -4,20 +4,21 @@ Heartbeat worker that sends heartbeats periodically.
 
 import os
 import pathlib
-import time
 
 from pymavlink import mavutil
 
+from utilities.workers import queue_proxy_wrapper
 from utilities.workers import worker_controller
 from . import heartbeat_sender
 from ..common.modules.logger import logger
+from ..mavlink_io import mavlink_writer
 
 
 # =================================================================================================
 #                            ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
 # =================================================================================================
 def heartbeat_sender_worker(
-    connection: mavutil.mavfile,
+    connection: mavutil.mavfile | queue_proxy_wrapper.QueueProxyWrapper,
     controller: worker_controller.WorkerController,
     # Place your own arguments here
     # Add other necessary worker arguments here
@@ -25,7 +26,8 @@ def heartbeat_sender_worker(
     """
     Worker process.
 
-    args... describe what the arguments are
+    connection: connection instance, or the input queue of the MAVLink writer
+    controller: how the main process communicates to this worker
     """
     # =============================================================================================
     #                          ↑ BOOTCAMPERS MODIFY ABOVE THIS COMMENT ↑
@@ -47,6 +49,10 @@ def heartbeat_sender_worker(
     # =============================================================================================
     #                          ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
     # =============================================================================================
+    # Sent through the writer the same way as through the connection
+    if isinstance(connection, queue_proxy_wrapper.QueueProxyWrapper):
+        connection = mavlink_writer.MessagePublisher(connection)
+
     # Instantiate class object (heartbeat_sender.HeartbeatSender)
     flag, hb = heartbeat_sender.HeartbeatSender.create(
         connection=connection, local_logger=local_logger
@@ -58,11 +64,12 @@ def heartbeat_sender_worker(
     local_logger.info("heartbeat worker started")
     # Main loop: do work.
     while not controller.is_exit_requested():
-        time.sleep(1)
         controller.check_pause()
         success = hb.run()
         if not success:
             local_logger.error("Error in heartbeat sender worker:")
+        # Returns early on exit or pause
+        controller.wait(1)
 
     local_logger.info("heartbeat sender worker stopped")
 
@@ -0,0 +1,315 @@
+"""
+Indexed reading of MAVLink captures.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import typing
+
+from pymavlink import mavutil
+
+from . import frame_capture
+from . import frame_reader
+
+
+# Magic, version, capture size, capture modification time, frame count, message type count
+INDEX_HEADER = struct.Struct("=4sIQQQQ")
+INDEX_MAGIC = b"TLGI"
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index"
+# Every index entry is an unsigned 64 bit integer in native byte order, like the header
+INDEX_ENTRY_FORMAT = "Q"
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY_FORMAT)
+
+
+def build_index(data: "bytes | memoryview", size: int, modification_time: int) -> bytes:
+    """
+    Finds every frame of the capture and sorts them by type and by time.
+
+    data: Contents of the capture.
+    size: Size of the capture in bytes, to detect a changed capture.
+    modification_time: Modification time of the capture in nanoseconds, likewise.
+
+    Returns the index, which is the header, then the message IDs, the position of the first frame
+    of each message ID with a final end position, and then the timestamp, start and end
+    of each frame by message ID and then time, and the positions by time.
+    """
+    # Message ID, timestamp, start, end
+    frames = sorted(
+        (message_id, timestamp, start, end)
+        for timestamp, message_id, _, start, end in frame_reader.read_capture_records(data)
+    )
+
+    message_ids = []
+    firsts = []
+    for i, (message_id, _, _, _) in enumerate(frames):
+        if len(message_ids) == 0 or message_ids[-1] != message_id:
+            message_ids.append(message_id)
+            firsts.append(i)
+
+    firsts.append(len(frames))
+
+    # Ties are broken by position in the capture
+    time_order = sorted(range(len(frames)), key=lambda i: (frames[i][1], frames[i][2]))
+
+    entries = (
+        message_ids
+        + firsts
+        + [frame[1] for frame in frames]
+        + [frame[2] for frame in frames]
+        + [frame[3] for frame in frames]
+        + time_order
+    )
+    header = INDEX_HEADER.pack(
+        INDEX_MAGIC, INDEX_VERSION, size, modification_time, len(frames), len(message_ids)
+    )
+    return header + struct.pack(f"={len(entries)}{INDEX_ENTRY_FORMAT}", *entries)
+
+
+class CaptureReader:  # pylint: disable=too-many-instance-attributes
+    """
+    Reader of a capture from `frame_capture.FrameCapture`, which is memory mapped
+    instead of read. On first open the frames are indexed by message type and time,
+    and the index is saved next to the capture for the next open.
+
+    Frames are found by type and time range in O(log n), and by position in O(1).
+    Positions are by time within the message type, or across all types for None.
+    Frames are views of the mapped capture, and are only copied to decode them
+    into the messages of `mavutil.mavlink`, the same ones Telemetry receives.
+    """
+
+    __private_key = object()
+
+    @classmethod
+    def create(
+        cls, path: str, index_path: "str | None" = None
+    ) -> "tuple[True, CaptureReader] | tuple[False, None]":
+        """
+        path: Capture to read.
+        index_path: Saved index, default is the capture path with INDEX_SUFFIX.
+        The index is rebuilt if it is missing or out of date.
+        """
+        if index_path is None:
+            index_path = path + INDEX_SUFFIX
+
+        try:
+            with open(path, "rb") as file:
+                status = os.fstat(file.fileno())
+                if status.st_size == 0:
+                    return False, None
+
+                capture = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            return False, None
+
+        index = cls.__load_index(index_path, status.st_size, status.st_mtime_ns)
+        if index is None:
+            index_data = memoryview(capture)
+            index_bytes = build_index(index_data, status.st_size, status.st_mtime_ns)
+            index_data.release()
+
+            # Still usable without saving, e.g. a read only directory
+            try:
+                with open(index_path, "wb") as file:
+                    file.write(index_bytes)
+            except OSError:
+                pass
+
+            index = index_bytes
+
+        return True, CaptureReader(cls.__private_key, capture, index)
+
+    @staticmethod
+    def __load_index(index_path: str, size: int, modification_time: int) -> "mmap.mmap | None":
+        """
+        Maps the saved index, None if it is missing or not of this capture.
+        """
+        try:
+            with open(index_path, "rb") as file:
+                index_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(index_file) < INDEX_HEADER.size:
+            index_file.close()
+            return None
+
+        magic, version, index_size, index_modification_time, frame_count, type_count = (
+            INDEX_HEADER.unpack_from(index_file)
+        )
+        entry_count = 2 * type_count + 1 + 4 * frame_count
+        if (
+            magic != INDEX_MAGIC
+            or version != INDEX_VERSION
+            or index_size != size
+            or index_modification_time != modification_time
+            or len(index_file) != INDEX_HEADER.size + entry_count * INDEX_ENTRY_SIZE
+        ):
+            index_file.close()
+            return None
+
+        return index_file
+
+    def __init__(self, key: object, capture: mmap.mmap, index: "mmap.mmap | bytes") -> None:
+        assert key is CaptureReader.__private_key, "Use create() method"
+
+        self.__capture = capture
+        self.__data = memoryview(capture)
+        # Mapped if it was saved, otherwise just built
+        self.__index = index
+
+        _, _, _, _, frame_count, type_count = INDEX_HEADER.unpack_from(index)
+        entries = memoryview(index)[INDEX_HEADER.size :].cast(INDEX_ENTRY_FORMAT)
+        self.__entries = entries
+        sections = [type_count, type_count + 1, frame_count, frame_count, frame_count, frame_count]
+        offsets = [sum(sections[:i]) for i in range(len(sections) + 1)]
+        (
+            message_ids,
+            self.__firsts,
+            self.__timestamps,
+            self.__starts,
+            self.__ends,
+            self.__time_order,
+        ) = [entries[offsets[i] : offsets[i + 1]] for i in range(len(sections))]
+
+        # Message ID to index in the type table
+        self.__type_indices = {message_id: i for i, message_id in enumerate(message_ids)}
+        message_ids.release()
+        self.__decoder = mavutil.mavlink.MAVLink(None)
+
+    def get_message_types(self) -> "list[str]":
+        """
+        Returns the types of the messages in the capture, e.g. "ATTITUDE".
+        """
+        return [
+            mavutil.mavlink.mavlink_map[message_id].msgname
+            for message_id in self.__type_indices
+            if message_id in mavutil.mavlink.mavlink_map
+        ]
+
+    def get_count(self, message_type: "str | None" = None) -> int:
+        """
+        Returns the number of frames of the message type, of all types for None.
+        """
+        first, end = self.__get_bounds(message_type)
+        return end - first
+
+    def find(self, message_type: "str | None", start_time: float, end_time: float) -> range:
+        """
+        Finds the frames of the message type from the start time up to the end time.
+
+        message_type: Type of the message (e.g. "ATTITUDE"), None for all types.
+        start_time: Earliest monotonic time in seconds, included.
+        end_time: Latest monotonic time in seconds, excluded.
+
+        Returns the positions of the frames.
+        """
+        start_timestamp = round(start_time * frame_capture.MICROSECONDS_PER_SECOND)
+        end_timestamp = round(end_time * frame_capture.MICROSECONDS_PER_SECOND)
+
+        if message_type is None:
+            get_timestamp = self.__timestamps.__getitem__
+            start = bisect.bisect_left(self.__time_order, start_timestamp, key=get_timestamp)
+            end = bisect.bisect_left(self.__time_order, end_timestamp, start, key=get_timestamp)
+            return range(start, end)
+
+        first, last = self.__get_bounds(message_type)
+        start = bisect.bisect_left(self.__timestamps, start_timestamp, first, last)
+        end = bisect.bisect_left(self.__timestamps, end_timestamp, start, last)
+        return range(start - first, end - first)
+
+    def get_timestamp(self, position: int, message_type: "str | None" = None) -> float:
+        """
+        Returns the monotonic time of the frame in seconds.
+        """
+        return (
+            self.__timestamps[self.__get_entry(position, message_type)]
+            / frame_capture.MICROSECONDS_PER_SECOND
+        )
+
+    def get_frame(self, position: int, message_type: "str | None" = None) -> memoryview:
+        """
+        Returns the frame, which is a view of the capture. Release it before closing the reader.
+        """
+        entry = self.__get_entry(position, message_type)
+        return self.__data[self.__starts[entry] : self.__ends[entry]]
+
+    def get_message(self, position: int, message_type: "str | None" = None) -> "object | None":
+        """
+        Decodes the frame, with its time in `_timestamp` like the logs of mavutil.
+
+        Returns the message, None if the frame is corrupted.
+        """
+        entry = self.__get_entry(position, message_type)
+        try:
+            message = self.__decoder.decode(
+                bytearray(self.__data[self.__starts[entry] : self.__ends[entry]])
+            )
+        # Checksum or signature is wrong
+        except mavutil.mavlink.MAVError:
+            return None
+
+        # Same attribute as mavutil
+        # pylint: disable-next=protected-access
+        message._timestamp = self.__timestamps[entry] / frame_capture.MICROSECONDS_PER_SECOND
+        return message
+
+    def get_messages(
+        self, message_type: "str | None", start_time: float, end_time: float
+    ) -> "typing.Iterator[object]":
+        """
+        Decodes the frames of the message type in the time range, see `find()`,
+        skipping corrupted frames.
+        """
+        for position in self.find(message_type, start_time, end_time):
+            message = self.get_message(position, message_type)
+            if message is not None:
+                yield message
+
+    def close(self) -> None:
+        """
+        Unmaps the capture and the index. Views from `get_frame()` must be released first.
+        """
+        for view in (
+            self.__firsts,
+            self.__timestamps,
+            self.__starts,
+            self.__ends,
+            self.__time_order,
+            self.__entries,
+            self.__data,
+        ):
+            view.release()
+
+        self.__capture.close()
+        if isinstance(self.__index, mmap.mmap):
+            self.__index.close()
+
+    def __get_bounds(self, message_type: "str | None") -> "tuple[int, int]":
+        """
+        Returns the first and end entries of the message type, all entries for None.
+        """
+        if message_type is None:
+            return 0, len(self.__timestamps)
+
+        message_id = getattr(mavutil.mavlink, f"MAVLINK_MSG_ID_{message_type}", None)
+        type_index = self.__type_indices.get(message_id)
+        if type_index is None:
+            return 0, 0
+
+        return self.__firsts[type_index], self.__firsts[type_index + 1]
+
+    def __get_entry(self, position: int, message_type: "str | None") -> int:
+        """
+        Returns the entry of the frame at the position.
+        """
+        first, end = self.__get_bounds(message_type)
+        if not 0 <= position < end - first:
+            raise IndexError(position)
+
+        if message_type is None:
+            return self.__time_order[position]
+
+        return first + position
@@ -0,0 +1,73 @@
+"""
+Capture of MAVLink frames to a tlog file.
+"""
+
+import struct
+import threading
+import typing
+
+
+# Each record is the timestamp in microseconds then the frame, like the tlog files of pymavlink
+# The timestamp is monotonic instead of the time of day
+RECORD_TIMESTAMP = struct.Struct(">Q")
+MICROSECONDS_PER_SECOND = 1_000_000
+
+
+class FrameCapture:
+    """
+    Writes frames with their time to a tlog file. Inbound and outbound frames are both written,
+    and are told apart by their source system.
+    Frames can be written from several threads.
+    """
+
+    __private_key = object()
+
+    @classmethod
+    def create(cls, path: str) -> "tuple[True, FrameCapture] | tuple[False, None]":
+        """
+        path: File to write, replaced if it exists.
+        """
+        try:
+            # Closed by close()
+            # pylint: disable-next=consider-using-with
+            file = open(path, "wb")
+        except OSError:
+            return False, None
+
+        return True, FrameCapture(cls.__private_key, file)
+
+    def __init__(self, key: object, file: typing.BinaryIO) -> None:
+        assert key is FrameCapture.__private_key, "Use create() method"
+
+        self.__file = file
+        # Reader and writer threads write records
+        self.__lock = threading.Lock()
+        self.__frame_count = 0
+
+    def write(self, frame: "bytes | bytearray", timestamp: float) -> None:
+        """
+        Writes the frame.
+
+        frame: Complete frame.
+        timestamp: Monotonic time the frame was received or sent, in seconds.
+        """
+        record = RECORD_TIMESTAMP.pack(round(timestamp * MICROSECONDS_PER_SECOND)) + frame
+        with self.__lock:
+            if self.__file.closed:
+                return
+
+            self.__file.write(record)
+            self.__frame_count += 1
+
+    def close(self) -> None:
+        """
+        Flushes and closes the file, later frames are not written.
+        """
+        with self.__lock:
+            self.__file.close()
+
+    def get_frame_count(self) -> int:
+        """
+        Returns the number of frames written.
+        """
+        return self.__frame_count
@@ -0,0 +1,255 @@
+"""
+Reading MAVLink frames from a connection in bulk.
+"""
+
+import collections
+import re
+import time
+import typing
+
+from pymavlink import mavutil
+
+from . import frame_capture
+
+
+# Start of a MAVLink 2 or MAVLink 1 frame
+FRAME_START_PATTERN = re.compile(b"[\xfd\xfe]")
+FRAME_START_BYTES = frozenset(b"\xfd\xfe")
+V2_MAGIC = 0xFD
+V2_HEADER_LENGTH = 10
+V1_HEADER_LENGTH = 6
+# Offset of the source system in both headers
+V2_SOURCE_SYSTEM_OFFSET = 5
+V1_SOURCE_SYSTEM_OFFSET = 3
+CHECKSUM_LENGTH = 2
+SIGNATURE_LENGTH = 13
+# Incompatibility flag of signed MAVLink 2 frames
+SIGNED_FLAG = 0x01
+
+
+def get_message_ids(message_types: "list[str]") -> "set[int]":
+    """
+    Returns the message IDs of the message types (e.g. "HEARTBEAT"), skipping unknown types.
+    """
+    return {
+        getattr(mavutil.mavlink, f"MAVLINK_MSG_ID_{message_type}")
+        for message_type in message_types
+        if hasattr(mavutil.mavlink, f"MAVLINK_MSG_ID_{message_type}")
+    }
+
+
+def parse_header(buffer: "bytes | bytearray | memoryview", start: int) -> "tuple[int, int, int]":
+    """
+    Reads the header of the frame at start, which must be a start byte.
+
+    Returns the message ID, source system and length of the frame,
+    or a length of 0 if the header is cut off.
+    """
+    if buffer[start] == V2_MAGIC:
+        if len(buffer) - start < V2_HEADER_LENGTH:
+            return 0, 0, 0
+
+        message_id = buffer[start + 7] | (buffer[start + 8] << 8) | (buffer[start + 9] << 16)
+        signature_length = SIGNATURE_LENGTH if buffer[start + 2] & SIGNED_FLAG else 0
+        length = V2_HEADER_LENGTH + buffer[start + 1] + CHECKSUM_LENGTH + signature_length
+        return message_id, buffer[start + V2_SOURCE_SYSTEM_OFFSET], length
+
+    if len(buffer) - start < V1_HEADER_LENGTH:
+        return 0, 0, 0
+
+    length = V1_HEADER_LENGTH + buffer[start + 1] + CHECKSUM_LENGTH
+    return buffer[start + 5], buffer[start + V1_SOURCE_SYSTEM_OFFSET], length
+
+
+def read_capture_records(
+    data: "bytes | memoryview",
+) -> "typing.Iterator[tuple[int, int, int, int, int]]":
+    """
+    Finds the records of a capture from `frame_capture.FrameCapture`, without copying them.
+    Stops at the first record which is not a frame, e.g. one cut off by a crash.
+
+    data: Contents of the capture.
+
+    Yields the timestamp in microseconds, message ID, source system, start and end
+    of the frame of each record.
+    """
+    timestamp_length = frame_capture.RECORD_TIMESTAMP.size
+    offset = 0
+    while len(data) - offset > timestamp_length:
+        start = offset + timestamp_length
+        if data[start] not in FRAME_START_BYTES:
+            return
+
+        message_id, source_system, length = parse_header(data, start)
+        end = start + length
+        if length == 0 or end > len(data):
+            return
+
+        (timestamp,) = frame_capture.RECORD_TIMESTAMP.unpack_from(data, offset)
+        yield timestamp, message_id, source_system, start, end
+        offset = end
+
+
+class FrameReader:
+    """
+    Reads everything the connection has received in large chunks into 1 reusable buffer,
+    and finds every complete frame in 1 pass. Only frames whose message ID passes the filter
+    are decoded (and checked), the rest are skipped from their header.
+
+    Replaces `recv_match()` and `recv_msg()` of the connection, which read a few bytes
+    per call. Messages are not posted to the connection (e.g. `connection.messages`).
+
+    Every complete frame, skipped or not, can be written to a capture with the time of its read.
+    """
+
+    # Bytes per read, any number of frames
+    __CHUNK_SIZE = 65536
+    # Most reads per call, so a flood cannot starve the caller
+    __MAX_READ_COUNT = 16
+
+    __private_key = object()
+
+    @classmethod
+    def create(
+        cls,
+        connection: mavutil.mavfile,
+        message_ids: "set[int] | None" = None,
+        capture: frame_capture.FrameCapture | None = None,
+    ) -> "tuple[True, FrameReader] | tuple[False, None]":
+        """
+        connection: Connection to read from, nothing else may read from it.
+        message_ids: Message IDs to decode, None for all.
+        capture: Capture to write the received frames to, None for no capture.
+        """
+        if connection is None:
+            return False, None
+
+        return True, FrameReader(cls.__private_key, connection, message_ids, capture)
+
+    def __init__(
+        self,
+        key: object,
+        connection: mavutil.mavfile,
+        message_ids: "set[int] | None",
+        capture: frame_capture.FrameCapture | None,
+    ) -> None:
+        assert key is FrameReader.__private_key, "Use create() method"
+
+        self.__connection = connection
+        self.__message_ids = None if message_ids is None else frozenset(message_ids)
+        self.__capture = capture
+        # Received bytes not parsed yet, only the start of a frame is kept between calls
+        self.__buffer = bytearray()
+        # Frames decoded, frames skipped by the filter, bytes which were not a valid frame, reads
+        self.__counts: "collections.Counter[str]" = collections.Counter()
+
+    def read(self, timeout: float) -> "list[object]":
+        """
+        Waits for data, then reads everything already received and decodes the wanted frames.
+
+        timeout: Time waiting for data in seconds.
+
+        Returns the messages in order, empty if nothing wanted arrived in time.
+        """
+        if not self.__connection.select(timeout):
+            return []
+
+        for _ in range(self.__MAX_READ_COUNT):
+            chunk = self.__connection.recv(self.__CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+
+            self.__counts["reads"] += 1
+            if self.__connection.logfile_raw:
+                self.__connection.logfile_raw.write(chunk)
+
+            self.__buffer += chunk
+            # Datagrams are smaller than a chunk with more waiting, so check instead
+            if len(chunk) < self.__CHUNK_SIZE and not self.__connection.select(0.0):
+                break
+
+        return self.__parse(time.monotonic())
+
+    def __parse(self, read_time: float) -> "list[object]":
+        """
+        Decodes the complete frames in the buffer and removes them, keeping an incomplete frame.
+
+        read_time: Monotonic time of the read, for the capture.
+        """
+        buffer = self.__buffer
+        capture = self.__capture
+        end = len(buffer)
+        messages = []
+        offset = 0
+        while True:
+            match = FRAME_START_PATTERN.search(buffer, offset)
+            if match is None:
+                self.__counts["bad_bytes"] += end - offset
+                offset = end
+                break
+
+            start = match.start()
+            self.__counts["bad_bytes"] += start - offset
+            offset = start
+
+            if buffer[start] == V2_MAGIC:
+                header_length = V2_HEADER_LENGTH
+            else:
+                header_length = V1_HEADER_LENGTH
+
+            if end - start < header_length:
+                break
+
+            payload_length = buffer[start + 1]
+            if header_length == V2_HEADER_LENGTH:
+                message_id = (
+                    buffer[start + 7] | (buffer[start + 8] << 8) | (buffer[start + 9] << 16)
+                )
+                signature_length = SIGNATURE_LENGTH if buffer[start + 2] & SIGNED_FLAG else 0
+            else:
+                message_id = buffer[start + 5]
+                signature_length = 0
+
+            # Not a frame, resynchronize on the next start byte
+            if message_id not in mavutil.mavlink.mavlink_map:
+                self.__counts["bad_bytes"] += 1
+                offset = start + 1
+                continue
+
+            frame_end = start + header_length + payload_length + CHECKSUM_LENGTH + signature_length
+            if frame_end > end:
+                break
+
+            if self.__message_ids is not None and message_id not in self.__message_ids:
+                if capture is not None:
+                    capture.write(buffer[start:frame_end], read_time)
+
+                self.__counts["skipped"] += 1
+                offset = frame_end
+                continue
+
+            try:
+                message = self.__connection.mav.decode(buffer[start:frame_end])
+            # Checksum or signature is wrong
+            except mavutil.mavlink.MAVError:
+                self.__counts["bad_bytes"] += 1
+                offset = start + 1
+                continue
+
+            if capture is not None:
+                capture.write(buffer[start:frame_end], read_time)
+
+            messages.append(message)
+            self.__counts["decoded"] += 1
+            offset = frame_end
+
+        # Keeps the allocation, only an incomplete frame is moved
+        del buffer[:offset]
+        return messages
+
+    def get_counts(self) -> "dict[str, int]":
+        """
+        Returns the number of frames decoded, frames skipped by the filter,
+        bytes which were not a valid frame, and reads.
+        """
+        return {name: self.__counts[name] for name in ("decoded", "skipped", "bad_bytes", "reads")}
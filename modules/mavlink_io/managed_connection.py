@@ -0,0 +1,262 @@
+"""
+MAVLink connection which reconnects itself.
+"""
+
+import random
+import threading
+import time
+
+from pymavlink import mavutil
+
+
+class ManagedConnection:  # pylint: disable=too-many-instance-attributes
+    """
+    Connection which detects a failed link (error or end of stream), and reconnects
+    with jittered exponential backoff. Each connection is established with the heartbeat
+    handshake: a heartbeat is sent and one must be received from the vehicle.
+
+    Has the parts of the `mavutil.mavfile` interface used by `frame_reader.FrameReader`
+    and `mavlink_writer.MavlinkWriter`, so the workers above them are unaware of reconnects.
+    Reconnects happen from `select()`, call it from 1 thread only (the reader).
+    Writes can come from another thread, and are dropped while the link is down.
+    """
+
+    __private_key = object()
+
+    @classmethod
+    def create(
+        cls,
+        connection_string: str,
+        handshake_timeout: float = 1.0,
+        backoff_initial: float = 0.1,
+        backoff_max: float = 5.0,
+    ) -> "tuple[True, ManagedConnection] | tuple[False, None]":
+        """
+        connection_string: Device of `mavutil.mavlink_connection()`, e.g. "tcp:localhost:12345".
+        handshake_timeout: Time waiting for a heartbeat after connecting in seconds.
+        backoff_initial: Longest delay before the first reconnect attempt in seconds.
+        backoff_max: Longest delay between reconnect attempts in seconds.
+        """
+        if handshake_timeout <= 0.0 or not 0.0 < backoff_initial <= backoff_max:
+            return False, None
+
+        return True, ManagedConnection(
+            cls.__private_key, connection_string, handshake_timeout, backoff_initial, backoff_max
+        )
+
+    def __init__(
+        self,
+        key: object,
+        connection_string: str,
+        handshake_timeout: float,
+        backoff_initial: float,
+        backoff_max: float,
+    ) -> None:
+        assert key is ManagedConnection.__private_key, "Use create() method"
+
+        self.__connection_string = connection_string
+        self.__handshake_timeout = handshake_timeout
+        self.__backoff_initial = backoff_initial
+        self.__backoff_max = backoff_max
+
+        # Swapped on reconnect, writes hold the lock so they never use a closed connection
+        self.__lock = threading.Lock()
+        self.__connection: "mavutil.mavfile | None" = None
+        self.__is_connected = False
+        self.__has_connected = False
+        # Whether the last select was ready, an empty read after it is the end of the stream
+        self.__is_ready = False
+
+        self.__failure_time = time.monotonic()
+        self.__attempt_count = 0
+        self.__next_attempt_time = 0.0
+        # Time from detecting each failure to the handshake of the new connection
+        self.__reconnect_times: "list[float]" = []
+        self.__dropped_write_count = 0
+
+    @property
+    def mav(self) -> object:
+        """
+        Encoder of the current connection.
+        """
+        assert self.__connection is not None, "Connect first"
+        return self.__connection.mav
+
+    @property
+    def logfile_raw(self) -> object:
+        """
+        Raw log of the current connection, None if there is none.
+        """
+        if self.__connection is None:
+            return None
+
+        return self.__connection.logfile_raw
+
+    def connect(self, timeout: float) -> bool:
+        """
+        Connects, retrying with backoff until the timeout. Call once before reading and writing.
+
+        timeout: Time trying in seconds.
+
+        Returns whether the link is up.
+        """
+        deadline = time.monotonic() + timeout
+        self.__next_attempt_time = 0.0
+        while not self.__is_connected and time.monotonic() < deadline:
+            self.__reconnect(deadline - time.monotonic())
+
+        return self.__is_connected
+
+    def is_connected(self) -> bool:
+        """
+        Returns whether the link is up.
+        """
+        return self.__is_connected
+
+    def select(self, timeout: float) -> bool:
+        """
+        Waits for data, or reconnects while the link is down.
+
+        timeout: Time waiting in seconds.
+
+        Returns whether there is data to read.
+        """
+        if not self.__is_connected:
+            self.__reconnect(timeout)
+            return False
+
+        assert self.__connection is not None
+        self.__is_ready = self.__connection.select(timeout)
+        return self.__is_ready
+
+    def recv(self, n: int) -> bytes:
+        """
+        Reads up to n bytes, empty if there are none or the link is down.
+        """
+        if not self.__is_connected:
+            return b""
+
+        assert self.__connection is not None
+        try:
+            data = self.__connection.recv(n)
+        except OSError:
+            self.__fail()
+            return b""
+
+        # Ready with nothing to read is the end of the stream
+        if len(data) == 0 and self.__is_ready:
+            self.__fail()
+
+        self.__is_ready = False
+        return data
+
+    def write(self, buffer: bytes) -> None:
+        """
+        Writes the buffer, dropped while the link is down.
+        """
+        with self.__lock:
+            if not self.__is_connected or self.__connection is None:
+                self.__dropped_write_count += 1
+                return
+
+            try:
+                self.__connection.write(buffer)
+            except OSError:
+                self.__dropped_write_count += 1
+
+    def close(self) -> None:
+        """
+        Closes the connection.
+        """
+        with self.__lock:
+            self.__is_connected = False
+            self.__close(self.__connection)
+
+    def get_reconnect_times(self) -> "list[float]":
+        """
+        Returns the time from detecting each failure to the handshake of the new connection,
+        in seconds.
+        """
+        return list(self.__reconnect_times)
+
+    def get_dropped_write_count(self) -> int:
+        """
+        Returns the number of writes dropped while the link was down.
+        """
+        return self.__dropped_write_count
+
+    @staticmethod
+    def __close(connection: "mavutil.mavfile | None") -> None:
+        """
+        Closes the connection, if any.
+        """
+        if connection is None:
+            return
+
+        try:
+            connection.close()
+        # Already closed by the failure
+        except (AttributeError, OSError):
+            pass
+
+    def __fail(self) -> None:
+        """
+        Marks the link as down and schedules the first reconnect attempt.
+        """
+        with self.__lock:
+            self.__is_connected = False
+            self.__close(self.__connection)
+
+        self.__is_ready = False
+        self.__failure_time = time.monotonic()
+        self.__attempt_count = 0
+        self.__schedule_attempt()
+
+    def __schedule_attempt(self) -> None:
+        """
+        Delays the next attempt by a random time up to the backoff, which doubles per attempt,
+        so many clients do not reconnect in step.
+        """
+        backoff = min(self.__backoff_initial * 2**self.__attempt_count, self.__backoff_max)
+        self.__next_attempt_time = time.monotonic() + random.uniform(0.0, backoff)
+        self.__attempt_count += 1
+
+    def __reconnect(self, timeout: float) -> None:
+        """
+        Attempts to connect if the backoff has passed, otherwise waits for it up to the timeout.
+        """
+        wait_time = self.__next_attempt_time - time.monotonic()
+        if wait_time > 0.0:
+            time.sleep(min(wait_time, max(timeout, 0.0)))
+            return
+
+        connection = None
+        try:
+            # Single attempt, the backoff does the retrying
+            connection = mavutil.mavlink_connection(self.__connection_string, retries=0)
+            connection.mav.heartbeat_send(
+                mavutil.mavlink.MAV_TYPE_GCS,
+                mavutil.mavlink.MAV_AUTOPILOT_INVALID,
+                0,
+                0,
+                mavutil.mavlink.MAV_STATE_ACTIVE,
+            )
+            heartbeat = connection.wait_heartbeat(timeout=self.__handshake_timeout)
+        except OSError:
+            heartbeat = None
+
+        if heartbeat is None:
+            self.__close(connection)
+            self.__schedule_attempt()
+            return
+
+        with self.__lock:
+            self.__connection = connection
+            self.__is_connected = True
+
+        # The first connection is not a reconnect
+        if self.__has_connected:
+            self.__reconnect_times.append(time.monotonic() - self.__failure_time)
+
+        self.__has_connected = True
+        self.__attempt_count = 0
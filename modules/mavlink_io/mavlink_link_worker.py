@@ -0,0 +1,202 @@
+"""
+MAVLink link worker that owns the connection to the drone.
+"""
+
+import os
+import pathlib
+import sys
+import threading
+
+from utilities.workers import queue_proxy_wrapper
+from utilities.workers import worker_controller
+from . import frame_capture
+from . import managed_connection
+from . import mavlink_reader
+from . import mavlink_writer
+from . import replay_connection
+from ..common.modules.logger import logger
+
+
+# Longest time waiting for data or a request before checking the controller again
+READ_TIMEOUT = 0.1  # seconds
+WRITE_TIMEOUT = 0.1  # seconds
+# Longest time trying to connect at startup
+CONNECT_TIMEOUT = 30  # seconds
+
+
+def run_writer(
+    writer: mavlink_writer.MavlinkWriter,
+    input_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    controller: worker_controller.WorkerController,
+    local_logger: logger.Logger,
+) -> None:
+    """
+    Writes requests until exit is requested. Keeps running while paused,
+    so the drone keeps receiving heartbeats. Returns early if writing raises,
+    the link worker then exits with an error.
+    """
+    try:
+        while not controller.is_exit_requested():
+            writer.run(input_queue, WRITE_TIMEOUT)
+    # Otherwise the thread dies silently while the reader keeps the process alive
+    # pylint: disable-next=broad-exception-caught
+    except Exception as e:
+        local_logger.error(f"Exception raised while writing: {e}", True)
+
+
+def mavlink_link_worker(
+    connection_string: str,
+    subscriptions: "list[list[str]]",
+    input_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    capture_path: "str | None",
+    replay_speed: "float | None",
+    *args: object,
+) -> None:
+    """
+    Worker process. Connects, then reads on this thread and writes on another,
+    reconnecting whenever the link fails. Exits with code 1 if it cannot set up or connect,
+    or if the writer stops before exit is requested.
+
+    connection_string: Device of `mavutil.mavlink_connection()`, e.g. "tcp:localhost:12345",
+    or the capture to replay.
+    subscriptions: Message types (e.g. "HEARTBEAT") of each output queue,
+    in the order of the output queues.
+    input_queue: Requests from `mavlink_writer.MessagePublisher`.
+    capture_path: File to capture every frame received and sent to, None for no capture.
+    replay_speed: Speed of replaying the capture, see `replay_connection.ReplayConnection`,
+    None to connect to the device.
+    args: Output queues, 1 per subscription, then the controller.
+    """
+    *output_queues, controller = args
+
+    # Setup failures exit with an error, so the supervisor restarts the worker with backoff
+    # Returning would look like a normal exit, which is not restarted
+    # Instantiate logger
+    worker_name = pathlib.Path(__file__).stem
+    process_id = os.getpid()
+    result, local_logger = logger.Logger.create(f"{worker_name}_{process_id}", True)
+    if not result:
+        print("ERROR: Worker failed to create logger")
+        sys.exit(1)
+
+    # Get Pylance to stop complaining
+    assert local_logger is not None
+
+    local_logger.info("Logger initialized", True)
+
+    if len(output_queues) != len(subscriptions):
+        local_logger.error(
+            f"{len(subscriptions)} subscriptions but {len(output_queues)} output queues", True
+        )
+        sys.exit(1)
+
+    connection: "managed_connection.ManagedConnection | replay_connection.ReplayConnection | None"
+    replay = None
+    if replay_speed is None:
+        result, connection = managed_connection.ManagedConnection.create(connection_string)
+    else:
+        result, replay = replay_connection.ReplayConnection.create(connection_string, replay_speed)
+        connection = replay
+
+    if not result:
+        local_logger.error(f"Failed to create connection to {connection_string}", True)
+        sys.exit(1)
+
+    # Get Pylance to stop complaining
+    assert connection is not None
+
+    if not connection.connect(CONNECT_TIMEOUT):
+        connection.close()
+        if controller.is_exit_requested():
+            local_logger.info("Exit requested before connecting", True)
+            return
+
+        local_logger.error(f"Failed to connect to {connection_string}", True)
+        sys.exit(1)
+
+    local_logger.info(f"Connected to {connection_string}")
+
+    capture = None
+    if capture_path is not None:
+        result, capture = frame_capture.FrameCapture.create(capture_path)
+        if not result:
+            local_logger.error(f"Failed to create capture {capture_path}", True)
+            connection.close()
+            sys.exit(1)
+
+        local_logger.info(f"Capturing to {capture_path}")
+
+    result, reader = mavlink_reader.MavlinkReader.create(connection, subscriptions, capture)
+    if not result:
+        local_logger.error("Failed to create MAVLink reader", True)
+        connection.close()
+        sys.exit(1)
+
+    # Get Pylance to stop complaining
+    assert reader is not None
+
+    result, writer = mavlink_writer.MavlinkWriter.create(connection, capture)
+    if not result:
+        local_logger.error("Failed to create MAVLink writer", True)
+        connection.close()
+        sys.exit(1)
+
+    # Get Pylance to stop complaining
+    assert writer is not None
+
+    writer_thread = threading.Thread(
+        target=run_writer,
+        args=(writer, input_queue, controller, local_logger),
+        name="MAVLink writer",
+    )
+    writer_thread.start()
+
+    local_logger.info("MAVLink link worker started")
+
+    # Main loop: do work.
+    was_connected = True
+    was_finished = False
+    is_writer_stopped = False
+    while not controller.is_exit_requested():
+        # Nothing reaches the drone without the writer, so restart the whole link
+        if not writer_thread.is_alive():
+            local_logger.error("MAVLink writer stopped, exiting", True)
+            is_writer_stopped = True
+            break
+
+        controller.check_pause()
+        reader.run(output_queues, READ_TIMEOUT)
+
+        if replay is not None and not was_finished and replay.is_finished():
+            local_logger.info(
+                f"Replay finished in {replay.get_replay_time():.3f}s: {replay.get_counts()}", True
+            )
+            was_finished = True
+
+        is_connected = connection.is_connected()
+        if was_connected and not is_connected:
+            local_logger.warning("Link lost, reconnecting", True)
+        elif is_connected and not was_connected:
+            local_logger.info(
+                f"Reconnected in {connection.get_reconnect_times()[-1] * 1000:.1f}ms", True
+            )
+
+        was_connected = is_connected
+
+    writer_thread.join()
+    connection.close()
+    if capture is not None:
+        capture.close()
+        local_logger.info(f"Captured {capture.get_frame_count()} frames to {capture_path}")
+
+    local_logger.info(f"Messages routed by type: {reader.get_message_counts()}")
+    local_logger.info(f"Frames: {reader.get_frame_counts()}")
+    local_logger.info(f"Messages written: {writer.get_counts()}")
+    local_logger.info(
+        f"Reconnect times: {connection.get_reconnect_times()}, "
+        f"writes dropped while down: {connection.get_dropped_write_count()}"
+    )
+    local_logger.info("MAVLink link worker stopped")
+
+    if is_writer_stopped:
+        sys.exit(1)
@@ -0,0 +1,179 @@
+"""
+Reading MAVLink messages once and routing them to subscribers by type.
+"""
+
+import collections
+import time
+
+from pymavlink import mavutil
+
+from utilities.workers import queue_proxy_wrapper
+from . import frame_capture
+from . import frame_reader
+
+
+def get_message_type(message: object) -> "str | None":
+    """
+    Returns the type of the message (e.g. "HEARTBEAT"), None for anything else.
+    Key function for conflating subscriber queues, which keeps the newest message of each type.
+    """
+    get_type = getattr(message, "get_type", None)
+    if get_type is None:
+        return None
+
+    return get_type()
+
+
+class MessageSubscription:
+    """
+    Messages routed to a subscriber queue, read with the same `recv_match()` as a connection,
+    so the same class can read from either.
+    """
+
+    def __init__(self, input_queue: queue_proxy_wrapper.QueueProxyWrapper) -> None:
+        """
+        input_queue: Output queue of the MAVLink reader for this subscriber.
+        """
+        self.__input_queue = input_queue
+        # Got from the queue but not returned yet
+        self.__pending: "collections.deque[object]" = collections.deque()
+
+    # Same signature as mavutil.mavfile.recv_match()
+    def recv_match(  # pylint: disable=redefined-builtin
+        self,
+        type: "str | list[str] | set[str] | None" = None,
+        blocking: bool = False,
+        timeout: "float | None" = None,
+    ) -> "object | None":
+        """
+        Gets the next message of the types, skipping messages of other types.
+
+        type: Message type or types, None for any.
+        blocking: Whether to wait for a message, for up to the timeout.
+        timeout: Time waiting in seconds, None waits forever if blocking.
+        Unlike a connection, a timeout also waits when not blocking instead of returning at once,
+        so callers polling with a timeout do not spin.
+
+        Returns the message, None if there is none in time.
+        """
+        if type is not None and not isinstance(type, (list, set)):
+            type = [type]
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        while True:
+            while len(self.__pending) > 0:
+                message = self.__pending.popleft()
+                if type is None or get_message_type(message) in type:
+                    return message
+
+            wait_time = None
+            if deadline is not None:
+                wait_time = max(deadline - time.monotonic(), 0.0)
+            elif not blocking:
+                wait_time = 0.0
+
+            messages = self.__input_queue.get_many(timeout=wait_time)
+            # Sentinels from stopping
+            self.__pending.extend(message for message in messages if message is not None)
+            if len(messages) == 0:
+                return None
+
+
+class MavlinkReader:
+    """
+    Only reader of the connection. Each received frame is parsed once
+    and put in the queue of every subscriber of its type, so readers no longer steal
+    each other's messages. Frames no subscriber wants are skipped without being decoded.
+    """
+
+    __private_key = object()
+
+    @classmethod
+    def create(
+        cls,
+        connection: mavutil.mavfile,
+        subscriptions: "list[list[str]]",
+        capture: frame_capture.FrameCapture | None = None,
+    ) -> "tuple[True, MavlinkReader] | tuple[False, None]":
+        """
+        connection: Connection to read from, nothing else may read from it.
+        subscriptions: Message types of each subscriber, in the order of their queues.
+        capture: Capture to write the received frames to, None for no capture.
+        """
+        if connection is None or len(subscriptions) == 0:
+            return False, None
+
+        # Message type to subscriber indices
+        routes: "dict[str, list[int]]" = {}
+        for i, message_types in enumerate(subscriptions):
+            for message_type in message_types:
+                routes.setdefault(message_type, []).append(i)
+
+        result, reader = frame_reader.FrameReader.create(
+            connection, frame_reader.get_message_ids(list(routes)), capture
+        )
+        if not result:
+            return False, None
+
+        # Get Pylance to stop complaining
+        assert reader is not None
+
+        return True, MavlinkReader(cls.__private_key, reader, len(subscriptions), routes)
+
+    def __init__(
+        self,
+        key: object,
+        reader: frame_reader.FrameReader,
+        subscriber_count: int,
+        routes: "dict[str, list[int]]",
+    ) -> None:
+        assert key is MavlinkReader.__private_key, "Use create() method"
+
+        self.__reader = reader
+        self.__subscriber_count = subscriber_count
+        self.__routes = routes
+        # Message type to number routed
+        self.__message_counts: "collections.Counter[str]" = collections.Counter()
+
+    def run(
+        self, output_queues: "list[queue_proxy_wrapper.QueueProxyWrapper]", timeout: float
+    ) -> int:
+        """
+        Waits for data, then reads everything already received and routes the messages,
+        with 1 put per subscriber.
+
+        output_queues: Queue of each subscriber, in the order of the subscriptions.
+        timeout: Time waiting for data in seconds.
+
+        Returns the number of messages routed.
+        """
+        assert len(output_queues) == self.__subscriber_count, "1 queue per subscription"
+
+        messages = self.__reader.read(timeout)
+        batches: "list[list[object]]" = [[] for _ in output_queues]
+        for message in messages:
+            message_type = message.get_type()
+            self.__message_counts[message_type] += 1
+            for i in self.__routes.get(message_type, []):
+                batches[i].append(message)
+
+        for output_queue, batch in zip(output_queues, batches):
+            if len(batch) > 0:
+                output_queue.put_many(batch)
+
+        return len(messages)
+
+    def get_message_counts(self) -> "dict[str, int]":
+        """
+        Returns the number of messages routed by type.
+        """
+        return dict(self.__message_counts)
+
+    def get_frame_counts(self) -> "dict[str, int]":
+        """
+        Returns the frame counts of the reader, see `frame_reader.FrameReader.get_counts()`.
+        """
+        return self.__reader.get_counts()
@@ -0,0 +1,193 @@
+"""
+Writing MAVLink messages from a single owner of the connection.
+"""
+
+import collections
+import time
+
+from pymavlink import mavutil
+
+from utilities.workers import queue_proxy_wrapper
+from . import frame_capture
+
+
+# Commands whose newest unsent request replaces the older ones, since they set a target
+COALESCED_COMMANDS = frozenset(
+    [
+        mavutil.mavlink.MAV_CMD_CONDITION_CHANGE_ALT,
+        mavutil.mavlink.MAV_CMD_CONDITION_YAW,
+    ]
+)
+# Messages whose newest unsent one replaces the older ones
+COALESCED_TYPES = frozenset(["HEARTBEAT"])
+
+
+def get_send_priority(message: object) -> int:
+    """
+    Returns the priority of the message in the outbound queue, heartbeats are sent first
+    so a burst of commands cannot make the drone think the link is lost.
+    """
+    if message.get_type() == "HEARTBEAT":
+        return queue_proxy_wrapper.PRIORITY_CRITICAL
+
+    return queue_proxy_wrapper.PRIORITY_ROUTINE
+
+
+def get_coalesce_key(message: object) -> "tuple | None":
+    """
+    Returns the key of messages which supersede each other, None if every message is sent.
+    """
+    message_type = message.get_type()
+    if message_type in COALESCED_TYPES:
+        return (message_type,)
+
+    if message_type == "COMMAND_LONG" and message.command in COALESCED_COMMANDS:
+        return (message_type, message.target_system, message.target_component, message.command)
+
+    return None
+
+
+class MessagePublisher:
+    """
+    Sends messages through the queue of the MAVLink writer, with the same `mav.*_send()`
+    methods as a connection, so the same class can send through either.
+    """
+
+    def __init__(self, output_queue: queue_proxy_wrapper.QueueProxyWrapper) -> None:
+        """
+        output_queue: Input queue of the MAVLink writer, in priority mode.
+        """
+        self.__output_queue = output_queue
+        # Only builds the messages, the writer packs them with its own sequence numbers
+        self.__encoder = mavutil.mavlink.MAVLink(None)
+        # Connections send with `connection.mav.*_send()`
+        self.mav = self
+
+    # Same signature as MAVLink.send()
+    # pylint: disable-next=unused-argument
+    def send(self, message: object, force_mavlink1: bool = False) -> None:
+        """
+        Queues the message for the writer.
+        """
+        self.__output_queue.put(message, priority=get_send_priority(message))
+
+    def __getattr__(self, name: str) -> "(...) -> None":  # type: ignore
+        """
+        Returns the `*_send()` method of the message type, e.g. `heartbeat_send()`.
+        """
+        if not name.endswith("_send"):
+            raise AttributeError(name)
+
+        encode = getattr(self.__encoder, name.removesuffix("_send") + "_encode")
+
+        # Same signature as the `*_send()` methods of MAVLink
+        # pylint: disable-next=unused-argument
+        def send(*args: object, force_mavlink1: bool = False, **kwargs: object) -> None:
+            self.send(encode(*args, **kwargs))
+
+        return send
+
+
+class MavlinkWriter:
+    """
+    Only writer of the connection, so writes from several workers cannot interleave.
+
+    Every request already queued is sent together: a newer request replaces an unsent one
+    with the same coalesce key, the rest are sent by priority and then in order,
+    and all frames go out in 1 write.
+    """
+
+    # Most messages per write
+    __MAX_BATCH_SIZE = 64
+
+    __private_key = object()
+
+    @classmethod
+    def create(
+        cls, connection: mavutil.mavfile, capture: frame_capture.FrameCapture | None = None
+    ) -> "tuple[True, MavlinkWriter] | tuple[False, None]":
+        """
+        connection: Connection to write to, nothing else may write to it.
+        capture: Capture to write the sent frames to, None for no capture.
+        """
+        if connection is None:
+            return False, None
+
+        return True, MavlinkWriter(cls.__private_key, connection, capture)
+
+    def __init__(
+        self,
+        key: object,
+        connection: mavutil.mavfile,
+        capture: frame_capture.FrameCapture | None,
+    ) -> None:
+        assert key is MavlinkWriter.__private_key, "Use create() method"
+
+        self.__connection = connection
+        self.__capture = capture
+        # Messages written, replaced before they were sent, and writes
+        self.__counts: "collections.Counter[str]" = collections.Counter()
+
+    def run(self, input_queue: queue_proxy_wrapper.QueueProxyWrapper, timeout: float) -> int:
+        """
+        Waits for a request, then writes every request already queued.
+
+        input_queue: Queue of requests from `MessagePublisher`.
+        timeout: Time waiting for the first request in seconds.
+
+        Returns the number of messages written.
+        """
+        requests = input_queue.get_many(self.__MAX_BATCH_SIZE, timeout)
+
+        # Newest message of a key takes the place of the oldest
+        messages = []
+        key_indices = {}
+        for message in requests:
+            # Sentinels from stopping
+            if message is None:
+                continue
+
+            key = get_coalesce_key(message)
+            if key is None:
+                messages.append(message)
+                continue
+
+            if key in key_indices:
+                messages[key_indices[key]] = message
+                self.__counts["coalesced"] += 1
+                continue
+
+            key_indices[key] = len(messages)
+            messages.append(message)
+
+        if len(messages) == 0:
+            return 0
+
+        # Stable, so messages of the same priority keep their order
+        messages.sort(key=get_send_priority)
+
+        mav = self.__connection.mav
+        write_time = time.monotonic()
+        frames = bytearray()
+        for message in messages:
+            frame = message.pack(mav)
+            frames += frame
+            if self.__capture is not None:
+                self.__capture.write(frame, write_time)
+
+            mav.seq = (mav.seq + 1) % 256
+            mav.total_packets_sent += 1
+            mav.total_bytes_sent += len(frame)
+
+        self.__connection.write(bytes(frames))
+        self.__counts["written"] += len(messages)
+        self.__counts["writes"] += 1
+
+        return len(messages)
+
+    def get_counts(self) -> "dict[str, int]":
+        """
+        Returns the number of messages written, messages replaced before they were sent,
+        and writes.
+        """
+        return {name: self.__counts[name] for name in ("written", "coalesced", "writes")}
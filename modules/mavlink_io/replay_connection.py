@@ -0,0 +1,210 @@
+"""
+Connection which replays a capture of MAVLink frames.
+"""
+
+import math
+import pathlib
+import time
+
+from pymavlink import mavutil
+
+from . import frame_capture
+from . import frame_reader
+
+
+# Speed which releases every frame at once
+AS_FAST_AS_POSSIBLE = math.inf
+# Default system ID of mavutil connections, which the ground station sent from
+GROUND_STATION_SYSTEM = 255
+
+
+class ReplayConnection:  # pylint: disable=too-many-instance-attributes
+    """
+    Releases the frames the vehicle sent in a capture from `frame_capture.FrameCapture`,
+    at their captured times scaled by the speed. The frames sent by the ground station
+    are left out, since the workers send their own, and writes are discarded.
+
+    Has the same interface as `managed_connection.ManagedConnection`, so captured traffic
+    can be fed to the workers instead of a vehicle.
+    """
+
+    __private_key = object()
+
+    @classmethod
+    def create(
+        cls, path: str, speed: float = 1.0, source_system: int = GROUND_STATION_SYSTEM
+    ) -> "tuple[True, ReplayConnection] | tuple[False, None]":
+        """
+        path: Capture to replay.
+        speed: Multiple of the captured rate, e.g. 1.0 for real time or AS_FAST_AS_POSSIBLE.
+        source_system: System ID of the ground station in the capture.
+        """
+        if speed <= 0.0:
+            return False, None
+
+        try:
+            data = pathlib.Path(path).read_bytes()
+        except OSError:
+            return False, None
+
+        # Timestamp, start and end of each frame from the vehicle
+        records = [
+            (timestamp, start, end)
+            for timestamp, _, frame_source_system, start, end in frame_reader.read_capture_records(
+                data
+            )
+            if frame_source_system != source_system
+        ]
+
+        return True, ReplayConnection(cls.__private_key, data, records, speed, source_system)
+
+    def __init__(
+        self,
+        key: object,
+        data: bytes,
+        records: "list[tuple[int, int, int]]",
+        speed: float,
+        source_system: int,
+    ) -> None:
+        assert key is ReplayConnection.__private_key, "Use create() method"
+
+        self.__data = data
+        self.__records = records
+        self.__speed = speed
+        self.__mav = mavutil.mavlink.MAVLink(None, srcSystem=source_system)
+        self.__index = 0
+        self.__is_closed = False
+        self.__start_time = 0.0
+        self.__finish_time = 0.0
+        self.__write_count = 0
+
+    @property
+    def mav(self) -> object:
+        """
+        Encoder of the ground station.
+        """
+        return self.__mav
+
+    @property
+    def logfile_raw(self) -> object:
+        """
+        Replays are not logged.
+        """
+        return None
+
+    # Same signature as ManagedConnection.connect()
+    # pylint: disable-next=unused-argument
+    def connect(self, timeout: float) -> bool:
+        """
+        Starts the replay.
+
+        Returns whether the link is up, always.
+        """
+        self.__start_time = time.monotonic()
+        self.__index = 0
+        return True
+
+    def is_connected(self) -> bool:
+        """
+        Returns whether the link is up, always. The link stays up after the last frame.
+        """
+        return True
+
+    def is_finished(self) -> bool:
+        """
+        Returns whether every frame has been read, or the replay was stopped.
+        """
+        return self.__is_closed or self.__index >= len(self.__records)
+
+    def select(self, timeout: float) -> bool:
+        """
+        Waits for the next frame to be due.
+
+        timeout: Time waiting in seconds.
+
+        Returns whether there is data to read.
+        """
+        if self.is_finished():
+            time.sleep(timeout)
+            return False
+
+        wait_time = self.__get_due_time(self.__index) - time.monotonic()
+        if wait_time <= 0.0:
+            return True
+
+        time.sleep(min(wait_time, timeout))
+        return wait_time <= timeout
+
+    def recv(self, n: int) -> bytes:
+        """
+        Reads the frames which are due, up to n bytes unless the first is larger.
+        """
+        now = time.monotonic()
+        chunks = []
+        size = 0
+        while not self.is_finished() and self.__get_due_time(self.__index) <= now:
+            _, start, end = self.__records[self.__index]
+            if size + end - start > n and size > 0:
+                break
+
+            chunks.append(self.__data[start:end])
+            size += end - start
+            self.__index += 1
+
+        if len(chunks) > 0 and self.is_finished():
+            self.__finish_time = time.monotonic()
+
+        return b"".join(chunks)
+
+    # Same signature as ManagedConnection.write()
+    # pylint: disable-next=unused-argument
+    def write(self, buffer: bytes) -> None:
+        """
+        Discards the buffer.
+        """
+        self.__write_count += 1
+
+    def close(self) -> None:
+        """
+        Stops the replay.
+        """
+        self.__is_closed = True
+
+    def get_reconnect_times(self) -> "list[float]":
+        """
+        Returns the reconnect times, none since the link never fails.
+        """
+        return []
+
+    def get_dropped_write_count(self) -> int:
+        """
+        Returns the number of writes dropped while the link was down, none since it is never down.
+        """
+        return 0
+
+    def get_counts(self) -> "dict[str, int]":
+        """
+        Returns the number of frames replayed and in the capture, and writes discarded.
+        """
+        return {
+            "replayed": self.__index,
+            "frames": len(self.__records),
+            "writes": self.__write_count,
+        }
+
+    def get_replay_time(self) -> float:
+        """
+        Returns the time from the start to the last frame in seconds, 0 until it is finished.
+        """
+        if self.__finish_time == 0.0:
+            return 0.0
+
+        return self.__finish_time - self.__start_time
+
+    def __get_due_time(self, index: int) -> float:
+        """
+        Returns the monotonic time the frame is released.
+        """
+        first_timestamp = self.__records[0][0]
+        delay = (self.__records[index][0] - first_timestamp) / frame_capture.MICROSECONDS_PER_SECOND
+        return self.__start_time + delay / self.__speed
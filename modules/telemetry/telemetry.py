@@ -6,6 +6,7 @@ import time
 
 from pymavlink import mavutil
 
+from utilities.workers import record_layout
 from ..common.modules.logger import logger
 
 
@@ -62,6 +63,27 @@ class TelemetryData:  # pylint: disable=too-many-instance-attributes
         }}"""
 
 
+# Fixed layout for passing TelemetryData through shared memory queues
+TELEMETRY_DATA_LAYOUT = record_layout.RecordLayout(
+    TelemetryData,
+    [
+        ("time_since_boot", "q"),
+        ("x", "d"),
+        ("y", "d"),
+        ("z", "d"),
+        ("x_velocity", "d"),
+        ("y_velocity", "d"),
+        ("z_velocity", "d"),
+        ("roll", "d"),
+        ("pitch", "d"),
+        ("yaw", "d"),
+        ("roll_speed", "d"),
+        ("pitch_speed", "d"),
+        ("yaw_speed", "d"),
+    ],
+)
+
+
 # =================================================================================================
 #                            ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
 # =================================================================================================
@@ -11,13 +11,20 @@ from utilities.workers import queue_proxy_wrapper
 from utilities.workers import worker_controller
 from . import telemetry
 from ..common.modules.logger import logger
+from ..mavlink_io import mavlink_reader
+
+
+# Longest time a sample waits for its batch to fill
+BATCH_MAX_WAIT = 0.5  # seconds
+# Longest time waiting for space to send the last batch when exiting
+FLUSH_TIMEOUT = 1  # seconds
 
 
 # =================================================================================================
 #                            ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
 # =================================================================================================
 def telemetry_worker(
-    connection: mavutil.mavfile,
+    connection: mavutil.mavfile | queue_proxy_wrapper.QueueProxyWrapper,
     output_queue: queue_proxy_wrapper.QueueProxyWrapper,
     controller: worker_controller.WorkerController,
     # Place your own arguments here
@@ -26,7 +33,7 @@ def telemetry_worker(
     """
     Worker process.
 
-    connection:connection instance
+    connection: connection instance, or the input queue of messages routed by the MAVLink reader
     output_queue: output to other processes
     controller: how main process communicates with worker process
     """
@@ -50,19 +57,28 @@ def telemetry_worker(
     # =============================================================================================
     #                          ↓ BOOTCAMPERS MODIFY BELOW THIS COMMENT ↓
     # =============================================================================================
+    # Routed messages are read the same way as from the connection
+    if isinstance(connection, queue_proxy_wrapper.QueueProxyWrapper):
+        connection = mavlink_reader.MessageSubscription(connection)
+
     # Instantiate class object (telemetry.Telemetry)
     flag, telemetry_instance = telemetry.Telemetry.create(connection, local_logger)
     if not flag:
         local_logger.info("Telemetry Worker Started")
 
     # Main loop: do work.
+    # Samples are sent in batches of the output queue's batch size,
+    # or sooner once the first sample has waited so commands are not made on stale telemetry
+    batch = queue_proxy_wrapper.OutputBatch(output_queue, BATCH_MAX_WAIT)
     while not controller.is_exit_requested():
         controller.check_pause()
         data = telemetry_instance.run()
-        if not data:
-            continue
-        output_queue.queue.put(data)
-        local_logger.info(f"Telemetry data: {data}")
+        if data:
+            local_logger.info(f"Telemetry data: {data}")
+            batch.add(data)
+        batch.put_if_due()
+    # Samples of a partial batch are still sent, without blocking forever
+    batch.flush(FLUSH_TIMEOUT)
     local_logger.info("Telemetry Worker Stopped")
 
 
@@ -0,0 +1,167 @@
+"""
+Test indexed reading of MAVLink captures.
+"""
+
+import mmap
+import os
+import pathlib
+
+import pytest
+from pymavlink import mavutil
+
+from modules.mavlink_io import capture_reader
+from modules.mavlink_io import frame_capture
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+# Time between captured frames
+CAPTURE_PERIOD = 0.1  # seconds
+FRAME_COUNT = 10
+
+
+@pytest.fixture()
+def capture_path(tmp_path: pathlib.Path) -> str:
+    """
+    Capture alternating attitudes and positions, 1 each period from 100 seconds.
+    The positions are stamped later than the next attitude, like a frame sent
+    while another was received.
+    """
+    path = str(tmp_path / "capture.tlog")
+    result, capture = frame_capture.FrameCapture.create(path)
+    assert result
+    assert capture is not None
+
+    encoder = mavutil.mavlink.MAVLink(None, srcSystem=1)
+    for i in range(FRAME_COUNT):
+        timestamp = 100.0 + i * CAPTURE_PERIOD
+        if i % 2 == 0:
+            message = encoder.attitude_encode(i, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        else:
+            message = encoder.local_position_ned_encode(i, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+            timestamp += 1.5 * CAPTURE_PERIOD
+
+        capture.write(message.pack(encoder), timestamp)
+
+    capture.close()
+
+    return path
+
+
+def create_reader(path: str) -> capture_reader.CaptureReader:
+    """
+    Reader of the capture.
+    """
+    result, reader = capture_reader.CaptureReader.create(path)
+    assert result
+    assert reader is not None
+
+    return reader
+
+
+class TestCaptureReader:
+    """
+    Finding frames by type, time and position.
+    """
+
+    def test_index_saved(self, capture_path: str) -> None:
+        """
+        Index is saved on first open and used on the next, and rebuilt once the capture changes.
+        """
+        # Setup
+        index_path = capture_path + capture_reader.INDEX_SUFFIX
+        create_reader(capture_path).close()
+        saved_time = os.stat(index_path).st_mtime_ns
+
+        # Run
+        reader = create_reader(capture_path)
+        is_mapped = isinstance(reader._CaptureReader__index, mmap.mmap)
+        reader.close()
+        reused_time = os.stat(index_path).st_mtime_ns
+        with open(capture_path, "ab") as file:
+            file.write(b"\x00")
+
+        reader = create_reader(capture_path)
+        reader.close()
+
+        # Test
+        assert is_mapped
+        assert saved_time == reused_time
+        assert os.stat(index_path).st_mtime_ns != saved_time
+
+    def test_counts(self, capture_path: str) -> None:
+        """
+        Frames are counted by type.
+        """
+        # Setup
+        reader = create_reader(capture_path)
+
+        # Run
+        message_types = reader.get_message_types()
+
+        # Test
+        assert sorted(message_types) == ["ATTITUDE", "LOCAL_POSITION_NED"]
+        assert reader.get_count() == FRAME_COUNT
+        assert reader.get_count("ATTITUDE") == FRAME_COUNT // 2
+        assert reader.get_count("HEARTBEAT") == 0
+        reader.close()
+
+    def test_find_type(self, capture_path: str) -> None:
+        """
+        Frames of the type in the time range are found, including the start and not the end.
+        """
+        # Setup
+        reader = create_reader(capture_path)
+
+        # Run
+        positions = reader.find("ATTITUDE", 100.2, 100.6)
+        messages = list(reader.get_messages("LOCAL_POSITION_NED", 100.2, 100.6))
+
+        # Test
+        assert positions == range(1, 3)
+        attitude = reader.get_message(positions[0], "ATTITUDE")
+        assert isinstance(attitude, mavutil.mavlink.MAVLink_attitude_message)
+        assert attitude.time_boot_ms == 2
+        assert attitude._timestamp == pytest.approx(100.2)
+        assert [message.time_boot_ms for message in messages] == [1, 3]
+        reader.close()
+
+    def test_find_all(self, capture_path: str) -> None:
+        """
+        Frames of all types are found in time order, not capture order.
+        """
+        # Setup
+        reader = create_reader(capture_path)
+
+        # Run
+        positions = reader.find(None, 100.0, 100.45)
+
+        # Test
+        assert [reader.get_message(i).time_boot_ms for i in positions] == [0, 2, 1, 4]
+        assert reader.get_timestamp(positions[-1]) == pytest.approx(100.4)
+        reader.close()
+
+    def test_frame_view(self, capture_path: str) -> None:
+        """
+        Frame is a view of the capture, and positions out of range are rejected.
+        """
+        # Setup
+        reader = create_reader(capture_path)
+        encoder = mavutil.mavlink.MAVLink(None, srcSystem=1)
+        expected = encoder.attitude_encode(2, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0).pack(encoder)
+
+        # Run
+        frame = reader.get_frame(1, "ATTITUDE")
+
+        # Test
+        assert isinstance(frame, memoryview)
+        assert frame.readonly
+        assert bytes(frame) == expected
+        with pytest.raises(IndexError):
+            reader.get_frame(FRAME_COUNT // 2, "ATTITUDE")
+
+        frame.release()
+        reader.close()
@@ -0,0 +1,152 @@
+"""
+Test reading MAVLink frames in bulk.
+"""
+
+import collections
+
+import pytest
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import common
+
+from modules.mavlink_io import frame_reader
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+class FakeConnection:
+    """
+    Connection which receives the chunks, 1 per read.
+    """
+
+    def __init__(self, chunks: "list[bytes]") -> None:
+        self.mav = mavutil.mavlink.MAVLink(None)
+        self.logfile_raw = None
+        self.chunks = collections.deque(chunks)
+
+    # Same signature as mavutil.mavfile.select()
+    # pylint: disable-next=unused-argument
+    def select(self, timeout: float) -> bool:
+        """
+        Whether there is data.
+        """
+        return len(self.chunks) > 0
+
+    # Same signature as mavutil.mavfile.recv()
+    # pylint: disable-next=unused-argument
+    def recv(self, n: int) -> bytes:
+        """
+        Next chunk, empty if there are none.
+        """
+        if len(self.chunks) == 0:
+            return b""
+
+        return self.chunks.popleft()
+
+
+@pytest.fixture()
+def frames() -> "list[bytes]":
+    """
+    Heartbeat and 2 attitude frames from the drone.
+    """
+    encoder = common.MAVLink(None, srcSystem=1)
+    return [
+        common.MAVLink_heartbeat_message(2, 3, 0, 0, 4, 3).pack(encoder),
+        common.MAVLink_attitude_message(100, 0.1, 0.2, 0.3, 0.0, 0.0, 0.0).pack(encoder),
+        common.MAVLink_attitude_message(200, 0.4, 0.5, 0.6, 0.0, 0.0, 0.0).pack(encoder),
+    ]
+
+
+def create_reader(
+    connection: FakeConnection, message_types: "list[str] | None" = None
+) -> frame_reader.FrameReader:
+    """
+    Reader of the connection, decoding the message types.
+    """
+    message_ids = None
+    if message_types is not None:
+        message_ids = frame_reader.get_message_ids(message_types)
+
+    result, reader = frame_reader.FrameReader.create(connection, message_ids)
+    assert result
+    assert reader is not None
+
+    return reader
+
+
+class TestFrameReader:
+    """
+    Finding and decoding frames.
+    """
+
+    def test_all_frames(self, frames: "list[bytes]") -> None:
+        """
+        Every frame in 1 chunk is decoded in order.
+        """
+        # Setup
+        reader = create_reader(FakeConnection([b"".join(frames)]))
+
+        # Run
+        messages = reader.read(0.0)
+
+        # Test
+        assert [message.get_type() for message in messages] == [
+            "HEARTBEAT",
+            "ATTITUDE",
+            "ATTITUDE",
+        ]
+        assert reader.get_counts() == {"decoded": 3, "skipped": 0, "bad_bytes": 0, "reads": 1}
+
+    def test_filter(self, frames: "list[bytes]") -> None:
+        """
+        Frames of other types are skipped without decoding.
+        """
+        # Setup
+        reader = create_reader(FakeConnection([b"".join(frames)]), ["ATTITUDE"])
+
+        # Run
+        messages = reader.read(0.0)
+
+        # Test
+        assert [message.time_boot_ms for message in messages] == [100, 200]
+        assert reader.get_counts()["skipped"] == 1
+
+    def test_split_frame(self, frames: "list[bytes]") -> None:
+        """
+        Frame split across calls is kept until it is complete.
+        """
+        # Setup
+        data = b"".join(frames)
+        split = len(frames[0]) + 5
+        connection = FakeConnection([data[:split]])
+        reader = create_reader(connection)
+
+        # Run
+        first = reader.read(0.0)
+        connection.chunks.append(data[split:])
+        second = reader.read(0.0)
+
+        # Test
+        assert [message.get_type() for message in first] == ["HEARTBEAT"]
+        assert [message.time_boot_ms for message in second] == [100, 200]
+
+    def test_resynchronize(self, frames: "list[bytes]") -> None:
+        """
+        Garbage and a corrupted frame are skipped, and the next frames are still found.
+        """
+        # Setup
+        corrupted = bytearray(frames[1])
+        corrupted[-1] ^= 0xFF
+        reader = create_reader(
+            FakeConnection([b"\x00\x01\x02" + frames[0] + bytes(corrupted) + frames[2]])
+        )
+
+        # Run
+        messages = reader.read(0.0)
+
+        # Test
+        assert [message.get_type() for message in messages] == ["HEARTBEAT", "ATTITUDE"]
+        assert messages[1].time_boot_ms == 200
+        assert reader.get_counts()["bad_bytes"] >= len(corrupted) + 3
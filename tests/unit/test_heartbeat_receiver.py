@@ -0,0 +1,115 @@
+"""
+Test the heartbeat receiver states.
+"""
+
+import collections
+
+import pytest
+from pymavlink import mavutil
+
+from modules.heartbeat import heartbeat_receiver
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+DISCONNECT_THRESHOLD = 5
+
+
+class FakeLogger:
+    """
+    Logger which drops everything.
+    """
+
+    # Same signature as Logger.info()
+    # pylint: disable-next=unused-argument
+    def info(self, message: str, log_with_frame_info: bool = False) -> None:
+        """
+        Drops the message.
+        """
+
+    # Same signature as Logger.warning()
+    # pylint: disable-next=unused-argument
+    def warning(self, message: str, log_with_frame_info: bool = False) -> None:
+        """
+        Drops the message.
+        """
+
+
+class FakeConnection:
+    """
+    Connection which receives a heartbeat in each period marked True.
+    """
+
+    def __init__(self, periods: "list[bool]") -> None:
+        self.periods = collections.deque(periods)
+
+    # Same signature as mavutil.mavfile.recv_match()
+    # pylint: disable-next=unused-argument,redefined-builtin
+    def recv_match(self, type: "str | None" = None) -> "object | None":
+        """
+        Heartbeat if one arrives this period, otherwise None.
+        """
+        if len(self.periods) == 0 or not self.periods.popleft():
+            return None
+
+        return mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 4, 3)
+
+
+@pytest.fixture()
+def fake_logger() -> FakeLogger:
+    """
+    Logger for the receiver.
+    """
+    return FakeLogger()
+
+
+def run_periods(periods: "list[bool]", local_logger: FakeLogger) -> "list[str]":
+    """
+    Runs the receiver once per period, returns the state of each.
+    """
+    result, receiver = heartbeat_receiver.HeartbeatReceiver.create(
+        FakeConnection(periods), local_logger
+    )
+    assert result
+    assert receiver is not None
+
+    return [receiver.run() for _ in periods]
+
+
+class TestHeartbeatReceiver:
+    """
+    Connection states from startup.
+    """
+
+    def test_startup(self, fake_logger: FakeLogger) -> None:
+        """
+        No heartbeat yet is Unknown until the threshold, not Disconnected.
+        """
+        # Run
+        states = run_periods([False] * (DISCONNECT_THRESHOLD - 1) + [True], fake_logger)
+
+        # Test
+        assert states == ["Unknown"] * (DISCONNECT_THRESHOLD - 1) + ["Connected"]
+
+    def test_never_connected(self, fake_logger: FakeLogger) -> None:
+        """
+        Disconnected once the threshold passes without any heartbeat.
+        """
+        # Run
+        states = run_periods([False] * (DISCONNECT_THRESHOLD + 1), fake_logger)
+
+        # Test
+        assert states == ["Unknown"] * (DISCONNECT_THRESHOLD - 1) + ["Disconnected"] * 2
+
+    def test_lost(self, fake_logger: FakeLogger) -> None:
+        """
+        Disconnected once the heartbeats stop for the threshold after connecting.
+        """
+        # Run
+        states = run_periods([True] + [False] * DISCONNECT_THRESHOLD + [True], fake_logger)
+
+        # Test
+        assert states == ["Connected"] * DISCONNECT_THRESHOLD + ["Disconnected", "Connected"]
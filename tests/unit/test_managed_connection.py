@@ -0,0 +1,184 @@
+"""
+Test reconnecting the MAVLink connection.
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from modules.mavlink_io import managed_connection
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+class FakeDrone:
+    """
+    TCP server which sends a heartbeat to each client, then keeps the client until dropped.
+    """
+
+    def __init__(self) -> None:
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.clients: "list[socket.socket]" = []
+        self.heartbeat = mavutil.mavlink.MAVLink(None, srcSystem=1).heartbeat_encode(
+            mavutil.mavlink.MAV_TYPE_QUADROTOR,
+            mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+            0,
+            0,
+            mavutil.mavlink.MAV_STATE_ACTIVE,
+        )
+        self.thread = threading.Thread(target=self.__accept, daemon=True)
+        self.thread.start()
+
+    def __accept(self) -> None:
+        """
+        Accepts clients until the server is closed.
+        """
+        encoder = mavutil.mavlink.MAVLink(None, srcSystem=1)
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+
+            client.sendall(self.heartbeat.pack(encoder))
+            self.clients.append(client)
+
+    def drop_clients(self) -> None:
+        """
+        Closes the connection of every client.
+        """
+        for client in self.clients:
+            client.close()
+
+        self.clients.clear()
+
+    def close(self) -> None:
+        """
+        Stops accepting clients.
+        """
+        self.drop_clients()
+        self.server.close()
+
+
+@pytest.fixture()
+def drone() -> FakeDrone:  # type: ignore
+    """
+    Drone on a free local port.
+    """
+    fake_drone = FakeDrone()
+    yield fake_drone  # type: ignore
+    fake_drone.close()
+
+
+def create_connection(port: int) -> managed_connection.ManagedConnection:
+    """
+    Managed connection to the local port with short delays.
+    """
+    result, connection = managed_connection.ManagedConnection.create(
+        f"tcp:127.0.0.1:{port}", handshake_timeout=0.5, backoff_initial=0.01, backoff_max=0.05
+    )
+    assert result
+    assert connection is not None
+
+    return connection
+
+
+def read_until(
+    connection: managed_connection.ManagedConnection, is_connected: bool, timeout: float
+) -> bool:
+    """
+    Reads like the frame reader until the link is up or down.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if connection.is_connected() == is_connected:
+            return True
+
+        if connection.select(0.05):
+            connection.recv(4096)
+
+    return connection.is_connected() == is_connected
+
+
+class TestManagedConnection:
+    """
+    Connecting, detecting failure and reconnecting.
+    """
+
+    def test_create_invalid(self) -> None:
+        """
+        Backoff must be positive and no longer than the longest backoff.
+        """
+        # Run
+        result, connection = managed_connection.ManagedConnection.create(
+            "tcp:127.0.0.1:1", backoff_initial=2.0, backoff_max=1.0
+        )
+
+        # Test
+        assert not result
+        assert connection is None
+
+    def test_connect(self, drone: FakeDrone) -> None:
+        """
+        Connects once the handshake heartbeat arrives, which is not a reconnect.
+        """
+        # Setup
+        connection = create_connection(drone.port)
+
+        # Run
+        is_connected = connection.connect(2.0)
+
+        # Test
+        assert is_connected
+        assert len(connection.get_reconnect_times()) == 0
+        connection.close()
+
+    def test_connect_timeout(self) -> None:
+        """
+        Gives up when nothing is listening.
+        """
+        # Setup
+        unused = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        unused.bind(("127.0.0.1", 0))
+        port = unused.getsockname()[1]
+        unused.close()
+        connection = create_connection(port)
+
+        # Run
+        is_connected = connection.connect(0.2)
+
+        # Test
+        assert not is_connected
+
+    def test_reconnect(self, drone: FakeDrone) -> None:
+        """
+        Dropped link is detected and reconnected, and the reconnect time is recorded.
+        """
+        # Setup
+        connection = create_connection(drone.port)
+        assert connection.connect(2.0)
+
+        # Run
+        drone.drop_clients()
+        is_down = read_until(connection, False, 2.0)
+        connection.write(b"\x00")
+        is_up = read_until(connection, True, 2.0)
+
+        # Test
+        assert is_down
+        assert is_up
+        reconnect_times = connection.get_reconnect_times()
+        assert len(reconnect_times) == 1
+        assert 0.0 < reconnect_times[0] < 2.0
+        assert connection.get_dropped_write_count() == 1
+        connection.close()
@@ -0,0 +1,162 @@
+"""
+Test reading MAVLink messages once and routing them to subscribers.
+"""
+
+import pytest
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import common
+
+from modules.mavlink_io import mavlink_reader
+from utilities.workers import queue_proxy_wrapper
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+class FakeConnection:
+    """
+    Connection which has already received the bytes.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self.mav = mavutil.mavlink.MAVLink(None)
+        self.logfile_raw = None
+        self.__data = data
+
+    # Same signature as mavutil.mavfile.select()
+    # pylint: disable-next=unused-argument
+    def select(self, timeout: float) -> bool:
+        """
+        Whether there is data.
+        """
+        return len(self.__data) > 0
+
+    def recv(self, n: int) -> bytes:
+        """
+        Up to n bytes, empty if there are none.
+        """
+        data = self.__data[:n]
+        self.__data = self.__data[n:]
+        return data
+
+
+@pytest.fixture()
+def messages() -> bytes:
+    """
+    Heartbeat, attitude and position frames from the drone.
+    """
+    encoder = common.MAVLink(None, srcSystem=1)
+    sent = [
+        common.MAVLink_heartbeat_message(2, 3, 0, 0, 4, 3),
+        common.MAVLink_attitude_message(100, 0.1, 0.2, 0.3, 0.0, 0.0, 0.0),
+        common.MAVLink_local_position_ned_message(150, 1.0, 2.0, 3.0, 0.0, 0.0, 0.0),
+        common.MAVLink_attitude_message(200, 0.4, 0.5, 0.6, 0.0, 0.0, 0.0),
+    ]
+    return b"".join(message.pack(encoder) for message in sent)
+
+
+class TestMavlinkReader:
+    """
+    Routing by message type.
+    """
+
+    def test_route_by_type(self, messages: bytes) -> None:
+        """
+        Each subscriber gets every message of its types, in order.
+        """
+        # Setup
+        result, reader = mavlink_reader.MavlinkReader.create(
+            FakeConnection(messages), [["HEARTBEAT"], ["ATTITUDE", "LOCAL_POSITION_NED"]]
+        )
+        assert result
+        assert reader is not None
+        heartbeat_queue = queue_proxy_wrapper.QueueProxyWrapper(None)
+        telemetry_queue = queue_proxy_wrapper.QueueProxyWrapper(None)
+
+        # Run
+        count = reader.run([heartbeat_queue, telemetry_queue], 0.0)
+
+        # Test
+        assert count == 4
+        heartbeats = heartbeat_queue.get_many(10, 0.0)
+        assert [message.get_type() for message in heartbeats] == ["HEARTBEAT"]
+        telemetry = telemetry_queue.get_many(10, 0.0)
+        assert [message.time_boot_ms for message in telemetry] == [100, 150, 200]
+        assert reader.get_message_counts() == {
+            "HEARTBEAT": 1,
+            "ATTITUDE": 2,
+            "LOCAL_POSITION_NED": 1,
+        }
+
+    def test_shared_type(self, messages: bytes) -> None:
+        """
+        Message wanted by 2 subscribers goes to both, unwanted frames are skipped.
+        """
+        # Setup
+        result, reader = mavlink_reader.MavlinkReader.create(
+            FakeConnection(messages), [["ATTITUDE"], ["ATTITUDE"]]
+        )
+        assert result
+        assert reader is not None
+        first = queue_proxy_wrapper.QueueProxyWrapper(None)
+        second = queue_proxy_wrapper.QueueProxyWrapper(None)
+
+        # Run
+        reader.run([first, second], 0.0)
+
+        # Test
+        assert len(first.get_many(10, 0.0)) == 2
+        assert len(second.get_many(10, 0.0)) == 2
+        assert reader.get_frame_counts()["skipped"] == 2
+
+    def test_newest_per_type(self, messages: bytes) -> None:
+        """
+        Conflating subscriber queue keeps the newest message of each type.
+        """
+        # Setup
+        result, reader = mavlink_reader.MavlinkReader.create(
+            FakeConnection(messages), [["ATTITUDE", "LOCAL_POSITION_NED"]]
+        )
+        assert result
+        assert reader is not None
+        telemetry_queue = queue_proxy_wrapper.QueueProxyWrapper(
+            None,
+            mode=queue_proxy_wrapper.QueueMode.CONFLATING,
+            key_function=mavlink_reader.get_message_type,
+        )
+
+        # Run
+        reader.run([telemetry_queue], 0.0)
+
+        # Test
+        telemetry = telemetry_queue.get_many(10, 0.0)
+        assert sorted(message.time_boot_ms for message in telemetry) == [150, 200]
+
+
+class TestMessageSubscription:
+    """
+    Reading routed messages like a connection.
+    """
+
+    def test_recv_match_type(self, messages: bytes) -> None:
+        """
+        Messages of other types are skipped, and None once there are no more.
+        """
+        # Setup
+        input_queue = queue_proxy_wrapper.QueueProxyWrapper(None)
+        input_queue.put_many(common.MAVLink(None).parse_buffer(messages) + [None])
+        subscription = mavlink_reader.MessageSubscription(input_queue)
+
+        # Run
+        first = subscription.recv_match(type="ATTITUDE")
+        second = subscription.recv_match(type=["ATTITUDE"], blocking=False, timeout=0.01)
+        third = subscription.recv_match(type="ATTITUDE", timeout=0.01)
+
+        # Test
+        assert first is not None
+        assert first.time_boot_ms == 100
+        assert second is not None
+        assert second.time_boot_ms == 200
+        assert third is None
@@ -0,0 +1,144 @@
+"""
+Test writing MAVLink messages from a single owner of the connection.
+"""
+
+import pytest
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import common
+
+from modules.mavlink_io import mavlink_writer
+from utilities.workers import queue_proxy_wrapper
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+class FakeConnection:
+    """
+    Connection which records its writes.
+    """
+
+    def __init__(self) -> None:
+        self.mav = common.MAVLink(None, srcSystem=255)
+        self.writes: "list[bytes]" = []
+
+    def write(self, buffer: bytes) -> None:
+        """
+        Records the write.
+        """
+        self.writes.append(buffer)
+
+
+@pytest.fixture()
+def outbound_queue() -> queue_proxy_wrapper.QueueProxyWrapper:  # type: ignore
+    """
+    Input queue of the writer.
+    """
+    yield queue_proxy_wrapper.QueueProxyWrapper(  # type: ignore
+        None,
+        20,
+        mode=queue_proxy_wrapper.QueueMode.PRIORITY,
+        policy=queue_proxy_wrapper.BackpressurePolicy.DROP_OLDEST,
+    )
+
+
+def send_yaw(publisher: mavlink_writer.MessagePublisher, angle: float) -> None:
+    """
+    Sends MAV_CMD_CONDITION_YAW like the command worker.
+    """
+    publisher.mav.command_long_send(
+        1, 0, mavutil.mavlink.MAV_CMD_CONDITION_YAW, 0, angle, 5, 1, 1, 0, 0, 0
+    )
+
+
+def decode(buffer: bytes) -> "list[object]":
+    """
+    Decodes every frame in the buffer.
+    """
+    decoder = common.MAVLink(None)
+    messages = decoder.parse_buffer(buffer)
+    if messages is None:
+        return []
+
+    return messages
+
+
+class TestMavlinkWriter:
+    """
+    Priority, coalescing and batching of writes.
+    """
+
+    def test_heartbeat_first(self, outbound_queue: queue_proxy_wrapper.QueueProxyWrapper) -> None:
+        """
+        Heartbeat queued after a command is written before it, in the same write.
+        """
+        # Setup
+        connection = FakeConnection()
+        publisher = mavlink_writer.MessagePublisher(outbound_queue)
+        result, writer = mavlink_writer.MavlinkWriter.create(connection)
+        assert result
+        assert writer is not None
+        send_yaw(publisher, 10.0)
+        publisher.mav.heartbeat_send(
+            mavutil.mavlink.MAV_TYPE_GCS, mavutil.mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0
+        )
+
+        # Run
+        count = writer.run(outbound_queue, 0.0)
+
+        # Test
+        assert count == 2
+        assert len(connection.writes) == 1
+        messages = decode(connection.writes[0])
+        assert [message.get_type() for message in messages] == ["HEARTBEAT", "COMMAND_LONG"]
+        assert [message.get_seq() for message in messages] == [0, 1]
+        assert messages[0].get_srcSystem() == 255
+
+    def test_coalesce_yaw(self, outbound_queue: queue_proxy_wrapper.QueueProxyWrapper) -> None:
+        """
+        Newer CONDITION_YAW replaces the unsent one, other commands are all sent.
+        """
+        # Setup
+        connection = FakeConnection()
+        publisher = mavlink_writer.MessagePublisher(outbound_queue)
+        result, writer = mavlink_writer.MavlinkWriter.create(connection)
+        assert result
+        assert writer is not None
+        send_yaw(publisher, 10.0)
+        publisher.mav.command_long_send(
+            1, 0, mavutil.mavlink.MAV_CMD_NAV_LAND, 0, 0, 0, 0, 0, 0, 0, 0
+        )
+        send_yaw(publisher, 20.0)
+
+        # Run
+        count = writer.run(outbound_queue, 0.0)
+
+        # Test
+        assert count == 2
+        messages = decode(connection.writes[0])
+        assert [message.command for message in messages] == [
+            mavutil.mavlink.MAV_CMD_CONDITION_YAW,
+            mavutil.mavlink.MAV_CMD_NAV_LAND,
+        ]
+        assert messages[0].param1 == 20.0
+        assert writer.get_counts() == {"written": 2, "coalesced": 1, "writes": 1}
+
+    def test_empty(self, outbound_queue: queue_proxy_wrapper.QueueProxyWrapper) -> None:
+        """
+        Nothing is written without requests.
+        """
+        # Setup
+        connection = FakeConnection()
+        result, writer = mavlink_writer.MavlinkWriter.create(connection)
+        assert result
+        assert writer is not None
+        outbound_queue.put(None)
+
+        # Run
+        count = writer.run(outbound_queue, 0.0)
+
+        # Test
+        assert count == 0
+        assert len(connection.writes) == 0
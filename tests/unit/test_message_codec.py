@@ -0,0 +1,114 @@
+"""
+Test the message codec.
+"""
+
+import pickle
+
+import pytest
+
+from utilities.workers import managed_queues
+from utilities.workers import message_codec
+from utilities.workers import queue_proxy_wrapper
+from utilities.workers import record_layout
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+class Point:
+    """
+    Record for testing.
+    """
+
+    def __init__(self, x: "float | None", y: "float | None", label: "str | None") -> None:
+        self.x = x
+        self.y = y
+        self.label = label
+
+
+POINT_LAYOUT = record_layout.RecordLayout(
+    Point,
+    [
+        ("x", "d"),
+        ("y", "d"),
+        ("label", "8s"),
+    ],
+)
+
+
+@pytest.fixture()
+def codec() -> message_codec.MessageCodec:  # type: ignore
+    """
+    Codec with the point layout registered.
+    """
+    yield message_codec.MessageCodec([POINT_LAYOUT])  # type: ignore
+
+
+class TestCodec:
+    """
+    Encode and decode.
+    """
+
+    def test_record(self, codec: message_codec.MessageCodec) -> None:
+        """
+        Registered record is packed and smaller than its pickle.
+        """
+        # Setup
+        point = Point(1.5, None, "a")
+
+        # Run
+        encoded = codec.encode(point)
+        actual = codec.decode(encoded)
+
+        # Test
+        assert isinstance(actual, Point)
+        assert actual.x == 1.5
+        assert actual.y is None
+        assert actual.label == "a"
+        assert len(encoded) < len(pickle.dumps(point, pickle.HIGHEST_PROTOCOL))  # type: ignore
+
+    def test_string_and_fallback(self, codec: message_codec.MessageCodec) -> None:
+        """
+        Strings and unregistered types survive the round trip.
+        """
+        # Setup
+        messages = ["CHANGING_YAW: 10.0", {"a": [1, 2]}, 3]
+
+        # Run
+        actual = [codec.decode(codec.encode(message)) for message in messages]
+
+        # Test
+        assert actual == messages
+
+    def test_sentinel(self, codec: message_codec.MessageCodec) -> None:
+        """
+        None is kept as the sentinel.
+        """
+        # Test
+        assert codec.encode(None) is None
+        assert codec.decode(None) is None
+
+
+def test_queue_with_codec() -> None:
+    """
+    Items are encoded in the queue and decoded by the wrapper.
+    """
+    # Setup
+    manager = managed_queues.QueueSyncManager()
+    # pylint: disable-next=consider-using-with
+    manager.start()
+    queue = queue_proxy_wrapper.QueueProxyWrapper(
+        manager, 5, codec=message_codec.MessageCodec([POINT_LAYOUT])
+    )
+
+    # Run
+    queue.put_many([Point(1.0, 2.0, "b"), "text"])
+    raw = queue.queue.get_many(1)
+    actual = queue.get_many(5)
+    manager.shutdown()
+
+    # Test
+    assert isinstance(raw[0], bytes)
+    assert actual == ["text"]
@@ -0,0 +1,505 @@
+"""
+Test the queue proxy wrapper.
+"""
+
+import multiprocessing as mp
+import threading
+import time
+
+import pytest
+
+from utilities.workers import managed_queues
+from utilities.workers import queue_proxy_wrapper
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+@pytest.fixture(scope="module")
+def queue_manager() -> managed_queues.QueueSyncManager:  # type: ignore
+    """
+    Manager with batched queues.
+    """
+    manager = managed_queues.QueueSyncManager()
+    # pylint: disable-next=consider-using-with
+    manager.start()
+    yield manager  # type: ignore
+    manager.shutdown()
+
+
+@pytest.fixture(scope="module")
+def sync_manager() -> mp.managers.SyncManager:  # type: ignore
+    """
+    Default manager.
+    """
+    manager = mp.Manager()
+    yield manager  # type: ignore
+    manager.shutdown()
+
+
+class TestBatch:
+    """
+    Batched put and get.
+    """
+
+    def test_managed_round_trip(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Batch goes through the managed queue in order.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 10, batch_size=4)
+        expected = [0, 1, 2, 3]
+
+        # Run
+        count = queue.put_many([0, 1, 2, 3, 4, 5])
+        actual = queue.get_many()
+
+        # Test
+        assert count == 6
+        assert actual == expected
+        assert queue.get_many(10) == [4, 5]
+
+    def test_managed_timeout(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Partial put when full and empty get on timeout.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 2)
+
+        # Run
+        count = queue.put_many([0, 1, 2], timeout=0.01)
+        actual = queue.get_many(5)
+
+        # Test
+        assert count == 2
+        assert actual == [0, 1]
+        assert queue.get_many(5, timeout=0.01) == []
+
+    def test_fallback(self, sync_manager: mp.managers.SyncManager) -> None:
+        """
+        Default manager queue moves items one at a time with the same results.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(sync_manager, 2)
+
+        # Run
+        count = queue.put_many([0, 1, 2], timeout=0.01)
+        actual = queue.get_many(5)
+
+        # Test
+        assert count == 2
+        assert actual == [0, 1]
+        assert queue.get_many(5, timeout=0.01) == []
+
+
+def parity(item: int) -> int:
+    """
+    Conflation key for testing.
+    """
+    return item % 2
+
+
+class TestConflating:
+    """
+    Latest value only.
+    """
+
+    def test_newest_only(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Only the newest item is kept and the rest are counted.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager, 10, mode=queue_proxy_wrapper.QueueMode.CONFLATING
+        )
+
+        # Run
+        queue.put_many([0, 1, 2])
+        queue.put(3, timeout=0.0)
+        actual = queue.get_many(10)
+
+        # Test
+        assert actual == [3]
+        assert queue.get_overwritten_count() == 3
+        assert queue.maxsize == 1
+
+    def test_newest_per_key(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Newest item per key, in order of first put.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager, 10, mode=queue_proxy_wrapper.QueueMode.CONFLATING, key_function=parity
+        )
+
+        # Run
+        queue.put_many([1, 2, 3, 4, 5])
+        actual = queue.get_many(10)
+
+        # Test
+        assert actual == [5, 4]
+        assert queue.get_overwritten_count() == 3
+        assert queue.get_many(10, timeout=0.01) == []
+
+
+class TestBackpressure:
+    """
+    Policies while the queue is full.
+    """
+
+    def test_drop_newest(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        New items are dropped and counted.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager,
+            2,
+            policy=queue_proxy_wrapper.BackpressurePolicy.DROP_NEWEST,
+            instrumented=True,
+        )
+
+        # Run
+        count = queue.put_many([0, 1, 2])
+        is_accepted = queue.put(3)
+        actual = queue.get_many(5)
+        statistics = queue.get_statistics()
+
+        # Test
+        assert count == 2
+        assert not is_accepted
+        assert actual == [0, 1]
+        assert statistics.accepted_count == 2
+        assert statistics.dropped_count == 2
+
+    def test_drop_oldest(self, sync_manager: mp.managers.SyncManager) -> None:
+        """
+        Oldest items make space for new ones.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            sync_manager,
+            2,
+            policy=queue_proxy_wrapper.BackpressurePolicy.DROP_OLDEST,
+            instrumented=True,
+        )
+
+        # Run
+        count = queue.put_many([0, 1, 2, 3])
+        actual = queue.get_many(5)
+        statistics = queue.get_statistics()
+
+        # Test
+        assert count == 4
+        assert actual == [2, 3]
+        assert statistics.accepted_count == 4
+        assert statistics.dropped_count == 2
+
+    def test_block_with_timeout(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Item is dropped after waiting for the policy timeout.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager,
+            1,
+            policy=queue_proxy_wrapper.BackpressurePolicy.BLOCK_WITH_TIMEOUT,
+            policy_timeout=0.05,
+            instrumented=True,
+        )
+
+        # Run
+        queue.put(0)
+        is_accepted = queue.put(1)
+        statistics = queue.get_statistics()
+
+        # Test
+        assert not is_accepted
+        assert statistics.dropped_count == 1
+        assert statistics.blocked_time >= 0.05
+
+    def test_sample(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Every Nth item is kept.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager,
+            10,
+            policy=queue_proxy_wrapper.BackpressurePolicy.SAMPLE,
+            sample_interval=3,
+            instrumented=True,
+        )
+
+        # Run
+        queue.put_many([0, 1, 2, 3])
+        for i in range(4, 7):
+            queue.put(i)
+
+        actual = queue.get_many(10)
+
+        # Test
+        assert actual == [0, 3, 6]
+        assert queue.get_statistics().dropped_count == 4
+
+
+class TestInstrumentation:
+    """
+    Depth, wait and dwell statistics.
+    """
+
+    def test_dwell_and_depth(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Dwell time covers the time between put and get.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 5, instrumented=True)
+
+        # Run
+        queue.put_many([0, 1, 2])
+        time.sleep(0.02)
+        queue.get()
+        statistics = queue.get_statistics()
+
+        # Test
+        assert statistics.depth == 2
+        assert statistics.high_water_depth == 3
+        assert statistics.dequeued_count == 1
+        assert statistics.dwell_time_max >= 0.02
+        assert sum(statistics.dwell_histogram) == 1
+        assert sum(statistics.wait_histogram) == 1
+
+    def test_wait(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Wait time covers a get that timed out.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 5, instrumented=True)
+
+        # Run
+        actual = queue.get_many(timeout=0.02)
+        statistics = queue.get_statistics()
+
+        # Test
+        assert actual == []
+        assert statistics.wait_time >= 0.02
+        assert statistics.dequeued_count == 0
+
+    def test_not_instrumented(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Nothing is counted without instrumentation, and the depths are still reported.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager, 2, policy=queue_proxy_wrapper.BackpressurePolicy.DROP_NEWEST
+        )
+
+        # Run
+        queue.put_many([0, 1, 2])
+        queue.get()
+        statistics = queue.get_statistics()
+
+        # Test
+        assert queue._QueueProxyWrapper__statistics is None
+        assert statistics.accepted_count == 0
+        assert statistics.dropped_count == 0
+        assert statistics.dequeued_count == 0
+        assert sum(statistics.wait_histogram) == 0
+        assert statistics.depth == 1
+        assert statistics.high_water_depth == 2
+
+
+class TestPriority:
+    """
+    Most urgent items first.
+    """
+
+    def test_urgent_first(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Critical item is got ahead of routine items, which keep their order.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager, 5, mode=queue_proxy_wrapper.QueueMode.PRIORITY
+        )
+
+        # Run
+        queue.put_many([0, 1])
+        queue.put(2, priority=queue_proxy_wrapper.PRIORITY_CRITICAL)
+        queue.put(3)
+        actual = queue.get_many(5)
+
+        # Test
+        assert actual == [2, 0, 1, 3]
+
+    def test_sentinel_last(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Sentinels are got after the queued items, and do not evict them when full.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager,
+            3,
+            mode=queue_proxy_wrapper.QueueMode.PRIORITY,
+            policy=queue_proxy_wrapper.BackpressurePolicy.DROP_OLDEST,
+        )
+        queue.put_many([0, 1])
+
+        # Run
+        queue.fill_queue_with_sentinel(0.01)
+        actual = queue.get_many(5, timeout=0.0)
+
+        # Test
+        assert actual == [0, 1, None]
+        assert queue.get_overwritten_count() == 0
+
+    def test_preempt_when_full(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Critical item evicts the oldest routine item instead of blocking.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager,
+            2,
+            mode=queue_proxy_wrapper.QueueMode.PRIORITY,
+            policy=queue_proxy_wrapper.BackpressurePolicy.DROP_NEWEST,
+            instrumented=True,
+        )
+
+        # Run
+        queue.put_many([0, 1, 2])
+        is_accepted = queue.put(3, priority=queue_proxy_wrapper.PRIORITY_CRITICAL)
+        actual = queue.get_many(5)
+
+        # Test
+        assert is_accepted
+        assert actual == [3, 1]
+        assert queue.get_overwritten_count() == 1
+        assert queue.get_statistics().dropped_count == 1
+
+    def test_drop_oldest(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Routine item evicts the oldest routine item, but never a critical one.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager,
+            2,
+            mode=queue_proxy_wrapper.QueueMode.PRIORITY,
+            policy=queue_proxy_wrapper.BackpressurePolicy.DROP_OLDEST,
+        )
+
+        # Run
+        queue.put(0, priority=queue_proxy_wrapper.PRIORITY_CRITICAL)
+        queue.put_many([1, 2, 3])
+        actual = queue.get_many(5)
+
+        # Test
+        assert actual == [0, 3]
+        assert queue.get_overwritten_count() == 2
+
+
+class TestLocal:
+    """
+    Queue local to a process, for threads.
+    """
+
+    def test_round_trip_between_threads(self) -> None:
+        """
+        Batch put by a thread is got in order.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(None, 2, batch_size=4, instrumented=True)
+        producer = threading.Thread(target=queue.put_many, args=([0, 1, 2, 3],))
+
+        # Run
+        producer.start()
+        actual = []
+        while len(actual) < 4:
+            actual += queue.get_many(timeout=1.0)
+
+        producer.join()
+
+        # Test
+        assert actual == [0, 1, 2, 3]
+        assert queue.get_statistics().dequeued_count == 4
+
+    def test_priority(self) -> None:
+        """
+        Local queue supports priority mode.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(
+            None, 5, mode=queue_proxy_wrapper.QueueMode.PRIORITY
+        )
+
+        # Run
+        queue.put_many([0, 1])
+        queue.put(2, priority=queue_proxy_wrapper.PRIORITY_CRITICAL)
+        actual = queue.get_many(5)
+
+        # Test
+        assert actual == [2, 0, 1]
+
+
+class TestOutputBatch:
+    """
+    Batches collected by a producer.
+    """
+
+    def test_full(self) -> None:
+        """
+        Batch is put as soon as it reaches the batch size.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(None, batch_size=3)
+        batch = queue_proxy_wrapper.OutputBatch(queue, 60.0)
+
+        # Run
+        for i in range(4):
+            batch.add(i)
+
+        # Test
+        assert queue.get_many(5, timeout=0.0) == [0, 1, 2]
+        assert len(batch) == 1
+
+    def test_partial_due(self) -> None:
+        """
+        Partial batch is put once its first item has waited the max wait.
+        """
+        # Setup
+        max_wait = 0.05
+        queue = queue_proxy_wrapper.QueueProxyWrapper(None, batch_size=3)
+        batch = queue_proxy_wrapper.OutputBatch(queue, max_wait)
+        batch.add(0)
+        batch.add(1)
+
+        # Run
+        batch.put_if_due()
+        early_items = queue.get_many(5, timeout=0.0)
+        time.sleep(max_wait)
+        batch.put_if_due()
+
+        # Test
+        assert early_items == []
+        assert queue.get_many(5, timeout=0.0) == [0, 1]
+        assert len(batch) == 0
+
+    def test_flush(self) -> None:
+        """
+        Partial batch is put on flush, like a producer which is exiting.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(None, batch_size=3, instrumented=True)
+        batch = queue_proxy_wrapper.OutputBatch(queue, 60.0)
+        batch.add(0)
+
+        # Run
+        batch.flush()
+        batch.flush()
+
+        # Test
+        assert queue.get_many(5, timeout=0.0) == [0]
+        assert queue.get_statistics().accepted_count == 1
@@ -0,0 +1,112 @@
+"""
+Test waiting on several queues.
+"""
+
+import multiprocessing as mp
+import threading
+import time
+
+import pytest
+
+from utilities.workers import managed_queues
+from utilities.workers import queue_doorbell
+from utilities.workers import queue_proxy_wrapper
+from utilities.workers import queue_selector
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+@pytest.fixture(scope="module")
+def queue_manager() -> managed_queues.QueueSyncManager:  # type: ignore
+    """
+    Manager with batched queues.
+    """
+    manager = managed_queues.QueueSyncManager()
+    # pylint: disable-next=consider-using-with
+    manager.start()
+    yield manager  # type: ignore
+    manager.shutdown()
+
+
+def delayed_put(queue: queue_proxy_wrapper.QueueProxyWrapper, delay: float) -> None:
+    """
+    Puts an item after the delay.
+    """
+    time.sleep(delay)
+    queue.put(1)
+
+
+class TestWaitAny:
+    """
+    Select-style wait.
+    """
+
+    def test_ready_order(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Earlier queue is returned first when several are ready.
+        """
+        # Setup
+        first = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 5)
+        second = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 5)
+        first.put(0)
+        second.put(0)
+
+        # Run
+        actual = queue_selector.wait_any([first, second], 0.0)
+
+        # Test
+        assert actual is first
+
+    def test_timeout(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Returns None when nothing arrives in time.
+        """
+        # Setup
+        queue = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 5)
+
+        # Run
+        actual = queue_selector.wait_any([queue], 0.02)
+
+        # Test
+        assert actual is None
+
+    def test_doorbell_from_process(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Put in another process wakes up the wait on a shared doorbell.
+        """
+        # Setup
+        doorbell = queue_doorbell.QueueDoorbell()
+        first = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 5, doorbell=doorbell)
+        second = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 5, doorbell=doorbell)
+        process = mp.Process(target=delayed_put, args=(second, 0.05))
+
+        # Run
+        process.start()
+        actual = queue_selector.wait_any([first, second], 5.0)
+        process.join()
+
+        # Test
+        assert actual is second
+        assert doorbell.get_ring_count() == 1
+
+    def test_polling(self, queue_manager: managed_queues.QueueSyncManager) -> None:
+        """
+        Queues without a shared doorbell are polled.
+        """
+        # Setup
+        first = queue_proxy_wrapper.QueueProxyWrapper(queue_manager, 5)
+        second = queue_proxy_wrapper.QueueProxyWrapper(
+            queue_manager, 5, doorbell=queue_doorbell.QueueDoorbell()
+        )
+        thread = threading.Thread(target=delayed_put, args=(first, 0.05))
+
+        # Run
+        thread.start()
+        actual = queue_selector.wait_any([first, second], 5.0)
+        thread.join()
+
+        # Test
+        assert actual is first
@@ -0,0 +1,177 @@
+"""
+Test capturing MAVLink frames and replaying the capture.
+"""
+
+import pathlib
+import time
+
+import pytest
+from pymavlink import mavutil
+
+from modules.mavlink_io import frame_capture
+from modules.mavlink_io import frame_reader
+from modules.mavlink_io import mavlink_reader
+from modules.mavlink_io import mavlink_writer
+from modules.mavlink_io import replay_connection
+from utilities.workers import queue_proxy_wrapper
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+DRONE_SYSTEM = 1
+# Time between the captured attitudes
+CAPTURE_PERIOD = 0.1  # seconds
+ATTITUDE_COUNT = 5
+
+
+@pytest.fixture()
+def capture_path(tmp_path: pathlib.Path) -> str:
+    """
+    Capture of attitudes from the drone, with a heartbeat from the ground station between them.
+    """
+    path = str(tmp_path / "capture.tlog")
+    result, capture = frame_capture.FrameCapture.create(path)
+    assert result
+    assert capture is not None
+
+    drone = mavutil.mavlink.MAVLink(None, srcSystem=DRONE_SYSTEM)
+    ground_station = mavutil.mavlink.MAVLink(
+        None, srcSystem=replay_connection.GROUND_STATION_SYSTEM
+    )
+    for i in range(ATTITUDE_COUNT):
+        attitude = drone.attitude_encode(i, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        capture.write(attitude.pack(drone), 100.0 + i * CAPTURE_PERIOD)
+        heartbeat = ground_station.heartbeat_encode(6, 8, 0, 0, 4)
+        capture.write(heartbeat.pack(ground_station), 100.0 + i * CAPTURE_PERIOD)
+
+    capture.close()
+    assert capture.get_frame_count() == 2 * ATTITUDE_COUNT
+
+    return path
+
+
+def replay(path: str, speed: float, timeout: float) -> "tuple[list[object], float]":
+    """
+    Routes the replayed attitudes until they are all read or the timeout.
+
+    Returns the attitudes and the time taken.
+    """
+    result, connection = replay_connection.ReplayConnection.create(path, speed)
+    assert result
+    assert connection is not None
+    result, reader = mavlink_reader.MavlinkReader.create(connection, [["ATTITUDE"]])
+    assert result
+    assert reader is not None
+    output_queue = queue_proxy_wrapper.QueueProxyWrapper(None)
+
+    start_time = time.monotonic()
+    assert connection.connect(0.0)
+    messages = []
+    while len(messages) < ATTITUDE_COUNT and time.monotonic() - start_time < timeout:
+        reader.run([output_queue], 0.1)
+        messages += output_queue.get_many(ATTITUDE_COUNT, 0.0)
+
+    return messages, time.monotonic() - start_time
+
+
+class TestFrameCapture:
+    """
+    Writing and finding captured frames.
+    """
+
+    def test_records(self, capture_path: str) -> None:
+        """
+        Every frame is found with its timestamp, and a frame cut off at the end is left out.
+        """
+        # Setup
+        data = pathlib.Path(capture_path).read_bytes()
+
+        # Run
+        records = list(frame_reader.read_capture_records(data[:-3]))
+
+        # Test
+        assert len(records) == 2 * ATTITUDE_COUNT - 1
+        timestamp, message_id, source_system, start, end = records[2]
+        assert timestamp == round((100.0 + CAPTURE_PERIOD) * 1_000_000)
+        assert message_id == mavutil.mavlink.MAVLINK_MSG_ID_ATTITUDE
+        assert source_system == DRONE_SYSTEM
+        message = mavutil.mavlink.MAVLink(None).decode(bytearray(data[start:end]))
+        assert message.time_boot_ms == 1
+
+    def test_capture_written(self, tmp_path: pathlib.Path) -> None:
+        """
+        Frames sent by the writer are captured as sent.
+        """
+        # Setup
+        path = str(tmp_path / "sent.tlog")
+        result, capture = frame_capture.FrameCapture.create(path)
+        assert result
+        assert capture is not None
+        result, connection = replay_connection.ReplayConnection.create(path)
+        assert result
+        assert connection is not None
+        result, writer = mavlink_writer.MavlinkWriter.create(connection, capture)
+        assert result
+        assert writer is not None
+        input_queue = queue_proxy_wrapper.QueueProxyWrapper(
+            None, mode=queue_proxy_wrapper.QueueMode.PRIORITY
+        )
+        mavlink_writer.MessagePublisher(input_queue).mav.heartbeat_send(6, 8, 0, 0, 4)
+
+        # Run
+        writer.run(input_queue, 0.0)
+        capture.close()
+
+        # Test
+        records = list(frame_reader.read_capture_records(pathlib.Path(path).read_bytes()))
+        assert [record[1] for record in records] == [mavutil.mavlink.MAVLINK_MSG_ID_HEARTBEAT]
+        assert connection.get_counts()["writes"] == 1
+
+
+class TestReplayConnection:
+    """
+    Replaying the frames from the drone at a speed.
+    """
+
+    def test_create_invalid(self, capture_path: str) -> None:
+        """
+        Speed must be positive.
+        """
+        # Run
+        result, connection = replay_connection.ReplayConnection.create(capture_path, 0.0)
+
+        # Test
+        assert not result
+        assert connection is None
+
+    def test_as_fast_as_possible(self, capture_path: str) -> None:
+        """
+        Frames from the drone are replayed in order without waiting,
+        and the frames from the ground station are left out.
+        """
+        # Run
+        messages, replay_time = replay(
+            capture_path, replay_connection.AS_FAST_AS_POSSIBLE, timeout=1.0
+        )
+
+        # Test
+        assert [message.time_boot_ms for message in messages] == list(range(ATTITUDE_COUNT))
+        assert replay_time < CAPTURE_PERIOD
+
+    def test_speed(self, capture_path: str) -> None:
+        """
+        Replay at a multiple of the captured rate takes the captured time over the speed.
+        """
+        # Setup
+        speed = 2.0
+        expected_time = (ATTITUDE_COUNT - 1) * CAPTURE_PERIOD / speed
+
+        # Run
+        messages, replay_time = replay(capture_path, speed, timeout=2.0)
+
+        # Test
+        assert len(messages) == ATTITUDE_COUNT
+        assert expected_time <= replay_time < expected_time + 0.15
@@ -0,0 +1,191 @@
+"""
+Test the shared memory ring buffer queue.
+"""
+
+import multiprocessing as mp
+import queue
+
+import pytest
+
+from utilities.workers import record_layout
+from utilities.workers import shared_memory_ring_buffer
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+class Sample:
+    """
+    Record for testing.
+    """
+
+    def __init__(self, count: "int | None", value: "float | None", name: "str | None") -> None:
+        self.count = count
+        self.value = value
+        self.name = name
+
+
+SAMPLE_LAYOUT = record_layout.RecordLayout(
+    Sample,
+    [
+        ("count", "q"),
+        ("value", "d"),
+        ("name", "8s"),
+    ],
+)
+
+
+@pytest.fixture()
+def ring_buffer() -> shared_memory_ring_buffer.SharedMemoryRingBuffer:  # type: ignore
+    """
+    Ring buffer with 3 slots.
+    """
+    buffer = shared_memory_ring_buffer.SharedMemoryRingBuffer(3, SAMPLE_LAYOUT)
+    yield buffer  # type: ignore
+    buffer.close()
+
+
+def producer(buffer: shared_memory_ring_buffer.SharedMemoryRingBuffer, count: int) -> None:
+    """
+    Puts `count` samples and then a sentinel.
+    """
+    for i in range(count):
+        buffer.put(Sample(i, i * 0.5, "child"))
+
+    buffer.put(None)
+
+
+class TestRingBuffer:
+    """
+    Put and get through the ring buffer.
+    """
+
+    def test_round_trip(
+        self, ring_buffer: shared_memory_ring_buffer.SharedMemoryRingBuffer
+    ) -> None:
+        """
+        Record comes out with the same values, including None.
+        """
+        # Setup
+        sample = Sample(7, None, "hi")
+
+        # Run
+        ring_buffer.put(sample)
+        actual = ring_buffer.get()
+
+        # Test
+        assert isinstance(actual, Sample)
+        assert actual.count == 7
+        assert actual.value is None
+        assert actual.name == "hi"
+
+    def test_fifo_order_wraps(
+        self, ring_buffer: shared_memory_ring_buffer.SharedMemoryRingBuffer
+    ) -> None:
+        """
+        Order is kept when the indices wrap around.
+        """
+        # Setup
+        expected = list(range(7))
+
+        # Run
+        actual = []
+        for i in expected:
+            ring_buffer.put(Sample(i, 0.0, ""))
+            actual.append(ring_buffer.get().count)  # type: ignore
+
+        # Test
+        assert actual == expected
+        assert ring_buffer.empty()
+
+    def test_full_and_empty(
+        self, ring_buffer: shared_memory_ring_buffer.SharedMemoryRingBuffer
+    ) -> None:
+        """
+        Raises the same exceptions as a queue.
+        """
+        # Setup
+        with pytest.raises(queue.Empty):
+            ring_buffer.get(timeout=0.01)
+
+        # Run
+        for i in range(3):
+            ring_buffer.put_nowait(Sample(i, 0.0, ""))
+
+        # Test
+        assert ring_buffer.full()
+        assert ring_buffer.qsize() == 3
+        with pytest.raises(queue.Full):
+            ring_buffer.put(Sample(3, 0.0, ""), timeout=0.01)
+
+    def test_sentinel(self, ring_buffer: shared_memory_ring_buffer.SharedMemoryRingBuffer) -> None:
+        """
+        None passes through as the sentinel.
+        """
+        # Run
+        ring_buffer.put(None)
+
+        # Test
+        assert ring_buffer.get() is None
+
+    def test_other_process(
+        self, ring_buffer: shared_memory_ring_buffer.SharedMemoryRingBuffer
+    ) -> None:
+        """
+        Records are handed off from another process.
+        """
+        # Setup
+        process = mp.Process(target=producer, args=(ring_buffer, 10))
+
+        # Run
+        process.start()
+        actual = []
+        while True:
+            sample = ring_buffer.get(timeout=5.0)
+            if sample is None:
+                break
+            actual.append(sample.count)  # type: ignore
+
+        process.join()
+
+        # Test
+        assert actual == list(range(10))
+
+    def test_batch(self, ring_buffer: shared_memory_ring_buffer.SharedMemoryRingBuffer) -> None:
+        """
+        Batch put stops when full and batch get takes what is ready.
+        """
+        # Setup
+        samples = [Sample(i, 0.0, "") for i in range(5)]
+
+        # Run
+        count = ring_buffer.put_many(samples, timeout=0.01)
+        actual = [sample.count for sample in ring_buffer.get_many(2)]  # type: ignore
+
+        # Test
+        assert count == 3
+        assert actual == [0, 1]
+        assert ring_buffer.get_many(5, timeout=0.01)[0].count == 2  # type: ignore
+        assert ring_buffer.get_many(5, timeout=0.01) == []
+
+
+def test_overwrite() -> None:
+    """
+    Full buffer replaces the oldest item without blocking.
+    """
+    # Setup
+    ring_buffer = shared_memory_ring_buffer.SharedMemoryRingBuffer(2, SAMPLE_LAYOUT, True)
+
+    # Run
+    for i in range(5):
+        ring_buffer.put(Sample(i, 0.0, ""), timeout=0.0)
+
+    actual = [sample.count for sample in ring_buffer.get_many(5)]  # type: ignore
+    overwritten = ring_buffer.get_overwritten_count()
+    ring_buffer.close()
+
+    # Test
+    assert actual == [3, 4]
+    assert overwritten == 3
@@ -0,0 +1,111 @@
+"""
+Test the thread and coroutine workers.
+"""
+
+import asyncio
+import multiprocessing.connection
+import signal
+
+import pytest
+
+from utilities.workers import worker_backends
+from utilities.workers import worker_controller
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+@pytest.fixture()
+def controller() -> worker_controller.WorkerController:  # type: ignore
+    """
+    New controller.
+    """
+    yield worker_controller.WorkerController()  # type: ignore
+
+
+def crashing_worker(controller: worker_controller.WorkerController) -> None:
+    """
+    Raises once exit is requested.
+    """
+    controller.wait_for_exit()
+    raise RuntimeError("Crashed on purpose")
+
+
+async def waiting_worker(controller: worker_controller.WorkerController) -> None:
+    """
+    Loops on long waits until exit is requested.
+    """
+    while not controller.is_exit_requested():
+        await controller.check_pause_async()
+        await controller.wait_async(60.0)
+
+
+async def stuck_worker() -> None:
+    """
+    Never checks the controller.
+    """
+    await asyncio.sleep(60.0)
+
+
+class TestThreadWorker:
+    """
+    Worker on a thread of main.
+    """
+
+    def test_crash(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Raising is a non-zero exit code and makes the sentinel ready.
+        """
+        # Setup
+        worker = worker_backends.ThreadWorker(crashing_worker, (controller,))
+        worker.start()
+
+        # Run
+        is_alive = worker.is_alive()
+        controller.request_exit()
+        ready = multiprocessing.connection.wait([worker.sentinel], 5.0)
+
+        # Test
+        assert is_alive
+        assert ready == [worker.sentinel]
+        assert not worker.is_alive()
+        assert worker.exitcode == 1
+
+
+class TestCoroutineWorker:
+    """
+    Worker on the shared event loop.
+    """
+
+    def test_exit(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Waiting coroutine returns on the exit request.
+        """
+        # Setup
+        worker = worker_backends.CoroutineWorker(waiting_worker, (controller,))
+        worker.start()
+
+        # Run
+        controller.request_exit()
+        worker.join(5.0)
+
+        # Test
+        assert worker.exitcode == 0
+
+    def test_terminate(self) -> None:
+        """
+        Terminate cancels a coroutine which does not check the controller.
+        """
+        # Setup
+        worker = worker_backends.CoroutineWorker(stuck_worker, ())
+        worker.start()
+
+        # Run
+        is_forced = worker.terminate()
+        worker.join(5.0)
+
+        # Test
+        assert is_forced
+        assert worker.exitcode == -signal.SIGTERM
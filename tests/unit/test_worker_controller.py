@@ -0,0 +1,198 @@
+"""
+Test the worker controller.
+"""
+
+import multiprocessing as mp
+import time
+
+import pytest
+
+from utilities.workers import worker_controller
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+@pytest.fixture()
+def controller() -> worker_controller.WorkerController:  # type: ignore
+    """
+    New controller.
+    """
+    yield worker_controller.WorkerController()  # type: ignore
+
+
+def counting_worker(
+    counter: "mp.sharedctypes.Synchronized", controller: worker_controller.WorkerController
+) -> None:
+    """
+    Counts loop iterations until exit is requested.
+    """
+    while not controller.is_exit_requested():
+        controller.check_pause()
+        with counter.get_lock():
+            counter.value += 1
+
+
+def exit_waiting_worker(
+    latency: "mp.sharedctypes.Synchronized", controller: worker_controller.WorkerController
+) -> None:
+    """
+    Measures the time from the exit request until it wakes up.
+    """
+    controller.wait_for_exit()
+    latency.value = time.monotonic() - latency.value
+
+
+class TestController:
+    """
+    Exit and pause requests.
+    """
+
+    def test_exit_flag(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Exit request is set and cleared.
+        """
+        # Run
+        controller.request_exit()
+        is_requested = controller.is_exit_requested()
+        controller.clear_exit()
+
+        # Test
+        assert is_requested
+        assert not controller.is_exit_requested()
+        assert not controller.wait_for_exit(0.01)
+
+    def test_pause_and_exit(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Paused worker stops counting and exits after resuming.
+        """
+        # Setup
+        counter = mp.Value("q", 0)
+        process = mp.Process(target=counting_worker, args=(counter, controller))
+        process.start()
+        time.sleep(0.05)
+
+        # Run
+        controller.request_pause()
+        time.sleep(0.05)
+        paused_count = counter.value
+        time.sleep(0.05)
+        still_paused_count = counter.value
+        controller.request_resume()
+        controller.request_exit()
+        process.join(5.0)
+
+        # Test
+        assert paused_count > 0
+        assert still_paused_count == paused_count
+        assert process.exitcode == 0
+
+    def test_wait_for_exit(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Waiting worker wakes up promptly on the request.
+        """
+        # Setup
+        latency = mp.Value("d", 0.0)
+        process = mp.Process(target=exit_waiting_worker, args=(latency, controller))
+        process.start()
+        time.sleep(0.05)
+
+        # Run
+        latency.value = time.monotonic()
+        controller.request_exit()
+        process.join(5.0)
+
+        # Test
+        assert process.exitcode == 0
+        assert latency.value < 0.05
+
+
+def wait_until_exit(controller: worker_controller.WorkerController) -> None:
+    """
+    Loops on long waits until exit is requested.
+    """
+    while not controller.is_exit_requested():
+        controller.check_pause()
+        controller.wait(60.0)
+
+
+class TestWait:
+    """
+    Interruptible waits.
+    """
+
+    def test_timeout(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Sleeps for the full time without requests.
+        """
+        # Run
+        start_time = time.monotonic()
+        is_interrupted = controller.wait(0.02)
+
+        # Test
+        assert not is_interrupted
+        assert time.monotonic() - start_time >= 0.02
+
+    def test_exit_interrupts(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Worker in a long wait exits promptly, even while paused.
+        """
+        # Setup
+        process = mp.Process(target=wait_until_exit, args=(controller,))
+        process.start()
+        time.sleep(0.05)
+        controller.request_pause()
+        time.sleep(0.05)
+
+        # Run
+        start_time = time.monotonic()
+        controller.request_exit()
+        process.join(5.0)
+        stop_time = time.monotonic() - start_time
+
+        # Test
+        assert process.exitcode == 0
+        assert stop_time < 0.5
+
+
+class TestWorkerController:
+    """
+    Controller of a single worker.
+    """
+
+    def test_stop_single_worker(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Stop request only exits its own worker, group requests reach both.
+        """
+        # Setup
+        first = controller.create_worker_controller()
+        second = controller.create_worker_controller()
+
+        # Run
+        first.request_stop()
+        is_first_stopped = first.is_exit_requested()
+        is_second_stopped = second.is_exit_requested()
+        controller.request_exit()
+
+        # Test
+        assert is_first_stopped
+        assert not is_second_stopped
+        assert second.is_exit_requested()
+        assert not controller.is_stop_requested()
+
+    def test_loop_count(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Each pause check of the worker counts as a loop iteration.
+        """
+        # Setup
+        worker = controller.create_worker_controller()
+
+        # Run
+        for _ in range(3):
+            worker.check_pause()
+
+        # Test
+        assert worker.get_loop_count() == 3
+        assert controller.get_loop_count() == 0
@@ -0,0 +1,698 @@
+"""
+Test the worker manager.
+"""
+
+import gc
+import multiprocessing as mp
+import multiprocessing.forkserver
+import queue
+import signal
+import threading
+import time
+
+import pytest
+
+from utilities.workers import queue_proxy_wrapper
+from utilities.workers import worker_backends
+from utilities.workers import worker_controller
+from utilities.workers import worker_manager
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+# CPU time the busy worker uses
+BUSY_TIME = 0.3  # seconds
+# The clock ticks of /proc are coarser than the thread time
+CPU_TIME_TOLERANCE = 0.02  # seconds
+
+
+class FakeLogger:
+    """
+    Logger which keeps the errors and drops everything else.
+    """
+
+    def __init__(self) -> None:
+        self.errors = []
+
+    # Same signature as Logger.info()
+    # pylint: disable-next=unused-argument
+    def info(self, message: str, log_with_frame_info: bool = False) -> None:
+        """
+        Drops the message.
+        """
+
+    # Same signature as Logger.warning()
+    # pylint: disable-next=unused-argument
+    def warning(self, message: str, log_with_frame_info: bool = False) -> None:
+        """
+        Drops the message.
+        """
+
+    # Same signature as Logger.error()
+    # pylint: disable-next=unused-argument
+    def error(self, message: str, log_with_frame_info: bool = False) -> None:
+        """
+        Keeps the message.
+        """
+        self.errors.append(message)
+
+
+@pytest.fixture()
+def fake_logger() -> FakeLogger:
+    """
+    Logger for the managers.
+    """
+    return FakeLogger()
+
+
+@pytest.fixture()
+def controller() -> worker_controller.WorkerController:  # type: ignore
+    """
+    Controller of the workers, which are requested to exit afterwards.
+    """
+    controller = worker_controller.WorkerController()
+    yield controller  # type: ignore
+    controller.request_exit()
+
+
+@pytest.fixture()
+def start_method() -> str:  # type: ignore
+    """
+    Start method before the test, restored afterwards along with the collector.
+    """
+    method = mp.get_start_method()
+    yield method  # type: ignore
+    mp.set_start_method(method, force=True)
+    mp.set_forkserver_preload([])
+    gc.unfreeze()
+    worker_manager.WorkerManager._WorkerManager__is_gc_frozen = False
+
+
+def busy_worker(controller: worker_controller.WorkerController) -> None:
+    """
+    Uses CPU time, then waits until exit is requested.
+    """
+    start_time = time.thread_time()
+    while time.thread_time() - start_time < BUSY_TIME:
+        pass
+
+    controller.wait_for_exit()
+
+
+def idle_worker(controller: worker_controller.WorkerController) -> None:
+    """
+    Waits until exit is requested.
+    """
+    controller.wait_for_exit()
+
+
+# Same signature as the other workers
+# pylint: disable-next=unused-argument
+def unresponsive_worker(controller: worker_controller.WorkerController) -> None:
+    """
+    Ignores the exit request, like a worker stuck in a call.
+    """
+    while True:
+        time.sleep(1.0)
+
+
+def blocked_worker(
+    release: threading.Event,
+    # Same signature as the other workers
+    # pylint: disable-next=unused-argument
+    controller: worker_controller.WorkerController,
+) -> None:
+    """
+    Ignores the exit request until released, like a thread stuck in a call.
+    """
+    release.wait()
+
+
+def sigterm_ignoring_worker(controller: worker_controller.WorkerController) -> None:
+    """
+    Ignores the exit request and SIGTERM.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    unresponsive_worker(controller)
+
+
+def stalled_consumer_worker(
+    # Same signature as the other consumers
+    # pylint: disable-next=unused-argument
+    input_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    controller: worker_controller.WorkerController,
+) -> None:
+    """
+    Never gets from its input queue, like a consumer stuck on a slow item.
+    """
+    controller.wait_for_exit()
+
+
+def waiting_consumer_worker(
+    input_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    controller: worker_controller.WorkerController,
+) -> None:
+    """
+    Waits for items which never come until exit is requested.
+    """
+    while not controller.is_exit_requested():
+        try:
+            input_queue.get(timeout=0.01)
+        except queue.Empty:
+            pass
+
+
+def crashing_worker(controller: worker_controller.WorkerController) -> None:
+    """
+    Crashes as soon as it starts.
+    """
+    raise RuntimeError(f"Crashed on purpose, exit requested: {controller.is_exit_requested()}")
+
+
+def crash_once_worker(
+    run_count: "list[int]", controller: worker_controller.WorkerController
+) -> None:
+    """
+    Crashes the first time it runs, after that waits until exit is requested.
+
+    run_count: Number of times any worker ran, shared by the thread workers.
+    """
+    run_count[0] += 1
+    if run_count[0] == 1:
+        raise RuntimeError("Crashed on purpose")
+
+    controller.wait_for_exit()
+
+
+def create_manager(
+    target: "(...) -> object",  # type: ignore
+    controller: worker_controller.WorkerController,
+    local_logger: FakeLogger,
+    work_arguments: "tuple" = (),
+    count: int = 1,
+    min_count: "int | None" = None,
+    max_count: "int | None" = None,
+    backend: worker_backends.WorkerBackend = worker_backends.WorkerBackend.THREAD,
+    input_queues: "list[queue_proxy_wrapper.QueueProxyWrapper] | None" = None,
+) -> worker_manager.WorkerManager:
+    """
+    Manager of workers with no output queues.
+    """
+    if input_queues is None:
+        input_queues = []
+
+    result, properties = worker_manager.WorkerProperties.create(
+        count,
+        target,
+        work_arguments,
+        input_queues,
+        [],
+        controller,
+        local_logger,
+        min_count,
+        max_count,
+        backend=backend,
+    )
+    assert result
+    assert properties is not None
+
+    result, manager = worker_manager.WorkerManager.create(properties, local_logger)
+    assert result
+    assert manager is not None
+
+    return manager
+
+
+class TestStartMethod:
+    """
+    How worker processes are started.
+    """
+
+    def test_forkserver(self, start_method: str) -> None:
+        """
+        Forkserver preloads the modules, and then the worker preload last.
+        """
+        # Run
+        worker_manager.configure_start_method("forkserver", ["modules.telemetry.telemetry"])
+
+        # Test
+        assert start_method is not None
+        assert mp.get_start_method() == "forkserver"
+        assert multiprocessing.forkserver._forkserver._preload_modules == [
+            "modules.telemetry.telemetry",
+            worker_manager.WORKER_PRELOAD_MODULE,
+        ]
+
+    def test_fork_freezes_once(
+        self,
+        start_method: str,
+        controller: worker_controller.WorkerController,
+        fake_logger: FakeLogger,
+    ) -> None:
+        """
+        Objects of main are frozen before the first fork only, and not for thread workers.
+        """
+        # Setup
+        assert start_method is not None
+        worker_manager.configure_start_method("fork")
+        gc.unfreeze()
+        worker_manager.WorkerManager._WorkerManager__is_gc_frozen = False
+        thread_manager = create_manager(idle_worker, controller, fake_logger)
+        process_manager = create_manager(
+            idle_worker, controller, fake_logger, backend=worker_backends.WorkerBackend.PROCESS
+        )
+
+        # Run
+        thread_manager.start_workers()
+        thread_freeze_count = gc.get_freeze_count()
+        process_manager.start_workers()
+        freeze_count = gc.get_freeze_count()
+        # Created after the first fork, so must stay collectable
+        objects = [[i] for i in range(1000)]
+        # Forking is only safe once no thread worker runs
+        thread_manager._WorkerManager__controllers[0].request_stop()
+        thread_manager.get_workers()[0].join(5.0)
+        is_restarted = process_manager.restart_worker(0)
+
+        # Test
+        assert thread_freeze_count == 0
+        assert freeze_count > 0
+        assert is_restarted
+        # Frozen objects can still be freed, but nothing new was frozen
+        assert gc.get_freeze_count() <= freeze_count
+        assert len(objects) == 1000
+        controller.request_exit()
+        assert process_manager.join_workers(5.0)
+
+
+class TestResourceSamples:
+    """
+    Resource usage of each worker.
+    """
+
+    def test_thread_workers(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Thread workers report the CPU time of their own thread, not of main.
+        """
+        # Setup
+        busy_manager = create_manager(busy_worker, controller, fake_logger)
+        idle_manager = create_manager(idle_worker, controller, fake_logger)
+        idle_manager.start_workers()
+        busy_manager.start_workers()
+        deadline = time.monotonic() + 5.0
+        while time.monotonic() < deadline:
+            busy_samples = busy_manager.get_resource_samples()
+            if (
+                busy_samples[0] is not None
+                and busy_samples[0].cpu_time >= BUSY_TIME - CPU_TIME_TOLERANCE
+            ):
+                break
+
+            time.sleep(0.01)
+
+        # Run
+        busy_samples = busy_manager.get_resource_samples()
+        idle_samples = idle_manager.get_resource_samples()
+
+        # Test
+        assert busy_samples[0] is not None
+        assert idle_samples[0] is not None
+        assert busy_samples[0].cpu_time >= BUSY_TIME - CPU_TIME_TOLERANCE
+        assert idle_samples[0].cpu_time < BUSY_TIME / 2
+
+
+def create_supervisor(
+    manager: worker_manager.WorkerManager,
+    controller: worker_controller.WorkerController,
+    local_logger: FakeLogger,
+    backoff_initial: float,
+    backoff_max: float,
+    crash_loop_count: int = 5,
+) -> worker_manager.WorkerSupervisor:
+    """
+    Supervisor of the manager.
+    """
+    result, supervisor = worker_manager.WorkerSupervisor.create(
+        [manager], controller, local_logger, backoff_initial, backoff_max, crash_loop_count
+    )
+    assert result
+    assert supervisor is not None
+
+    return supervisor
+
+
+class TestWorkerSupervisor:
+    """
+    Restarting crashed workers.
+    """
+
+    def test_restart(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Crashed worker is replaced after the backoff, before supervise returns.
+        """
+        # Setup
+        backoff = 0.05
+        manager = create_manager(crash_once_worker, controller, fake_logger, ([0],))
+        supervisor = create_supervisor(manager, controller, fake_logger, backoff, backoff)
+        crashed_worker = manager.get_workers()[0]
+        manager.start_workers()
+        crashed_worker.join(5.0)
+
+        # Run
+        restart_count = supervisor.supervise(5.0)
+
+        # Test
+        assert restart_count == 1
+        assert crashed_worker.exitcode == 1
+        new_worker = manager.get_workers()[0]
+        assert new_worker is not crashed_worker
+        assert new_worker.is_alive()
+        latencies = supervisor.get_restart_latencies()
+        assert len(latencies) == 1
+        assert backoff <= latencies[0] < backoff + 0.5
+
+    def test_backoff(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Backoff doubles with each recent crash up to the max, and resets once crashes are old.
+        """
+        # Setup
+        manager = create_manager(idle_worker, controller, fake_logger)
+        supervisor = create_supervisor(manager, controller, fake_logger, 0.1, 0.5, 10)
+        worker = manager.get_workers()[0]
+        crash_times = []
+
+        # Run
+        backoffs = [
+            supervisor._WorkerSupervisor__handle_crash(0, worker, crash_times, float(i))
+            for i in range(5)
+        ]
+        # After the crash loop period
+        later_backoff = supervisor._WorkerSupervisor__handle_crash(0, worker, crash_times, 100.0)
+
+        # Test
+        assert backoffs == pytest.approx([0.1, 0.2, 0.4, 0.5, 0.5])
+        assert later_backoff == pytest.approx(0.1)
+
+    def test_crash_loop(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Worker which keeps crashing is not restarted once it crashed the crash loop count.
+        """
+        # Setup
+        crash_loop_count = 3
+        manager = create_manager(crashing_worker, controller, fake_logger)
+        supervisor = create_supervisor(manager, controller, fake_logger, 0.0, 0.0, crash_loop_count)
+        manager.start_workers()
+
+        # Run
+        restart_counts = [supervisor.supervise(0.5) for _ in range(crash_loop_count + 1)]
+
+        # Test
+        assert restart_counts == [1] * (crash_loop_count - 1) + [0, 0]
+        assert not manager.get_workers()[0].is_alive()
+        assert len(fake_logger.errors) == 1
+        assert f"crashed {crash_loop_count} times" in fake_logger.errors[0]
+
+
+class TestScaleTo:
+    """
+    Resizing at runtime.
+    """
+
+    def test_bounds(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Counts outside the min and max are rejected and change nothing.
+        """
+        # Setup
+        manager = create_manager(
+            idle_worker, controller, fake_logger, count=2, min_count=1, max_count=3
+        )
+        manager.start_workers()
+
+        # Run
+        results = [manager.scale_to(0), manager.scale_to(4)]
+
+        # Test
+        assert results == [False, False]
+        assert len(fake_logger.errors) == 2
+        assert manager.get_active_worker_count() == 2
+        assert len(manager.get_workers()) == 2
+
+    def test_scale_down(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Surplus workers are stopped, and left out once they have exited.
+        """
+        # Setup
+        manager = create_manager(
+            idle_worker, controller, fake_logger, count=3, min_count=1, max_count=3
+        )
+        manager.start_workers()
+        workers = manager.get_workers()
+
+        # Run
+        result = manager.scale_to(1)
+        for worker in workers[1:]:
+            worker.join(5.0)
+
+        # Test
+        assert result
+        assert manager.get_active_worker_count() == 1
+        assert manager.get_workers() == workers[:1]
+        assert workers[0].is_alive()
+        samples = manager.get_resource_samples()
+        assert len(samples) == 1
+        assert samples[0] is not None
+
+    def test_scale_up(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        New workers are started after the removed workers have exited.
+        """
+        # Setup
+        manager = create_manager(
+            idle_worker, controller, fake_logger, count=2, min_count=1, max_count=3
+        )
+        manager.start_workers()
+        workers = manager.get_workers()
+        assert manager.scale_to(1)
+
+        # Run
+        result = manager.scale_to(3)
+
+        # Test
+        assert result
+        assert not workers[1].is_alive()
+        new_workers = manager.get_workers()
+        assert len(new_workers) == 3
+        assert new_workers[0] is workers[0]
+        assert all(worker.is_alive() for worker in new_workers)
+        assert manager.get_active_worker_count() == 3
+
+
+class TestForkSafety:
+    """
+    Forking worker processes while thread workers run in main.
+    """
+
+    def test_refused_while_threads_run(
+        self,
+        start_method: str,
+        controller: worker_controller.WorkerController,
+        fake_logger: FakeLogger,
+    ) -> None:
+        """
+        Under fork, worker processes are not restarted or added while a thread worker runs.
+        """
+        # Setup
+        assert start_method is not None
+        worker_manager.configure_start_method("fork")
+        process_manager = create_manager(
+            idle_worker,
+            controller,
+            fake_logger,
+            max_count=2,
+            backend=worker_backends.WorkerBackend.PROCESS,
+        )
+        thread_manager = create_manager(idle_worker, controller, fake_logger)
+        assert worker_manager.start_workers([thread_manager, process_manager], 5.0)
+        workers = process_manager.get_workers()
+
+        # Run
+        is_restarted = process_manager.restart_worker(0)
+        is_scaled = process_manager.scale_to(2)
+
+        # Test
+        assert not is_restarted
+        assert not is_scaled
+        assert process_manager.get_workers() == workers
+        assert workers[0].is_alive()
+        assert fake_logger.errors[0].startswith("Not restarting idle_worker")
+        assert fake_logger.errors[1].startswith("Not adding a worker to idle_worker")
+
+
+class TestAutoscale:
+    """
+    Scaling with the load on the input queues.
+    """
+
+    def test_scale_up(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Workers are added while the input queue has a backlog, up to the max.
+        """
+        # Setup
+        input_queue = queue_proxy_wrapper.QueueProxyWrapper(None, 4)
+        for i in range(3):
+            input_queue.put(i)
+
+        manager = create_manager(
+            stalled_consumer_worker,
+            controller,
+            fake_logger,
+            count=1,
+            max_count=2,
+            input_queues=[input_queue],
+        )
+        manager.start_workers()
+
+        # Run
+        changes = [manager.autoscale(), manager.autoscale()]
+
+        # Test
+        assert changes == [1, 0]
+        workers = manager.get_workers()
+        assert len(workers) == 2
+        assert all(worker.is_alive() for worker in workers)
+
+    def test_scale_down(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Workers are removed while the consumers mostly wait for items, down to the min.
+        """
+        # Setup
+        input_queue = queue_proxy_wrapper.QueueProxyWrapper(None, 4, instrumented=True)
+        manager = create_manager(
+            waiting_consumer_worker,
+            controller,
+            fake_logger,
+            count=2,
+            min_count=1,
+            input_queues=[input_queue],
+        )
+        manager.start_workers()
+        removed_worker = manager.get_workers()[1]
+        # No wait times to compare with yet
+        first_change = manager.autoscale()
+
+        # Run
+        time.sleep(0.2)
+        scale_down_change = manager.autoscale()
+        removed_worker.join(5.0)
+        time.sleep(0.2)
+        min_change = manager.autoscale()
+
+        # Test
+        assert first_change == 0
+        assert scale_down_change == -1
+        assert min_change == 0
+        workers = manager.get_workers()
+        assert len(workers) == 1
+        assert removed_worker not in workers
+
+
+class TestStopWorkers:
+    """
+    Stopping workers, escalating to signals.
+    """
+
+    def test_escalation(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Workers which ignore the exit request are sent SIGTERM after the timeout,
+        and those which also ignore SIGTERM are sent SIGKILL after the terminate timeout.
+        """
+        # Setup
+        timeout = 0.2
+        terminate_timeout = 0.3
+        managers = [
+            create_manager(
+                target, controller, fake_logger, backend=worker_backends.WorkerBackend.PROCESS
+            )
+            for target in (idle_worker, unresponsive_worker, sigterm_ignoring_worker)
+        ]
+        assert worker_manager.start_workers(managers, 5.0)
+        workers = [manager.get_workers()[0] for manager in managers]
+
+        # Run
+        is_stopped, stop_times = worker_manager.stop_workers(
+            controller, managers, [], timeout, terminate_timeout
+        )
+
+        # Test
+        assert is_stopped
+        assert [stop_time.phase for stop_time in stop_times] == [
+            worker_manager.StopPhase.EXIT_REQUEST,
+            worker_manager.StopPhase.TERMINATE,
+            worker_manager.StopPhase.KILL,
+        ]
+        assert [stop_time.name for stop_time in stop_times] == [
+            f"{manager.get_target_name()} {worker.name}"
+            for manager, worker in zip(managers, workers)
+        ]
+        assert stop_times[0].stop_time < timeout
+        assert timeout <= stop_times[1].stop_time < timeout + terminate_timeout
+        assert (
+            timeout + terminate_timeout <= stop_times[2].stop_time < timeout + 2 * terminate_timeout
+        )
+        assert [worker.exitcode for worker in workers] == [0, -signal.SIGTERM, -signal.SIGKILL]
+
+    def test_thread_not_forced(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Thread workers which ignore the exit request are reported as still running
+        at the first signal, instead of waiting for them until SIGKILL.
+        """
+        # Setup
+        timeout = 0.2
+        terminate_timeout = 0.3
+        release = threading.Event()
+        manager = create_manager(blocked_worker, controller, fake_logger, (release,))
+        assert worker_manager.start_workers([manager], 5.0)
+        worker = manager.get_workers()[0]
+
+        # Run
+        is_stopped, stop_times = worker_manager.stop_workers(
+            controller, [manager], [], timeout, terminate_timeout
+        )
+        is_alive = worker.is_alive()
+        release.set()
+        worker.join(5.0)
+
+        # Test
+        assert not is_stopped
+        assert is_alive
+        assert len(stop_times) == 1
+        assert stop_times[0].name == f"blocked_worker {worker.name}"
+        assert stop_times[0].phase == worker_manager.StopPhase.TERMINATE
+        assert not stop_times[0].is_stopped
+        assert timeout <= stop_times[0].stop_time < timeout + terminate_timeout
+        assert str(stop_times[0]).startswith(f"blocked_worker {worker.name} is still running")
@@ -0,0 +1,342 @@
+"""
+Test the pipeline of worker stages.
+"""
+
+import threading
+
+import pytest
+
+from utilities.workers import queue_proxy_wrapper
+from utilities.workers import worker_controller
+from utilities.workers import worker_pipeline
+from utilities.workers import worker_scheduling
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+ITEM_COUNT = 3
+
+
+class FakeLogger:
+    """
+    Logger which keeps the errors and drops everything else.
+    """
+
+    def __init__(self) -> None:
+        self.errors = []
+
+    # Same signature as Logger.error()
+    # pylint: disable-next=unused-argument
+    def error(self, message: str, log_with_frame_info: bool = False) -> None:
+        """
+        Keeps the message.
+        """
+        self.errors.append(message)
+
+
+@pytest.fixture()
+def fake_logger() -> FakeLogger:
+    """
+    Logger for the pipeline.
+    """
+    return FakeLogger()
+
+
+@pytest.fixture()
+def controller() -> worker_controller.WorkerController:  # type: ignore
+    """
+    Controller of the workers, which are requested to exit afterwards.
+    """
+    controller = worker_controller.WorkerController()
+    yield controller  # type: ignore
+    controller.request_exit()
+
+
+def producer_worker(
+    output_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    controller: worker_controller.WorkerController,
+) -> None:
+    """
+    Puts the items and returns.
+    """
+    for i in range(ITEM_COUNT):
+        controller.check_pause()
+        output_queue.put(i)
+
+
+def doubler_worker(
+    input_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    output_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    controller: worker_controller.WorkerController,
+) -> None:
+    """
+    Doubles each item until exit is requested, skipping sentinels.
+    """
+    while not controller.is_exit_requested():
+        controller.check_pause()
+        for item in input_queue.get_many(timeout=0.1):
+            if item is not None:
+                output_queue.put(item * 2)
+
+
+def forwarder_worker(
+    input_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    output_queue: queue_proxy_wrapper.QueueProxyWrapper,
+    controller: worker_controller.WorkerController,
+) -> None:
+    """
+    Forwards each item until exit is requested.
+    """
+    while not controller.is_exit_requested():
+        controller.check_pause()
+        output_queue.put_many(input_queue.get_many(timeout=0.1))
+
+
+def create_pipeline(
+    controller: worker_controller.WorkerController, local_logger: FakeLogger
+) -> worker_pipeline.Pipeline:
+    """
+    Empty pipeline with queues local to this process.
+    """
+    result, pipeline = worker_pipeline.Pipeline.create(None, controller, local_logger)
+    assert result
+    assert pipeline is not None
+
+    return pipeline
+
+
+def add_chain(
+    pipeline: worker_pipeline.Pipeline,
+    producer_scheduling: "worker_scheduling.WorkerScheduling | None" = None,
+    doubler_scheduling: "worker_scheduling.WorkerScheduling | None" = None,
+) -> None:
+    """
+    Declares producer to doubler to forwarder to main, with the stages declared in reverse.
+    """
+    pipeline.add_stage("Forwarder", forwarder_worker)
+    pipeline.add_stage("Doubler", doubler_worker, scheduling=doubler_scheduling)
+    pipeline.add_stage("Producer", producer_worker, scheduling=producer_scheduling)
+    pipeline.add_queue("Results", producer="Forwarder", consumer=None)
+    pipeline.add_queue("Doubled", producer="Doubler", consumer="Forwarder")
+    pipeline.add_queue("Items", producer="Producer", consumer="Doubler")
+
+
+class TestBuild:
+    """
+    Order and grouping of the stages.
+    """
+
+    def test_topological_order(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Stages are started producers first, whatever the order of declaration.
+        """
+        # Setup
+        pipeline = create_pipeline(controller, fake_logger)
+        add_chain(pipeline)
+
+        # Run
+        result = pipeline.build(fuse=False)
+
+        # Test
+        assert result
+        assert [manager.get_target_name() for manager in pipeline.get_worker_managers()] == [
+            "producer_worker",
+            "doubler_worker",
+            "forwarder_worker",
+        ]
+
+    def test_cycle(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Stages which feed each other are rejected.
+        """
+        # Setup
+        pipeline = create_pipeline(controller, fake_logger)
+        pipeline.add_stage("Doubler", doubler_worker)
+        pipeline.add_stage("Other doubler", doubler_worker)
+        pipeline.add_queue("Forward", producer="Doubler", consumer="Other doubler")
+        pipeline.add_queue("Back", producer="Other doubler", consumer="Doubler")
+
+        # Run
+        result = pipeline.build()
+
+        # Test
+        assert not result
+        assert fake_logger.errors == ["Pipeline stages form a cycle"]
+        assert len(pipeline.get_worker_managers()) == 0
+
+    def test_drain_order(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Queues are drained from END TO START, so the queue to main is first.
+        """
+        # Setup
+        pipeline = create_pipeline(controller, fake_logger)
+        add_chain(pipeline)
+
+        # Run
+        result = pipeline.build(fuse=False)
+
+        # Test
+        assert result
+        queues = pipeline.get_queues()
+        assert pipeline._Pipeline__drain_order == [
+            queues["Results"],
+            queues["Doubled"],
+            queues["Items"],
+        ]
+
+    def test_fuse_equal_scheduling(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Single process stages with equal but separate scheduling are fused,
+        and the queue between them is left to the fused process.
+        """
+        # Setup
+        pipeline = create_pipeline(controller, fake_logger)
+        add_chain(
+            pipeline,
+            worker_scheduling.WorkerScheduling(cpus={0}, nice=5),
+            worker_scheduling.WorkerScheduling(cpus={0}, nice=5),
+        )
+
+        # Run
+        result = pipeline.build()
+
+        # Test
+        assert result
+        assert [manager.get_target_name() for manager in pipeline.get_worker_managers()] == [
+            "Producer+Doubler",
+            "forwarder_worker",
+        ]
+        assert pipeline.get_queue("Items") is None
+        assert pipeline.get_queue("Doubled") is not None
+
+    def test_no_fuse_different_scheduling(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Stages with different scheduling stay in their own processes.
+        """
+        # Setup
+        pipeline = create_pipeline(controller, fake_logger)
+        add_chain(
+            pipeline,
+            worker_scheduling.WorkerScheduling(nice=5),
+            worker_scheduling.WorkerScheduling(nice=10),
+        )
+
+        # Run
+        result = pipeline.build()
+
+        # Test
+        assert result
+        assert [manager.get_target_name() for manager in pipeline.get_worker_managers()] == [
+            "producer_worker",
+            "doubler_worker",
+            "forwarder_worker",
+        ]
+        assert pipeline.get_queue("Items") is not None
+
+    def test_fuse_declared(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Stages with different scheduling are fused if their queue is declared with fuse.
+        """
+        # Setup
+        pipeline = create_pipeline(controller, fake_logger)
+        pipeline.add_stage("Forwarder", forwarder_worker)
+        pipeline.add_stage(
+            "Doubler", doubler_worker, scheduling=worker_scheduling.WorkerScheduling(nice=10)
+        )
+        pipeline.add_stage(
+            "Producer", producer_worker, scheduling=worker_scheduling.WorkerScheduling(nice=5)
+        )
+        pipeline.add_queue("Results", producer="Forwarder", consumer=None)
+        pipeline.add_queue("Doubled", producer="Doubler", consumer="Forwarder")
+        pipeline.add_queue("Items", producer="Producer", consumer="Doubler", fuse=True)
+
+        # Run
+        result = pipeline.build(fuse=False)
+
+        # Test
+        assert result
+        assert [manager.get_target_name() for manager in pipeline.get_worker_managers()] == [
+            "Producer+Doubler",
+            "forwarder_worker",
+        ]
+        assert pipeline.get_queue("Items") is None
+
+    def test_fuse_declared_invalid(
+        self, controller: worker_controller.WorkerController, fake_logger: FakeLogger
+    ) -> None:
+        """
+        Queues to main or to stages of several workers cannot be fused.
+        """
+        # Setup
+        pipeline = create_pipeline(controller, fake_logger)
+        pipeline.add_stage("Forwarder", forwarder_worker)
+        pipeline.add_stage("Doubler", doubler_worker, count=2)
+
+        # Run
+        is_main_added = pipeline.add_queue("Results", producer="Forwarder", fuse=True)
+        is_scaled_added = pipeline.add_queue(
+            "Doubled", producer="Doubler", consumer="Forwarder", fuse=True
+        )
+        result = pipeline.build()
+
+        # Test
+        assert not is_main_added
+        assert not is_scaled_added
+        assert not result
+        assert fake_logger.errors[:2] == [
+            "Queue Results can only be fused between stages of exactly 1 worker process",
+            "Queue Doubled can only be fused between stages of exactly 1 worker process",
+        ]
+
+
+class TestFusedWorkers:
+    """
+    Stages running as threads of 1 process.
+    """
+
+    def test_fused_queue(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Items pass through the fused queue, and the workers after one which returned
+        keep running until exit is requested.
+        """
+        # Setup
+        output_queue = queue_proxy_wrapper.QueueProxyWrapper(None)
+        fused_workers = worker_pipeline.FusedWorkers(
+            [
+                (producer_worker, (), [], [0], None),
+                (doubler_worker, (), [0], [output_queue], None),
+            ],
+            [(0, {})],
+            "Producer+Doubler",
+        )
+        thread = threading.Thread(target=fused_workers, args=(controller,))
+
+        # Run
+        thread.start()
+        items = []
+        for _ in range(ITEM_COUNT):
+            items += output_queue.get_many(timeout=5.0)
+
+        is_running = thread.is_alive()
+        controller.request_exit()
+        thread.join(5.0)
+
+        # Test
+        assert items == [2 * i for i in range(ITEM_COUNT)]
+        assert is_running
+        assert not thread.is_alive()
@@ -0,0 +1,81 @@
+"""
+Test the worker resource sampling.
+"""
+
+import multiprocessing as mp
+import os
+
+from utilities.workers import worker_resources
+
+
+class TestReadProcessResources:
+    """
+    Samples from /proc.
+    """
+
+    def test_running_process(self) -> None:
+        """
+        Sample of this process has its usage.
+        """
+        # Run
+        sample = worker_resources.read_process_resources(os.getpid(), 3)
+
+        # Test
+        assert sample is not None
+        assert sample.pid == os.getpid()
+        assert sample.cpu_time > 0.0
+        assert sample.rss > 0
+        assert sample.voluntary_context_switches >= 0
+        assert sample.loop_count == 3
+
+    def test_exited_process(self) -> None:
+        """
+        No sample once the process has exited.
+        """
+        # Setup
+        process = mp.Process(target=int)
+        process.start()
+        process.join(5.0)
+
+        # Run
+        sample = worker_resources.read_process_resources(process.pid, 0)
+
+        # Test
+        assert sample is None
+
+
+class TestFormatResourceRates:
+    """
+    Summary between samples.
+    """
+
+    def test_rates(self) -> None:
+        """
+        Usage between samples is divided by the elapsed time.
+        """
+        # Setup
+        previous = worker_resources.WorkerResourceSample(1, 10.0, 1.0, 2**20, 5, 1, 100)
+        current = worker_resources.WorkerResourceSample(1, 12.0, 2.0, 2**21, 25, 3, 300)
+
+        # Run
+        actual = worker_resources.format_resource_rates(previous, current)
+
+        # Test
+        assert "cpu: 50.0%" in actual
+        assert "rss: 2.0MiB (+1024KiB)" in actual
+        assert "10.0/s voluntary 1.0/s involuntary" in actual
+        assert "loops: 100.0/s" in actual
+
+    def test_restarted_worker(self) -> None:
+        """
+        Totals are shown when the worker was replaced since the previous sample.
+        """
+        # Setup
+        previous = worker_resources.WorkerResourceSample(1, 10.0, 1.0, 2**20, 5, 1, 100)
+        current = worker_resources.WorkerResourceSample(2, 12.0, 0.5, 2**20, 2, 0, 10)
+
+        # Run
+        actual = worker_resources.format_resource_rates(previous, current)
+
+        # Test
+        assert actual == str(current)
@@ -0,0 +1,87 @@
+"""
+Test the worker scheduling.
+"""
+
+import multiprocessing as mp
+import os
+
+import pytest
+
+from utilities.workers import worker_scheduling
+
+
+# Test functions use test fixture signature names and access class privates
+# No enable
+# pylint: disable=protected-access,redefined-outer-name
+
+
+@pytest.fixture()
+def results() -> "mp.queues.Queue":  # type: ignore
+    """
+    Results from the child process.
+    """
+    queue = mp.Queue()
+    yield queue  # type: ignore
+    queue.close()
+
+
+def scheduled_worker(
+    scheduling: worker_scheduling.WorkerScheduling, results: "mp.queues.Queue"
+) -> None:
+    """
+    Applies the scheduling and reports the failures, affinity and nice value.
+    """
+    failures = scheduling.apply()
+    results.put((failures, os.sched_getaffinity(0), os.getpriority(os.PRIO_PROCESS, 0)))
+
+
+def run_scheduled(
+    scheduling: worker_scheduling.WorkerScheduling, results: "mp.queues.Queue"
+) -> "tuple[list[str], set[int], int]":
+    """
+    Runs the worker in a child process so the test process keeps its scheduling.
+    """
+    process = mp.Process(target=scheduled_worker, args=(scheduling, results))
+    process.start()
+    result = results.get(timeout=5.0)
+    process.join(5.0)
+    return result
+
+
+class TestApply:
+    """
+    Settings applied in the worker.
+    """
+
+    def test_affinity_and_nice(self, results: "mp.queues.Queue") -> None:
+        """
+        Worker is pinned to 1 CPU with a higher nice value.
+        """
+        # Setup
+        cpu = min(os.sched_getaffinity(0))
+        nice = min(os.getpriority(os.PRIO_PROCESS, 0) + 1, 19)
+        scheduling = worker_scheduling.WorkerScheduling(cpus={cpu}, nice=nice)
+
+        # Run
+        failures, cpus, actual_nice = run_scheduled(scheduling, results)
+
+        # Test
+        assert failures == []
+        assert cpus == {cpu}
+        assert actual_nice == nice
+
+    def test_failure_reported(self, results: "mp.queues.Queue") -> None:
+        """
+        Setting which cannot be applied is reported and the rest are still applied.
+        """
+        # Setup
+        nice = min(os.getpriority(os.PRIO_PROCESS, 0) + 1, 19)
+        scheduling = worker_scheduling.WorkerScheduling(cpus={1 << 20}, nice=nice)
+
+        # Run
+        failures, cpus, actual_nice = run_scheduled(scheduling, results)
+
+        # Test
+        assert failures == ["cpus"]
+        assert cpus == os.sched_getaffinity(0)
+        assert actual_nice == nice
@@ -0,0 +1,404 @@
+"""
+Queues hosted by the manager server process.
+"""
+
+import collections
+import heapq
+import itertools
+import multiprocessing.managers
+import queue
+import sys
+import threading
+import time
+
+
+# Priorities of items in a priority queue, lower numbers are got first
+PRIORITY_CRITICAL = 0
+PRIORITY_ROUTINE = 1
+
+
+class ManagedQueue(queue.Queue):
+    """
+    Queue with batched operations, so a list of items is moved in a single proxy call.
+
+    Items are stamped with the time they were put, and the highest depth is kept.
+
+    Lives in the manager server process, use `QueueSyncManager.ManagedQueue()` to create,
+    or in a single process for a local queue wrapper.
+    """
+
+    def __init__(self, maxsize: int = 0) -> None:
+        super().__init__(maxsize)
+        self.__high_water_depth = 0
+
+    # Overrides of the queue.Queue storage, called with the mutex held
+    def _put(self, item: object) -> None:
+        self._put_stamped((time.monotonic(), item))
+        self.__high_water_depth = max(self.__high_water_depth, self._qsize())
+
+    def _get(self) -> object:
+        _, item = self._get_stamped()
+        return item
+
+    # Storage of stamped items and eviction, overridden by queues with another order
+    # Called with the mutex held
+    def _put_stamped(self, stamped_item: "tuple[float, object]") -> None:
+        self.queue.append(stamped_item)
+
+    def _get_stamped(self) -> "tuple[float, object]":
+        return self.queue.popleft()
+
+    # pylint: disable-next=unused-argument
+    def _evict_for(self, item: object) -> bool:
+        """
+        Removes a queued item to make space for the item, returns whether one was removed.
+        """
+        return False
+
+    def get_high_water_depth(self) -> int:
+        """
+        Returns the highest number of items the queue has held.
+        """
+        with self.mutex:
+            return self.__high_water_depth
+
+    def put_many(self, items: list, block: bool = True, timeout: "float | None" = None) -> int:
+        """
+        Puts the items in order, blocking on each while the queue is full.
+
+        timeout: Total time for the whole batch.
+
+        Returns the number of items put, which is less than the length of items on timeout.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        count = 0
+        with self.not_full:
+            for item in items:
+                if self.maxsize > 0:
+                    while self._qsize() >= self.maxsize and not self._evict_for(item):
+                        if not block:
+                            return count
+
+                        if deadline is None:
+                            self.not_full.wait()
+                            continue
+
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0.0:
+                            return count
+
+                        self.not_full.wait(remaining)
+
+                self._put(item)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+                count += 1
+
+        return count
+
+    def get_many(self, max_items: int, block: bool = True, timeout: "float | None" = None) -> list:
+        """
+        Waits for at least 1 item and then gets up to `max_items` without waiting.
+
+        Returns the items in order, which is empty on timeout.
+        """
+        return [item for _, item in self.get_many_stamped(max_items, block, timeout)]
+
+    def get_many_stamped(
+        self, max_items: int, block: bool = True, timeout: "float | None" = None
+    ) -> "list[tuple[float, object]]":
+        """
+        Same as `get_many()`, but each item is paired with the `time.monotonic()` it was put.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        with self.not_empty:
+            while not self._qsize():
+                if not block:
+                    return []
+
+                if deadline is None:
+                    self.not_empty.wait()
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    return []
+
+                self.not_empty.wait(remaining)
+
+            items = []
+            while self._qsize() and len(items) < max_items:
+                items.append(self._get_stamped())
+
+            self.not_full.notify(len(items))
+
+        return items
+
+
+class PriorityManagedQueue(ManagedQueue):
+    """
+    Queue which gets the most urgent item first, lower priority numbers are more urgent.
+    Items of the same priority are got in the order they were put.
+
+    A full queue evicts its least urgent item (the oldest if there are several)
+    to make space for a more urgent item, so urgent items never wait behind routine ones.
+    With `drop_oldest`, an equally urgent item also evicts instead of waiting.
+    Evicted items are counted as overwritten.
+
+    None is a sentinel, which is got after every other item and never evicts one,
+    so filling the queue while stopping does not reorder or drop the items still queued.
+
+    Lives in the manager server process, use `QueueSyncManager.PriorityManagedQueue()` to create,
+    or in a single process for a local queue wrapper.
+    """
+
+    # Less urgent than any priority an item is put with
+    __SENTINEL_PRIORITY = sys.maxsize
+
+    def __init__(self, maxsize: int = 0, drop_oldest: bool = False) -> None:
+        super().__init__(maxsize)
+        # Heap of priority, sequence number, put time, item
+        self.queue: "list[tuple[int, int, float, object]]" = []
+        self.__sequence = itertools.count()
+        self.__drop_oldest = drop_oldest
+        self.__evicted_count = 0
+
+    def put(
+        self,
+        item: object,
+        block: bool = True,
+        timeout: "float | None" = None,
+        priority: int = PRIORITY_ROUTINE,
+    ) -> None:
+        """
+        Puts the item, raises queue.Full if there is no space in time.
+        """
+        if self.put_many([item], block, timeout, priority) == 0:
+            raise queue.Full
+
+    def put_many(
+        self,
+        items: list,
+        block: bool = True,
+        timeout: "float | None" = None,
+        priority: int = PRIORITY_ROUTINE,
+    ) -> int:
+        """
+        Puts the items with the same priority, see `ManagedQueue.put_many()`.
+        Sentinels are put with the lowest priority instead.
+        """
+        return super().put_many(
+            [(self.__SENTINEL_PRIORITY if item is None else priority, item) for item in items],
+            block,
+            timeout,
+        )
+
+    def _put_stamped(self, stamped_item: "tuple[float, object]") -> None:
+        put_time, (priority, item) = stamped_item  # type: ignore
+        heapq.heappush(self.queue, (priority, next(self.__sequence), put_time, item))
+
+    def _get_stamped(self) -> "tuple[float, object]":
+        _, _, put_time, item = heapq.heappop(self.queue)
+        return put_time, item
+
+    def _evict_for(self, item: object) -> bool:
+        if len(self.queue) == 0:
+            return False
+
+        priority, _ = item  # type: ignore
+        if priority == self.__SENTINEL_PRIORITY:
+            return False
+
+        # Highest priority number, then lowest sequence number
+        least_urgent = max(self.queue, key=lambda entry: (entry[0], -entry[1]))
+        if priority > least_urgent[0]:
+            return False
+
+        if priority == least_urgent[0] and not self.__drop_oldest:
+            return False
+
+        self.queue.remove(least_urgent)
+        heapq.heapify(self.queue)
+        self.__evicted_count += 1
+        return True
+
+    def get_overwritten_count(self) -> int:
+        """
+        Returns the number of items evicted before they were read.
+        """
+        with self.mutex:
+            return self.__evicted_count
+
+
+class ConflatingQueue:
+    """
+    Queue which only keeps the newest item, or the newest item per key.
+
+    Puts never block, an item replaces the unread item with the same key and is counted
+    as overwritten. Keys are read in the order they were first put.
+    None is a sentinel with its own key.
+
+    Items are stamped with the time they were put, and the highest number of keys is kept.
+
+    Lives in the manager server process, use `QueueSyncManager.ConflatingQueue()` to create,
+    or in a single process for a local queue wrapper.
+    """
+
+    __SENTINEL_KEY = object()
+
+    def __init__(self, key_function: "(...) -> object | None" = None) -> None:  # type: ignore
+        """
+        key_function: Returns the key of an item, None to keep a single newest item.
+        Must be picklable (e.g. module level function).
+        """
+        self.__key_function = key_function
+        # Key to put time and item
+        self.__items: "collections.OrderedDict[object, tuple[float, object]]" = (
+            collections.OrderedDict()
+        )
+        self.__overwritten_count = 0
+        self.__high_water_depth = 0
+        self.__not_empty = threading.Condition()
+
+    def __key(self, item: object) -> object:
+        """
+        Returns the key the item is conflated on.
+        """
+        if item is None:
+            return self.__SENTINEL_KEY
+
+        if self.__key_function is None:
+            return None
+
+        return self.__key_function(item)
+
+    # Same signatures as queue.Queue, but puts never block
+    # pylint: disable=unused-argument
+
+    def put(self, item: object, block: bool = True, timeout: "float | None" = None) -> None:
+        """
+        Puts the item, replacing the unread item with the same key. Never blocks.
+        """
+        self.put_many([item])
+
+    def put_many(self, items: list, block: bool = True, timeout: "float | None" = None) -> int:
+        """
+        Puts the items in order. Never blocks.
+
+        Returns the number of items put.
+        """
+        put_time = time.monotonic()
+        with self.__not_empty:
+            for item in items:
+                key = self.__key(item)
+                if key in self.__items:
+                    self.__overwritten_count += 1
+
+                # Replacing keeps the position of the key
+                self.__items[key] = (put_time, item)
+
+            self.__high_water_depth = max(self.__high_water_depth, len(self.__items))
+            self.__not_empty.notify_all()
+
+        return len(items)
+
+    # pylint: enable=unused-argument
+
+    def get(self, block: bool = True, timeout: "float | None" = None) -> object:
+        """
+        Gets the newest item of the oldest key, raises queue.Empty if there is none in time.
+        """
+        items = self.get_many(1, block, timeout)
+        if len(items) == 0:
+            raise queue.Empty
+
+        return items[0]
+
+    def get_many(self, max_items: int, block: bool = True, timeout: "float | None" = None) -> list:
+        """
+        Waits for at least 1 item and then gets up to `max_items` without waiting.
+
+        Returns the items in key order, which is empty on timeout.
+        """
+        return [item for _, item in self.get_many_stamped(max_items, block, timeout)]
+
+    def get_many_stamped(
+        self, max_items: int, block: bool = True, timeout: "float | None" = None
+    ) -> "list[tuple[float, object]]":
+        """
+        Same as `get_many()`, but each item is paired with the `time.monotonic()` it was put.
+        """
+        with self.__not_empty:
+            if block:
+                self.__not_empty.wait_for(lambda: len(self.__items) > 0, timeout)
+
+            items = []
+            while len(self.__items) > 0 and len(items) < max_items:
+                _, stamped_item = self.__items.popitem(last=False)
+                items.append(stamped_item)
+
+        return items
+
+    def put_nowait(self, item: object) -> None:
+        """
+        Puts the item.
+        """
+        self.put(item)
+
+    def get_nowait(self) -> object:
+        """
+        Gets an item without blocking.
+        """
+        return self.get(False)
+
+    def qsize(self) -> int:
+        """
+        Returns the number of unread keys.
+        """
+        with self.__not_empty:
+            return len(self.__items)
+
+    def empty(self) -> bool:
+        """
+        Returns whether there is nothing to read.
+        """
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        """
+        Never full.
+        """
+        return False
+
+    def get_overwritten_count(self) -> int:
+        """
+        Returns the number of items replaced before they were read.
+        """
+        with self.__not_empty:
+            return self.__overwritten_count
+
+    def get_high_water_depth(self) -> int:
+        """
+        Returns the highest number of keys the queue has held.
+        """
+        with self.__not_empty:
+            return self.__high_water_depth
+
+
+class QueueSyncManager(multiprocessing.managers.SyncManager):
+    """
+    SyncManager which can also create the queues in this module.
+
+    Create and then call `start()`, same as `multiprocessing.Manager()`.
+    """
+
+
+QueueSyncManager.register("ManagedQueue", ManagedQueue)
+QueueSyncManager.register("ConflatingQueue", ConflatingQueue)
+QueueSyncManager.register("PriorityManagedQueue", PriorityManagedQueue)
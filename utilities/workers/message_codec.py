@@ -0,0 +1,78 @@
+"""
+Compact encoding of messages between processes.
+"""
+
+import pickle
+import struct
+
+from utilities.workers import record_layout
+
+
+class MessageCodec:
+    """
+    Encodes messages into compact bytes, so manager queues move a short byte string
+    instead of a pickle with the full class metadata of each message.
+
+    Each message starts with a 1 byte type id:
+    * Registered record types are packed with their fixed layout.
+    * Strings are UTF-8 encoded.
+    * Anything else falls back to pickle.
+
+    None is kept as is, since it is the sentinel.
+    Records are matched on their exact type, subclasses fall back to pickle.
+    """
+
+    __TYPE_ID = struct.Struct("<B")
+
+    __TYPE_ID_PICKLE = 0
+    __TYPE_ID_STRING = 1
+    __TYPE_ID_FIRST_LAYOUT = 2
+
+    def __init__(self, layouts: "list[record_layout.RecordLayout]") -> None:
+        """
+        layouts: Layouts of the record types to pack, at most 254.
+        Every process must use the same layouts in the same order.
+        """
+        assert len(layouts) + self.__TYPE_ID_FIRST_LAYOUT <= 256, "Type id only holds 254 layouts"
+
+        self.__layouts = list(layouts)
+        self.__type_ids = {
+            layout.record_type: self.__TYPE_ID_FIRST_LAYOUT + i for i, layout in enumerate(layouts)
+        }
+
+    def encode(self, message: object) -> "bytes | None":
+        """
+        Encodes the message, None is kept as the sentinel.
+        """
+        if message is None:
+            return None
+
+        type_id = self.__type_ids.get(type(message))
+        if type_id is not None:
+            layout = self.__layouts[type_id - self.__TYPE_ID_FIRST_LAYOUT]
+            return self.__TYPE_ID.pack(type_id) + layout.pack(message)
+
+        if isinstance(message, str):
+            return self.__TYPE_ID.pack(self.__TYPE_ID_STRING) + message.encode("utf-8")
+
+        return self.__TYPE_ID.pack(self.__TYPE_ID_PICKLE) + pickle.dumps(
+            message, pickle.HIGHEST_PROTOCOL
+        )
+
+    def decode(self, encoded: "bytes | None") -> object:
+        """
+        Decodes a message from `encode()`.
+        """
+        if encoded is None:
+            return None
+
+        (type_id,) = self.__TYPE_ID.unpack_from(encoded, 0)
+        if type_id >= self.__TYPE_ID_FIRST_LAYOUT:
+            layout = self.__layouts[type_id - self.__TYPE_ID_FIRST_LAYOUT]
+            return layout.unpack_from(encoded, self.__TYPE_ID.size)
+
+        payload = memoryview(encoded)[self.__TYPE_ID.size :]
+        if type_id == self.__TYPE_ID_STRING:
+            return str(payload, "utf-8")
+
+        return pickle.loads(payload)
@@ -0,0 +1,47 @@
+"""
+Wake up for puts into any of several queues.
+"""
+
+import multiprocessing as mp
+
+
+class QueueDoorbell:
+    """
+    Counter of puts shared by several queues, which consumers can wait on.
+
+    Rung by `QueueProxyWrapper` after every put into a queue it was given to.
+
+    Must be passed to worker processes as a process argument.
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor creates the counter and condition in shared memory.
+        """
+        self.__condition = mp.Condition()
+        self.__ring_count = mp.RawValue("Q", 0)
+
+    def ring(self) -> None:
+        """
+        Wakes up all waiting consumers.
+        """
+        with self.__condition:
+            self.__ring_count.value += 1
+            self.__condition.notify_all()
+
+    def get_ring_count(self) -> int:
+        """
+        Returns the number of rings so far, to pass to `wait()`.
+        """
+        return self.__ring_count.value
+
+    def wait(self, ring_count: int, timeout: "float | None" = None) -> bool:
+        """
+        Blocks until the doorbell has been rung since `ring_count` was read.
+
+        timeout: Time waiting in seconds, None waits forever.
+
+        Returns whether it was rung, otherwise timed out.
+        """
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.__ring_count.value != ring_count, timeout)
@@ -2,24 +2,472 @@
 Queue.
 """
 
+import enum
 import multiprocessing.managers
 import queue
 import time
 
+from utilities.workers import managed_queues
+from utilities.workers import message_codec
+from utilities.workers import queue_doorbell
+from utilities.workers import queue_statistics
+from utilities.workers import record_layout
+from utilities.workers import shared_memory_ring_buffer
 
-class QueueProxyWrapper:
+
+class QueueMode(enum.Enum):
+    """
+    How items are kept in the queue.
+    """
+
+    # First in, first out, puts block while full
+    FIFO = 0
+    # Only the newest item (per key) is kept, puts never block
+    CONFLATING = 1
+    # Most urgent item first, then first in, first out
+    PRIORITY = 2
+
+
+# Priorities of items in priority mode, lower numbers are delivered first
+PRIORITY_CRITICAL = managed_queues.PRIORITY_CRITICAL
+PRIORITY_ROUTINE = managed_queues.PRIORITY_ROUTINE
+
+
+class BackpressurePolicy(enum.Enum):
+    """
+    What a put does while the queue is full.
+    """
+
+    # Wait until there is space
+    BLOCK = 0
+    # Wait up to the policy timeout, then drop the new item
+    BLOCK_WITH_TIMEOUT = 1
+    # Drop the new item without waiting
+    DROP_NEWEST = 2
+    # Drop the oldest item in the queue to make space
+    DROP_OLDEST = 3
+    # Keep every Nth item put by a producer and drop the rest, waiting for space for the kept ones
+    SAMPLE = 4
+
+
+class QueueProxyWrapper:  # pylint: disable=too-many-instance-attributes
     """
     Wrapper for an underlying queue proxy which also stores `maxsize`.
 
     `maxsize <= 0` means infinite size.
+
+    If a record layout is provided, the queue is a ring buffer in shared memory instead
+    of a manager queue. Only items of that layout and None can be put, and `maxsize`
+    must be greater than 0 .
+
+    `batch_size` is the number of items workers should move per `put_many()`/`get_many()`.
+    Batches only take a single round trip when the manager is a `QueueSyncManager`
+    or the queue is in shared memory, otherwise each item is moved separately.
+
+    In conflating mode, only the newest item is kept, or the newest item per key if a key
+    function is provided. Replaced items are counted as overwritten. Conflating mode
+    requires a `QueueSyncManager` or a record layout, and a record layout cannot have keys.
+
+    Puts through the wrapper follow the backpressure policy. If instrumented, puts and gets
+    through the wrapper are counted in statistics shared by all processes using the queue:
+    items accepted and dropped, time producers blocked, time consumers waited and
+    time items spent in the queue (dwell), with histograms of both. Dwell time needs a
+    `QueueSyncManager` or a record layout, since the items are stamped when put.
+    Otherwise nothing is counted, so puts and gets never take the lock of the statistics,
+    and only the depths are reported.
+
+    If a codec is provided, items are encoded on put and decoded on get, so manager queues
+    move compact bytes instead of pickled objects. A key function of a conflating queue
+    would only see the encoded bytes, so it cannot be combined with a codec.
+    A record layout already packs its items, so it cannot be combined with a codec either.
+
+    In priority mode, producers tag items with a priority and the most urgent item is got first.
+    A full queue evicts its least urgent item for a more urgent one instead of blocking,
+    and evicted items are counted as overwritten. With `DROP_OLDEST`, the oldest of the
+    least urgent items is evicted, so the queue never drops a more urgent item for a routine one.
+    Priority mode requires a `QueueSyncManager` and cannot have a record layout.
+
+    If a doorbell is provided, it is rung after every put so `queue_selector.wait_any()`
+    can sleep on several queues sharing it instead of polling them.
+
+    If the manager is None, the queue is local to the process that creates it
+    and can only be shared between its threads, e.g. between fused pipeline stages.
+    It supports every mode, and cannot be passed to another process.
     """
 
     __QUEUE_TIMEOUT = 0.1  # seconds
-    __QUEUE_DELAY = 0.1  # seconds
 
-    def __init__(self, mp_manager: multiprocessing.managers.SyncManager, maxsize: int = 0) -> None:
-        self.queue = mp_manager.Queue(maxsize)
+    def __init__(
+        self,
+        mp_manager: multiprocessing.managers.SyncManager | None,
+        maxsize: int = 0,
+        layout: record_layout.RecordLayout | None = None,
+        batch_size: int = 1,
+        mode: QueueMode = QueueMode.FIFO,
+        key_function: "(...) -> object | None" = None,  # type: ignore
+        policy: BackpressurePolicy = BackpressurePolicy.BLOCK,
+        policy_timeout: float = 1.0,
+        sample_interval: int = 1,
+        instrumented: bool = False,
+        codec: message_codec.MessageCodec | None = None,
+        doorbell: queue_doorbell.QueueDoorbell | None = None,
+    ) -> None:
+        """
+        mp_manager: Manager which hosts the queue, None for a queue local to this process.
+        policy_timeout: Time waiting in seconds for `BLOCK_WITH_TIMEOUT`.
+        sample_interval: N for `SAMPLE`, counted separately in each producer.
+        instrumented: Whether puts and gets are counted.
+        codec: Encoding of items, None to pickle them as is.
+        doorbell: Rung after every put, can be shared with other queues.
+        """
+        if codec is not None:
+            assert layout is None, "Shared memory queue already packs its items"
+            assert key_function is None, "Key function cannot read encoded items"
+
+        if mode == QueueMode.CONFLATING:
+            self.queue = self.__create_conflating_queue(mp_manager, layout, key_function)
+            # Only 1 item is ever waiting without keys
+            if key_function is None:
+                maxsize = 1
+        elif mode == QueueMode.PRIORITY:
+            assert layout is None, "Shared memory queue cannot have priorities"
+            assert mp_manager is None or isinstance(
+                mp_manager, managed_queues.QueueSyncManager
+            ), "Priority requires a QueueSyncManager"
+            self.queue = self.__get_queue_classes(mp_manager).PriorityManagedQueue(
+                maxsize, policy == BackpressurePolicy.DROP_OLDEST
+            )
+        elif layout is not None:
+            self.queue = shared_memory_ring_buffer.SharedMemoryRingBuffer(maxsize, layout)
+        elif mp_manager is None or isinstance(mp_manager, managed_queues.QueueSyncManager):
+            self.queue = self.__get_queue_classes(mp_manager).ManagedQueue(maxsize)
+        else:
+            self.queue = mp_manager.Queue(maxsize)
+
         self.maxsize = maxsize
+        self.batch_size = max(batch_size, 1)
+        self.mode = mode
+
+        self.__policy = policy
+        self.__policy_timeout = policy_timeout
+        self.__sample_interval = max(sample_interval, 1)
+        # Local to each producer process
+        self.__sample_count = 0
+        self.__statistics = None
+        if instrumented:
+            self.__statistics = queue_statistics.QueueStatistics()
+        self.is_instrumented = instrumented
+        self.__codec = codec
+        self.doorbell = doorbell
+
+    @staticmethod
+    def __get_queue_classes(
+        mp_manager: "managed_queues.QueueSyncManager | None",
+    ) -> object:
+        """
+        Returns the manager, whose queue types have the same names as the classes
+        of the module, or the module for a local queue.
+        """
+        if mp_manager is None:
+            return managed_queues
+
+        return mp_manager
+
+    @staticmethod
+    def __create_conflating_queue(
+        mp_manager: multiprocessing.managers.SyncManager | None,
+        layout: record_layout.RecordLayout | None,
+        key_function: "(...) -> object | None",  # type: ignore
+    ) -> object:
+        """
+        Creates the underlying queue for conflating mode.
+        """
+        if layout is not None:
+            assert key_function is None, "Shared memory conflation cannot have keys"
+            # Newest item only is a ring buffer of 1 slot which overwrites
+            return shared_memory_ring_buffer.SharedMemoryRingBuffer(1, layout, True)
+
+        assert mp_manager is None or isinstance(
+            mp_manager, managed_queues.QueueSyncManager
+        ), "Conflation requires a QueueSyncManager"
+        return QueueProxyWrapper.__get_queue_classes(mp_manager).ConflatingQueue(key_function)
+
+    def get_overwritten_count(self) -> int:
+        """
+        Returns the number of items replaced before they were read, always 0 for FIFO mode.
+        """
+        if hasattr(self.queue, "get_overwritten_count"):
+            return self.queue.get_overwritten_count()
+
+        return 0
+
+    def get_statistics(self) -> queue_statistics.QueueStatisticsSnapshot:
+        """
+        Returns the counters of the wrapper from all processes, and the queue depths.
+        Counters are 0 if not instrumented.
+        """
+        high_water_depth = None
+        if hasattr(self.queue, "get_high_water_depth"):
+            high_water_depth = self.queue.get_high_water_depth()
+
+        if self.__statistics is None:
+            bucket_count = len(queue_statistics.HISTOGRAM_BUCKET_BOUNDS) + 1
+            return queue_statistics.QueueStatisticsSnapshot(
+                0,
+                0,
+                0.0,
+                0,
+                0.0,
+                [0] * bucket_count,
+                0.0,
+                0.0,
+                [0] * bucket_count,
+                self.queue.qsize(),
+                high_water_depth,
+            )
+
+        return self.__statistics.get_snapshot(self.queue.qsize(), high_water_depth)
+
+    def put(
+        self, item: object, timeout: "float | None" = None, priority: int = PRIORITY_ROUTINE
+    ) -> bool:
+        """
+        Puts an item following the backpressure policy.
+
+        timeout: Time waiting in seconds while full for blocking policies,
+        None uses the policy (forever for `BLOCK` and `SAMPLE`).
+        priority: Urgency in priority mode, ignored otherwise.
+
+        Returns whether the item was accepted, otherwise it was dropped.
+        """
+        return self.put_many([item], timeout, priority) == 1
+
+    def get(self, timeout: "float | None" = None) -> object:
+        """
+        Gets an item, blocking while the queue is empty.
+
+        timeout: Time waiting in seconds before raising queue.Empty, None waits forever.
+        """
+        items = self.get_many(1, timeout)
+        if len(items) == 0:
+            raise queue.Empty
+
+        return items[0]
+
+    def put_many(
+        self, items: list, timeout: "float | None" = None, priority: int = PRIORITY_ROUTINE
+    ) -> int:
+        """
+        Puts the items in order following the backpressure policy.
+
+        timeout: Total time waiting in seconds while full for blocking policies,
+        None uses the policy (forever for `BLOCK` and `SAMPLE`).
+        priority: Urgency of all the items in priority mode, ignored otherwise.
+
+        Returns the number of items accepted, the rest were dropped.
+        """
+        dropped_count = 0
+        if self.__policy == BackpressurePolicy.SAMPLE:
+            sampled_items = []
+            for item in items:
+                if self.__sample_count % self.__sample_interval == 0:
+                    sampled_items.append(item)
+                self.__sample_count += 1
+
+            dropped_count = len(items) - len(sampled_items)
+            items = sampled_items
+
+        if len(items) == 0:
+            self.__record_put(0, dropped_count, 0.0)
+            return 0
+
+        if self.__codec is not None:
+            items = [self.__codec.encode(item) for item in items]
+
+        accepted_count = self.__put_many_with_policy(items, timeout, priority, dropped_count)
+        if accepted_count > 0 and self.doorbell is not None:
+            self.doorbell.ring()
+
+        return accepted_count
+
+    def __put_many_with_policy(
+        self, items: list, timeout: "float | None", priority: int, dropped_count: int
+    ) -> int:
+        """
+        Puts the items following the backpressure policy and records the statistics.
+
+        dropped_count: Items already dropped by sampling.
+
+        Returns the number of items accepted.
+        """
+        # The priority queue evicts for drop oldest by itself
+        if self.__policy == BackpressurePolicy.DROP_NEWEST or (
+            self.__policy == BackpressurePolicy.DROP_OLDEST and self.mode == QueueMode.PRIORITY
+        ):
+            accepted_count = self.__put_many_with_timeout(items, 0.0, priority)
+            self.__record_put(accepted_count, len(items) - accepted_count, 0.0)
+            return accepted_count
+
+        if self.__policy == BackpressurePolicy.DROP_OLDEST:
+            dropped_count = self.__put_many_drop_oldest(items)
+            self.__record_put(len(items), dropped_count, 0.0)
+            return len(items)
+
+        if timeout is None and self.__policy == BackpressurePolicy.BLOCK_WITH_TIMEOUT:
+            timeout = self.__policy_timeout
+
+        start_time = time.monotonic()
+        accepted_count = self.__put_many_with_timeout(items, timeout, priority)
+        blocked_time = time.monotonic() - start_time
+
+        dropped_count += len(items) - accepted_count
+        self.__record_put(accepted_count, dropped_count, blocked_time)
+        return accepted_count
+
+    def __record_put(self, accepted_count: int, dropped_count: int, blocked_time: float) -> None:
+        """
+        Adds the result of a put to the statistics if instrumented.
+        """
+        if self.__statistics is not None:
+            self.__statistics.record_put(accepted_count, dropped_count, blocked_time)
+
+    def __put_many_drop_oldest(self, items: list) -> int:
+        """
+        Puts all the items, removing the oldest items in the queue while it is full.
+
+        Returns the number of items removed.
+        """
+        accepted_count = self.__put_many_with_timeout(items, 0.0)
+
+        dropped_count = 0
+        for item in items[accepted_count:]:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    pass
+
+                try:
+                    self.queue.get_nowait()
+                    dropped_count += 1
+                except queue.Empty:
+                    # A consumer made space in the meantime
+                    pass
+
+        return dropped_count
+
+    def __put_many_with_timeout(
+        self, items: list, timeout: "float | None", priority: int = PRIORITY_ROUTINE
+    ) -> int:
+        """
+        Puts the items in order, blocking while the queue is full.
+
+        timeout: Total time waiting in seconds for the whole batch, None waits forever.
+        priority: Urgency of all the items in priority mode, ignored otherwise.
+
+        Returns the number of items put, which is less than the length of items on timeout.
+        """
+        if self.mode == QueueMode.PRIORITY:
+            return self.queue.put_many(items, True, timeout, priority)
+
+        if hasattr(self.queue, "put_many"):
+            return self.queue.put_many(items, True, timeout)
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        count = 0
+        for item in items:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+
+            try:
+                self.queue.put(item, timeout=remaining)
+            except queue.Full:
+                break
+
+            count += 1
+
+        return count
+
+    def get_many(self, max_items: int = 0, timeout: "float | None" = None) -> list:
+        """
+        Waits for at least 1 item and then gets any others that are ready.
+
+        max_items: Most items to get, `max_items <= 0` uses `batch_size`.
+        timeout: Time waiting in seconds for the first item, None waits forever.
+
+        Returns the items in order, which is empty on timeout.
+        """
+        if max_items <= 0:
+            max_items = self.batch_size
+
+        if self.is_instrumented:
+            items = self.__get_many_instrumented(max_items, timeout)
+        else:
+            items = self.__get_many_with_timeout(max_items, timeout)
+
+        if self.__codec is not None:
+            return [self.__codec.decode(item) for item in items]
+
+        return items
+
+    def __get_many_instrumented(self, max_items: int, timeout: "float | None") -> list:
+        """
+        Same as `__get_many_with_timeout()`, and records the wait and dwell times.
+        """
+        start_time = time.monotonic()
+        if hasattr(self.queue, "get_many_stamped"):
+            stamped_items = self.queue.get_many_stamped(max_items, True, timeout)
+        else:
+            stamped_items = [
+                (None, item) for item in self.__get_many_with_timeout(max_items, timeout)
+            ]
+
+        # Same clock in every process
+        end_time = time.monotonic()
+        dwell_times = [end_time - put_time for put_time, _ in stamped_items if put_time is not None]
+        # Get Pylance to stop complaining
+        assert self.__statistics is not None
+        self.__statistics.record_get(end_time - start_time, dwell_times)
+
+        return [item for _, item in stamped_items]
+
+    def __get_many_with_timeout(self, max_items: int, timeout: "float | None") -> list:
+        """
+        Waits for at least 1 item and then gets up to `max_items` of any others that are ready.
+
+        timeout: Time waiting in seconds for the first item, None waits forever.
+
+        Returns the items in order, which is empty on timeout.
+        """
+        if hasattr(self.queue, "get_many"):
+            return self.queue.get_many(max_items, True, timeout)
+
+        try:
+            items = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while len(items) < max_items:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return items
+
+    def close(self) -> None:
+        """
+        Frees the shared memory of a ring buffer queue. Manager queues are freed with the manager.
+
+        Call after all workers using the queue have been joined.
+        """
+        if isinstance(self.queue, shared_memory_ring_buffer.SharedMemoryRingBuffer):
+            self.queue.close()
 
     def fill_queue_with_sentinel(self, timeout: float = 0.0) -> None:
         """
@@ -34,7 +482,11 @@ class QueueProxyWrapper:
             for _ in range(self.maxsize):
                 self.queue.put(None, timeout=timeout)
         except queue.Full:
-            return
+            pass
+
+        # Wake up consumers waiting on the doorbell so they see the sentinels
+        if self.doorbell is not None:
+            self.doorbell.ring()
 
     def drain_queue(self, timeout: float = 0.0) -> None:
         """
@@ -53,8 +505,81 @@ class QueueProxyWrapper:
 
     def fill_and_drain_queue(self) -> None:
         """
-        Fill with sentinel and then drain.
+        Fill with sentinel and then drain, without waiting.
+
+        Filling wakes up consumers blocked on an empty queue, and draining wakes up producers
+        blocked on a full queue. A consumer can miss the sentinels if the drain is first,
+        so repeat until the workers have exited, see `worker_manager.stop_workers()`.
+        """
+        try:
+            for _ in range(self.maxsize):
+                self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+        if self.doorbell is not None:
+            self.doorbell.ring()
+
+        try:
+            for _ in range(self.maxsize):
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class OutputBatch:
+    """
+    Items a producer is collecting to put into a queue together, see `QueueProxyWrapper`.
+
+    The batch is put once it reaches the batch size of the queue, or once its first item
+    has waited the max wait, so a partial batch is not held while items slow down.
+    """
+
+    def __init__(self, output_queue: QueueProxyWrapper, max_wait: float) -> None:
+        """
+        output_queue: Queue the batches are put into.
+        max_wait: Longest time in seconds an item waits for the batch to fill.
+        """
+        self.__output_queue = output_queue
+        self.__max_wait = max_wait
+        self.__items: list = []
+        self.__first_time = 0.0
+
+    def add(self, item: object) -> None:
+        """
+        Adds the item, and puts the batch if it is full or due.
+        """
+        if len(self.__items) == 0:
+            self.__first_time = time.monotonic()
+
+        self.__items.append(item)
+        self.put_if_due()
+
+    def put_if_due(self) -> None:
+        """
+        Puts the batch if it is full or its first item has waited the max wait.
+        Call on every loop iteration, including those with no new item.
         """
-        self.fill_queue_with_sentinel()
-        time.sleep(self.__QUEUE_DELAY)
-        self.drain_queue()
+        if len(self.__items) == 0:
+            return
+
+        if (
+            len(self.__items) >= self.__output_queue.batch_size
+            or time.monotonic() - self.__first_time >= self.__max_wait
+        ):
+            self.flush()
+
+    def flush(self, timeout: "float | None" = None) -> None:
+        """
+        Puts the items collected so far, call before the producer returns.
+
+        timeout: See `QueueProxyWrapper.put_many()`.
+        """
+        if len(self.__items) == 0:
+            return
+
+        self.__output_queue.put_many(self.__items, timeout)
+        self.__items = []
+
+    def __len__(self) -> int:
+        return len(self.__items)
@@ -0,0 +1,62 @@
+"""
+Wait on several queues at once.
+"""
+
+import time
+
+from utilities.workers import queue_proxy_wrapper
+
+
+# Period of checking queues which do not share a doorbell
+POLL_PERIOD = 0.01  # seconds
+
+
+def wait_any(
+    queues: "list[queue_proxy_wrapper.QueueProxyWrapper]", timeout: "float | None" = None
+) -> "queue_proxy_wrapper.QueueProxyWrapper | None":
+    """
+    Blocks until any of the queues has an item, like `select()` for queues.
+
+    If every queue was created with the same doorbell, this sleeps until a put rings it.
+    Otherwise the queues are polled every `POLL_PERIOD`.
+
+    queues: Queues to wait on, earlier queues are returned first when several are ready.
+    timeout: Time waiting in seconds, None waits forever.
+
+    Returns the first queue with an item, None on timeout.
+    Does not get the item, another consumer may take it first.
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+
+    doorbell = None
+    doorbells = {id(queue.doorbell): queue.doorbell for queue in queues}
+    if len(doorbells) == 1:
+        doorbell = queues[0].doorbell
+
+    while True:
+        # Read before checking so a put in between wakes up the wait below
+        ring_count = 0
+        if doorbell is not None:
+            ring_count = doorbell.get_ring_count()
+
+        for queue in queues:
+            if not queue.queue.empty():
+                return queue
+
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.0:
+                return None
+
+        if doorbell is not None:
+            doorbell.wait(ring_count, remaining)
+            continue
+
+        if remaining is None:
+            time.sleep(POLL_PERIOD)
+            continue
+
+        time.sleep(min(POLL_PERIOD, remaining))
@@ -0,0 +1,150 @@
+"""
+Queue counters shared between processes.
+"""
+
+import bisect
+import multiprocessing as mp
+
+
+# Upper bounds of the histogram buckets in seconds, the last bucket has no upper bound
+HISTOGRAM_BUCKET_BOUNDS = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0]
+
+
+class QueueStatisticsSnapshot:  # pylint: disable=too-many-instance-attributes
+    """
+    Counters of a queue at one point in time.
+
+    Histograms are counts per bucket of `HISTOGRAM_BUCKET_BOUNDS`.
+    Depths are None if the queue cannot report them.
+    """
+
+    def __init__(
+        self,
+        accepted_count: int,
+        dropped_count: int,
+        blocked_time: float,
+        dequeued_count: int,
+        wait_time: float,
+        wait_histogram: "list[int]",
+        dwell_time: float,
+        dwell_time_max: float,
+        dwell_histogram: "list[int]",
+        depth: "int | None" = None,
+        high_water_depth: "int | None" = None,
+    ) -> None:
+        self.accepted_count = accepted_count
+        self.dropped_count = dropped_count
+        self.blocked_time = blocked_time  # s, total of producers
+        self.dequeued_count = dequeued_count
+        self.wait_time = wait_time  # s, total of consumers
+        self.wait_histogram = wait_histogram
+        self.dwell_time = dwell_time  # s, total of dequeued items
+        self.dwell_time_max = dwell_time_max  # s
+        self.dwell_histogram = dwell_histogram
+        self.depth = depth
+        self.high_water_depth = high_water_depth
+
+    def __str__(self) -> str:
+        dwell_time_mean = 0.0
+        if self.dequeued_count > 0:
+            dwell_time_mean = self.dwell_time / self.dequeued_count
+
+        return (
+            f"accepted: {self.accepted_count}, "
+            f"dropped: {self.dropped_count}, "
+            f"blocked time: {self.blocked_time:.3f}s, "
+            f"dequeued: {self.dequeued_count}, "
+            f"wait time: {self.wait_time:.3f}s {self.wait_histogram}, "
+            f"dwell time mean: {dwell_time_mean * 1000:.3f}ms "
+            f"max: {self.dwell_time_max * 1000:.3f}ms {self.dwell_histogram}, "
+            f"depth: {self.depth}, "
+            f"high water depth: {self.high_water_depth}"
+        )
+
+
+class QueueStatistics:
+    """
+    Counters of items through a queue, summed over all producer and consumer processes.
+
+    Must be passed to worker processes as a process argument.
+    """
+
+    __ACCEPTED_INDEX = 0
+    __DROPPED_INDEX = 1
+    __BLOCKED_TIME_INDEX = 2
+    __DEQUEUED_INDEX = 3
+    __WAIT_TIME_INDEX = 4
+    __DWELL_TIME_INDEX = 5
+    __DWELL_TIME_MAX_INDEX = 6
+    __WAIT_HISTOGRAM_INDEX = 7
+    __DWELL_HISTOGRAM_INDEX = __WAIT_HISTOGRAM_INDEX + len(HISTOGRAM_BUCKET_BOUNDS) + 1
+    __FIELD_COUNT = __DWELL_HISTOGRAM_INDEX + len(HISTOGRAM_BUCKET_BOUNDS) + 1
+
+    def __init__(self) -> None:
+        """
+        Constructor creates the counters in shared memory.
+        """
+        self.__counters = mp.Array("d", self.__FIELD_COUNT)
+
+    def record_put(self, accepted_count: int, dropped_count: int, blocked_time: float) -> None:
+        """
+        Adds the result of a put.
+
+        blocked_time: Time the producer waited for space in seconds.
+        """
+        with self.__counters.get_lock():
+            self.__counters[self.__ACCEPTED_INDEX] += accepted_count
+            self.__counters[self.__DROPPED_INDEX] += dropped_count
+            self.__counters[self.__BLOCKED_TIME_INDEX] += blocked_time
+
+    def record_get(self, wait_time: float, dwell_times: "list[float]") -> None:
+        """
+        Adds the result of a get.
+
+        wait_time: Time the consumer waited for items in seconds.
+        dwell_times: Time in seconds each item spent in the queue.
+        """
+        wait_bucket = bisect.bisect_left(HISTOGRAM_BUCKET_BOUNDS, wait_time)
+        dwell_buckets = [
+            bisect.bisect_left(HISTOGRAM_BUCKET_BOUNDS, dwell_time) for dwell_time in dwell_times
+        ]
+
+        with self.__counters.get_lock():
+            self.__counters[self.__DEQUEUED_INDEX] += len(dwell_times)
+            self.__counters[self.__WAIT_TIME_INDEX] += wait_time
+            self.__counters[self.__WAIT_HISTOGRAM_INDEX + wait_bucket] += 1
+
+            for dwell_time, dwell_bucket in zip(dwell_times, dwell_buckets):
+                self.__counters[self.__DWELL_TIME_INDEX] += dwell_time
+                self.__counters[self.__DWELL_HISTOGRAM_INDEX + dwell_bucket] += 1
+                if dwell_time > self.__counters[self.__DWELL_TIME_MAX_INDEX]:
+                    self.__counters[self.__DWELL_TIME_MAX_INDEX] = dwell_time
+
+    def get_snapshot(
+        self, depth: "int | None" = None, high_water_depth: "int | None" = None
+    ) -> QueueStatisticsSnapshot:
+        """
+        Returns a copy of the counters.
+
+        depth: Current depth of the queue.
+        high_water_depth: Highest depth of the queue.
+        """
+        with self.__counters.get_lock():
+            counters = self.__counters[:]
+
+        wait_histogram = counters[self.__WAIT_HISTOGRAM_INDEX : self.__DWELL_HISTOGRAM_INDEX]
+        dwell_histogram = counters[self.__DWELL_HISTOGRAM_INDEX : self.__FIELD_COUNT]
+
+        return QueueStatisticsSnapshot(
+            int(counters[self.__ACCEPTED_INDEX]),
+            int(counters[self.__DROPPED_INDEX]),
+            counters[self.__BLOCKED_TIME_INDEX],
+            int(counters[self.__DEQUEUED_INDEX]),
+            counters[self.__WAIT_TIME_INDEX],
+            [int(count) for count in wait_histogram],
+            counters[self.__DWELL_TIME_INDEX],
+            counters[self.__DWELL_TIME_MAX_INDEX],
+            [int(count) for count in dwell_histogram],
+            depth,
+            high_water_depth,
+        )
@@ -0,0 +1,75 @@
+"""
+Fixed binary layout for records.
+"""
+
+import struct
+
+
+class RecordLayout:
+    """
+    Packs a record's attributes into a fixed size `struct` layout.
+
+    Each field is an attribute name and a `struct` format code (e.g. `d`, `q`, `16s`).
+    A presence mask is packed in front so attributes that are None survive the round trip.
+    String fields (`s` format) are UTF-8 encoded and truncated to the field length.
+    The record type must accept every field as a keyword argument.
+    """
+
+    __MASK_FORMAT = "Q"
+
+    def __init__(self, record_type: type, fields: "list[tuple[str, str]]") -> None:
+        """
+        record_type: Class of the record, constructed with the fields as keyword arguments.
+        fields: Attribute names and their `struct` format codes, at most 64.
+        """
+        assert len(fields) <= 64, "Presence mask only holds 64 fields"
+
+        self.record_type = record_type
+        self.__fields = list(fields)
+        self.__names = [name for name, _ in fields]
+        self.__is_string = [field_format.endswith("s") for _, field_format in fields]
+        self.__struct = struct.Struct(
+            "<" + self.__MASK_FORMAT + "".join(field_format for _, field_format in fields)
+        )
+        self.size = self.__struct.size
+
+    def __reduce__(self) -> "tuple":
+        # struct.Struct cannot be pickled, rebuild it from the field list instead
+        return (RecordLayout, (self.record_type, self.__fields))
+
+    def pack(self, record: object) -> bytes:
+        """
+        Packs the record into bytes of length `size`.
+        """
+        mask = 0
+        values = []
+        for i, name in enumerate(self.__names):
+            value = getattr(record, name)
+            if value is None:
+                values.append(b"" if self.__is_string[i] else 0)
+                continue
+
+            mask |= 1 << i
+            if self.__is_string[i]:
+                value = value.encode("utf-8")
+            values.append(value)
+
+        return self.__struct.pack(mask, *values)
+
+    def unpack_from(self, buffer: "bytes | bytearray | memoryview", offset: int = 0) -> object:
+        """
+        Unpacks a record starting at `offset` in the buffer.
+        """
+        mask, *values = self.__struct.unpack_from(buffer, offset)
+        arguments = {}
+        for i, name in enumerate(self.__names):
+            if not mask & (1 << i):
+                arguments[name] = None
+                continue
+
+            value = values[i]
+            if self.__is_string[i]:
+                value = value.rstrip(b"\x00").decode("utf-8", errors="replace")
+            arguments[name] = value
+
+        return self.record_type(**arguments)
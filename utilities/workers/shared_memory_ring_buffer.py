@@ -0,0 +1,344 @@
+"""
+Queue of fixed layout records in shared memory.
+"""
+
+import multiprocessing as mp
+import multiprocessing.shared_memory
+import os
+import queue
+import struct
+import time
+
+from utilities.workers import record_layout
+
+
+class SharedMemoryRingBuffer:  # pylint: disable=too-many-instance-attributes
+    """
+    Bounded FIFO ring buffer of fixed layout records in shared memory.
+
+    Items are copied straight into shared memory, so a handoff does not go through
+    the manager server process. Has the same interface as a queue proxy
+    (`put()`, `get()`, `empty()`, etc.) and accepts None as a sentinel.
+
+    In overwrite mode, putting into a full buffer replaces the oldest item instead of
+    blocking, and the number of replaced items is counted.
+
+    Items are stamped with the time they were put, and the highest depth is kept.
+
+    Must be passed to worker processes as a process argument.
+    """
+
+    # Read index, write index, item count, overwritten count, high water depth
+    __HEADER = struct.Struct("<QQQQQ")
+    # Tag, put time
+    __SLOT_HEADER = struct.Struct("<Bd")
+
+    __TAG_SENTINEL = 0
+    __TAG_RECORD = 1
+
+    def __init__(
+        self, maxsize: int, layout: record_layout.RecordLayout, overwrite: bool = False
+    ) -> None:
+        """
+        maxsize: Number of slots, must be greater than 0 .
+        layout: Layout of the records.
+        overwrite: Whether a put into a full buffer replaces the oldest item.
+        """
+        assert maxsize > 0, "Shared memory ring buffer must be bounded"
+
+        self.maxsize = maxsize
+        self.__layout = layout
+        self.__overwrite = overwrite
+        self.__slot_size = self.__SLOT_HEADER.size + layout.size
+
+        self.__shared_memory = multiprocessing.shared_memory.SharedMemory(
+            create=True,
+            size=self.__HEADER.size + maxsize * self.__slot_size,
+        )
+        self.__HEADER.pack_into(self.__shared_memory.buf, 0, 0, 0, 0, 0, 0)
+        self.__owner_process_id = os.getpid()
+
+        self.__lock = mp.Lock()
+        self.__free_slots = mp.Semaphore(maxsize)
+        self.__used_slots = mp.Semaphore(0)
+
+    def __pack(self, item: object) -> "bytes | None":
+        """
+        Packs the item, None is kept as the sentinel.
+        """
+        if item is None:
+            return None
+
+        return self.__layout.pack(item)
+
+    @staticmethod
+    def __remaining(deadline: "float | None") -> "float | None":
+        """
+        Time left until the deadline, None if there is no deadline.
+        """
+        if deadline is None:
+            return None
+
+        return max(0.0, deadline - time.monotonic())
+
+    def __write_slots(self, payloads: "list[bytes | None]") -> None:
+        """
+        Writes the packed items starting at the write index.
+        Caller must hold a free slot for each.
+        """
+        put_time = time.monotonic()
+        with self.__lock:
+            buffer = self.__shared_memory.buf
+            read_index, write_index, count, overwritten, high_water_depth = (
+                self.__HEADER.unpack_from(buffer, 0)
+            )
+
+            for payload in payloads:
+                self.__write_payload(buffer, write_index, payload, put_time)
+                write_index = (write_index + 1) % self.maxsize
+
+            count += len(payloads)
+            self.__HEADER.pack_into(
+                buffer,
+                0,
+                read_index,
+                write_index,
+                count,
+                overwritten,
+                max(high_water_depth, count),
+            )
+
+        for _ in payloads:
+            self.__used_slots.release()
+
+    def __write_payload(
+        self, buffer: memoryview, index: int, payload: "bytes | None", put_time: float
+    ) -> None:
+        """
+        Writes the packed item into the slot at the index. Caller must hold the lock.
+        """
+        offset = self.__HEADER.size + index * self.__slot_size
+        if payload is None:
+            self.__SLOT_HEADER.pack_into(buffer, offset, self.__TAG_SENTINEL, put_time)
+            return
+
+        self.__SLOT_HEADER.pack_into(buffer, offset, self.__TAG_RECORD, put_time)
+        buffer[offset + self.__SLOT_HEADER.size : offset + self.__slot_size] = payload
+
+    def __put_overwriting(self, payload: "bytes | None") -> None:
+        """
+        Writes the packed item, replacing the oldest item if the buffer is full.
+        """
+        while not self.__free_slots.acquire(False):
+            put_time = time.monotonic()
+            with self.__lock:
+                buffer = self.__shared_memory.buf
+                read_index, write_index, count, overwritten, high_water_depth = (
+                    self.__HEADER.unpack_from(buffer, 0)
+                )
+
+                # A consumer freed a slot in the meantime
+                if count < self.maxsize:
+                    continue
+
+                # The oldest item is at the write index when full
+                self.__write_payload(buffer, write_index, payload, put_time)
+                self.__HEADER.pack_into(
+                    buffer,
+                    0,
+                    (read_index + 1) % self.maxsize,
+                    (write_index + 1) % self.maxsize,
+                    count,
+                    overwritten + 1,
+                    high_water_depth,
+                )
+                return
+
+        self.__write_slots([payload])
+
+    def __read_slots(self, slot_count: int) -> "list[tuple[float, object]]":
+        """
+        Reads items and their put times starting at the read index.
+        Caller must hold a used slot for each.
+        """
+        slots = []
+        with self.__lock:
+            buffer = self.__shared_memory.buf
+            read_index, write_index, count, overwritten, high_water_depth = (
+                self.__HEADER.unpack_from(buffer, 0)
+            )
+
+            for _ in range(slot_count):
+                offset = self.__HEADER.size + read_index * self.__slot_size
+                slots.append(bytes(buffer[offset : offset + self.__slot_size]))
+                read_index = (read_index + 1) % self.maxsize
+
+            self.__HEADER.pack_into(
+                buffer,
+                0,
+                read_index,
+                write_index,
+                count - slot_count,
+                overwritten,
+                high_water_depth,
+            )
+
+        for _ in range(slot_count):
+            self.__free_slots.release()
+
+        # Unpack outside of the lock
+        items = []
+        for slot in slots:
+            tag, put_time = self.__SLOT_HEADER.unpack_from(slot, 0)
+            if tag == self.__TAG_SENTINEL:
+                items.append((put_time, None))
+                continue
+
+            items.append((put_time, self.__layout.unpack_from(slot, self.__SLOT_HEADER.size)))
+
+        return items
+
+    def put(self, item: object, block: bool = True, timeout: "float | None" = None) -> None:
+        """
+        Puts an item, raises queue.Full if no slot is free in time.
+        Never blocks in overwrite mode.
+        """
+        # Pack before taking a slot so a bad item cannot leak the slot
+        payload = self.__pack(item)
+
+        if self.__overwrite:
+            self.__put_overwriting(payload)
+            return
+
+        if not self.__free_slots.acquire(block, timeout):
+            raise queue.Full
+
+        self.__write_slots([payload])
+
+    def get(self, block: bool = True, timeout: "float | None" = None) -> object:
+        """
+        Gets the oldest item, raises queue.Empty if there is none in time.
+        """
+        if not self.__used_slots.acquire(block, timeout):
+            raise queue.Empty
+
+        _, item = self.__read_slots(1)[0]
+        return item
+
+    def put_many(self, items: list, block: bool = True, timeout: "float | None" = None) -> int:
+        """
+        Puts the items in order, writing as many as there are free slots under one lock.
+
+        timeout: Total time for the whole batch.
+
+        Returns the number of items put, which is less than the length of items on timeout.
+        """
+        payloads = [self.__pack(item) for item in items]
+
+        if self.__overwrite:
+            for payload in payloads:
+                self.__put_overwriting(payload)
+
+            return len(payloads)
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        count = 0
+        while count < len(payloads):
+            # Wait for 1 free slot and then take any others that are free without waiting
+            if not self.__free_slots.acquire(block, self.__remaining(deadline)):
+                break
+
+            end = count + 1
+            while end < len(payloads) and self.__free_slots.acquire(False):
+                end += 1
+
+            self.__write_slots(payloads[count:end])
+            count = end
+
+        return count
+
+    def get_many(self, max_items: int, block: bool = True, timeout: "float | None" = None) -> list:
+        """
+        Waits for at least 1 item and then gets up to `max_items` under one lock.
+
+        Returns the items in order, which is empty on timeout.
+        """
+        return [item for _, item in self.get_many_stamped(max_items, block, timeout)]
+
+    def get_many_stamped(
+        self, max_items: int, block: bool = True, timeout: "float | None" = None
+    ) -> "list[tuple[float, object]]":
+        """
+        Same as `get_many()`, but each item is paired with the `time.monotonic()` it was put.
+        """
+        if not self.__used_slots.acquire(block, timeout):
+            return []
+
+        slot_count = 1
+        while slot_count < max_items and self.__used_slots.acquire(False):
+            slot_count += 1
+
+        return self.__read_slots(slot_count)
+
+    def put_nowait(self, item: object) -> None:
+        """
+        Puts an item without blocking.
+        """
+        self.put(item, False)
+
+    def get_nowait(self) -> object:
+        """
+        Gets an item without blocking.
+        """
+        return self.get(False)
+
+    def qsize(self) -> int:
+        """
+        Returns the number of items in the buffer.
+        """
+        with self.__lock:
+            _, _, count, _, _ = self.__HEADER.unpack_from(self.__shared_memory.buf, 0)
+
+        return count
+
+    def get_overwritten_count(self) -> int:
+        """
+        Returns the number of items replaced before they were read.
+        """
+        with self.__lock:
+            _, _, _, overwritten, _ = self.__HEADER.unpack_from(self.__shared_memory.buf, 0)
+
+        return overwritten
+
+    def get_high_water_depth(self) -> int:
+        """
+        Returns the highest number of items the buffer has held.
+        """
+        with self.__lock:
+            _, _, _, _, high_water_depth = self.__HEADER.unpack_from(self.__shared_memory.buf, 0)
+
+        return high_water_depth
+
+    def empty(self) -> bool:
+        """
+        Returns whether the buffer is empty.
+        """
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        """
+        Returns whether the buffer is full.
+        """
+        return self.qsize() >= self.maxsize
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory.
+        The process that created the buffer also frees it.
+        """
+        self.__shared_memory.close()
+        if os.getpid() == self.__owner_process_id:
+            self.__shared_memory.unlink()
@@ -0,0 +1,268 @@
+"""
+Workers which run in the main process instead of their own process.
+"""
+
+import asyncio
+import concurrent.futures
+import enum
+import inspect
+import itertools
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import signal
+import threading
+import traceback
+
+
+class WorkerBackend(enum.Enum):
+    """
+    What each worker runs as.
+    """
+
+    # Own process, for CPU heavy workers
+    PROCESS = 0
+    # Thread of main, for workers which mostly wait on I/O or the controller
+    THREAD = 1
+    # Coroutine on the event loop shared by all coroutine workers,
+    # the target must be an `async def` and must not block
+    ASYNCIO = 2
+
+
+class LocalWorker:
+    """
+    Worker in the main process, with the parts of the `mp.Process` interface used by the
+    worker manager, supervisor and `worker_manager.stop_workers()`.
+
+    The sentinel becomes ready once the worker returns. The exit code is 0 if it returned,
+    1 if it raised, and -SIGTERM if it was cancelled.
+    """
+
+    __counter = itertools.count(1)
+    # Workers of any backend which have started and not returned
+    __running_count = 0
+    __running_count_lock = threading.Lock()
+
+    def __init__(self, name_prefix: str) -> None:
+        self.name = f"{name_prefix}-{next(LocalWorker.__counter)}"
+        # Set on start, so workers which were never started are skipped like processes
+        self.pid: "int | None" = None
+        # Thread the worker runs on, for resource usage
+        self.native_id: "int | None" = None
+        self.exitcode: "int | None" = None
+
+        # A message rather than closing the pipe, since forked processes also hold the writer
+        self.__reader, self.__writer = mp.Pipe(False)
+        self.sentinel = self.__reader
+
+    def _set_started(self) -> None:
+        """
+        Records that the worker is running in this process, call when it starts.
+        """
+        with LocalWorker.__running_count_lock:
+            LocalWorker.__running_count += 1
+
+        self.pid = os.getpid()
+
+    def _finish(self, exitcode: int) -> None:
+        """
+        Records the exit code and makes the sentinel ready, call once the worker returns.
+        """
+        with LocalWorker.__running_count_lock:
+            LocalWorker.__running_count -= 1
+
+        self.exitcode = exitcode
+        self.__writer.send_bytes(b"")
+
+    @classmethod
+    def get_running_count(cls) -> int:
+        """
+        Returns the number of workers running in this process, of all backends.
+        """
+        return cls.__running_count
+
+    def is_alive(self) -> bool:
+        """
+        Returns whether the worker has started and not returned.
+        """
+        return self.pid is not None and self.exitcode is None
+
+    def join(self, timeout: "float | None" = None) -> None:
+        """
+        Waits for the worker to return.
+
+        timeout: Time waiting in seconds, None waits forever.
+        """
+        if self.pid is None:
+            return
+
+        multiprocessing.connection.wait([self.sentinel], timeout)
+
+    def terminate(self) -> bool:
+        """
+        Stops the worker without waiting for it to return, if the backend can.
+
+        Returns whether the backend can force the worker to stop.
+        """
+        return False
+
+    def kill(self) -> bool:
+        """
+        Same as `terminate()`, nothing is more forceful inside a process.
+        """
+        return self.terminate()
+
+
+class ThreadWorker(LocalWorker):
+    """
+    Worker running on its own thread of main.
+
+    Threads cannot be stopped from outside, so terminate and kill do nothing and return False.
+    """
+
+    def __init__(self, target: "(...) -> object", args: "tuple") -> None:  # type: ignore
+        super().__init__("Thread")
+        self.__thread = threading.Thread(
+            target=self.__run, args=(target, args), name=self.name, daemon=True
+        )
+
+    def __run(self, target: "(...) -> object", args: "tuple") -> None:  # type: ignore
+        """
+        Runs the target and records how it exited.
+        """
+        self.native_id = threading.get_native_id()
+        exitcode = 0
+        try:
+            target(*args)
+        # Same as a crashed process
+        # pylint: disable-next=broad-exception-caught
+        except Exception:
+            traceback.print_exc()
+            exitcode = 1
+
+        self._finish(exitcode)
+
+    def start(self) -> None:
+        """
+        Starts the worker.
+        """
+        self._set_started()
+        self.__thread.start()
+
+
+class WorkerEventLoop:
+    """
+    Event loop on its own thread, shared by all coroutine workers of the process.
+    """
+
+    __lock = threading.Lock()
+    __loop: "asyncio.AbstractEventLoop | None" = None
+    __native_id: "int | None" = None
+
+    @classmethod
+    def get(cls) -> "tuple[asyncio.AbstractEventLoop, int]":
+        """
+        Returns the event loop and its thread id, starting it on first use.
+        """
+        with cls.__lock:
+            if cls.__loop is None or cls.__native_id is None:
+                loop = asyncio.new_event_loop()
+                is_running = threading.Event()
+                thread = threading.Thread(
+                    target=cls.__run, args=(loop, is_running), name="WorkerEventLoop", daemon=True
+                )
+                thread.start()
+                is_running.wait()
+                cls.__loop = loop
+                cls.__native_id = thread.native_id
+
+            return cls.__loop, cls.__native_id
+
+    @classmethod
+    def is_started(cls) -> bool:
+        """
+        Returns whether the thread of the loop has started, it runs until main exits.
+        """
+        return cls.__loop is not None
+
+    @staticmethod
+    def __run(loop: asyncio.AbstractEventLoop, is_running: threading.Event) -> None:
+        """
+        Runs the loop forever.
+        """
+        asyncio.set_event_loop(loop)
+        loop.call_soon(is_running.set)
+        loop.run_forever()
+
+
+class CoroutineWorker(LocalWorker):
+    """
+    Worker running as a task on the shared event loop. Terminate cancels the task.
+    """
+
+    def __init__(self, target: "(...) -> object", args: "tuple") -> None:  # type: ignore
+        """
+        target: Function which returns a coroutine, e.g. `worker_manager.run_worker()`
+        with an `async def` target.
+        """
+        super().__init__("Coroutine")
+        self.__target = target
+        self.__args = args
+        self.__future: "concurrent.futures.Future | None" = None
+
+    async def __run(self) -> None:
+        """
+        Awaits the target and records how it exited.
+        """
+        exitcode = 0
+        try:
+            result = self.__target(*self.__args)
+            if inspect.isawaitable(result):
+                await result
+        except asyncio.CancelledError:
+            exitcode = -signal.SIGTERM
+        # Same as a crashed process
+        # pylint: disable-next=broad-exception-caught
+        except Exception:
+            traceback.print_exc()
+            exitcode = 1
+
+        self._finish(exitcode)
+
+    def start(self) -> None:
+        """
+        Starts the worker.
+        """
+        loop, native_id = WorkerEventLoop.get()
+        self._set_started()
+        self.native_id = native_id
+        self.__future = asyncio.run_coroutine_threadsafe(self.__run(), loop)
+        self.__future.add_done_callback(self.__on_done)
+
+    def __on_done(self, future: concurrent.futures.Future) -> None:
+        """
+        Finishes a worker which was cancelled before it started running.
+        """
+        if future.cancelled() and self.exitcode is None:
+            self._finish(-signal.SIGTERM)
+
+    def terminate(self) -> bool:
+        """
+        Cancels the task, which stops at its next await.
+
+        Returns True.
+        """
+        if self.__future is not None:
+            self.__future.cancel()
+
+        return True
+
+
+def has_threads_in_main() -> bool:
+    """
+    Returns whether any thread or coroutine worker is running in this process,
+    or the event loop of coroutine workers has started.
+
+    Forking while they run can copy a lock held by one of their threads into the new process.
+    """
+    return LocalWorker.get_running_count() > 0 or WorkerEventLoop.is_started()
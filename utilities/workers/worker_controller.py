@@ -2,6 +2,8 @@
 For controlling workers.
 """
 
+import asyncio
+import ctypes
 import multiprocessing as mp
 import time
 
@@ -10,63 +12,179 @@ class WorkerController:
     """
     For interprocess communication from main to worker.
     Contains exit and pause requests.
+
+    The requests are flags in shared memory, so checking them in a worker loop
+    does not take a lock. Changes are made under a shared condition which wakes up
+    every waiting worker immediately.
+
+    A worker controller shares the requests of its group controller and also has
+    a stop request of its own, so a single worker can be asked to exit.
+    It also counts the loop iterations of its worker, through `check_pause()`.
+
+    Coroutine workers must not block the event loop, so they use the async versions
+    of the blocking methods, which poll the requests instead.
     """
 
-    __QUEUE_DELAY = 0.1  # seconds
+    __ASYNC_POLL_PERIOD = 0.01  # seconds
 
-    def __init__(self) -> None:
+    def __init__(self, shared: "tuple | None" = None) -> None:
         """
-        Constructor creates internal queue and semaphore.
+        Constructor creates the flags and condition in shared memory.
+
+        shared: Condition, pause flag and exit flag of a group controller,
+        use `create_worker_controller()`.
         """
-        self.__pause = mp.BoundedSemaphore(1)
-        self.__is_paused = False
-        self.__exit_queue = mp.Queue(1)
+        if shared is None:
+            # Written with the condition held, read without it
+            shared = (mp.Condition(), mp.RawValue("b", 0), mp.RawValue("b", 0))
+
+        self.__condition, self.__is_paused, self.__is_exit_requested = shared
+
+        self.__is_stop_requested = mp.RawValue("b", 0)
+        # Only written by the worker
+        self.__loop_count = mp.RawValue("Q", 0)
+
+    def create_worker_controller(self) -> "WorkerController":
+        """
+        Creates a controller for a single worker, which also exits on its own stop request.
+        """
+        return WorkerController((self.__condition, self.__is_paused, self.__is_exit_requested))
+
+    def __is_exit_or_stop_requested(self) -> bool:
+        """
+        Returns whether the group was requested to exit or this worker to stop.
+        """
+        return self.__is_exit_requested.value != 0 or self.__is_stop_requested.value != 0
+
+    def __set_flag(self, flag: ctypes.c_byte, value: int) -> None:
+        """
+        Sets the flag and wakes up all waiting workers.
+        """
+        with self.__condition:
+            flag.value = value
+            self.__condition.notify_all()
 
     def request_pause(self) -> None:
         """
         Requests worker processes to pause.
         """
-        if not self.__is_paused:
-            self.__pause.acquire()
-            self.__is_paused = True
+        self.__set_flag(self.__is_paused, 1)
 
     def request_resume(self) -> None:
         """
         Requests worker processes to resume.
         """
-        if self.__is_paused:
-            self.__pause.release()
-            self.__is_paused = False
+        self.__set_flag(self.__is_paused, 0)
+
+    def is_paused(self) -> bool:
+        """
+        Returns whether main has requested the worker processes to pause.
+        """
+        return self.__is_paused.value != 0
 
     def check_pause(self) -> None:
         """
         Blocks worker if main has requested it to pause, otherwise continues.
+        Also continues once exit is requested, so a paused worker can exit.
+        Call once per loop iteration, which is counted.
         """
-        self.__pause.acquire()
-        self.__pause.release()
+        self.__loop_count.value += 1
+
+        if not self.__is_paused.value:
+            return
+
+        with self.__condition:
+            self.__condition.wait_for(
+                lambda: not self.__is_paused.value or self.__is_exit_or_stop_requested()
+            )
 
     def request_exit(self) -> None:
         """
         Requests worker processes to exit.
         Does nothing if already requested.
         """
-        time.sleep(self.__QUEUE_DELAY)
-        if self.__exit_queue.empty():
-            self.__exit_queue.put(None)
+        self.__set_flag(self.__is_exit_requested, 1)
 
     def clear_exit(self) -> None:
         """
         Clears the exit request condition.
         Does nothing if already cleared.
         """
-        time.sleep(self.__QUEUE_DELAY)
-        if not self.__exit_queue.empty():
-            _ = self.__exit_queue.get()
+        self.__set_flag(self.__is_exit_requested, 0)
+
+    def request_stop(self) -> None:
+        """
+        Requests only the worker of this controller to exit.
+        """
+        self.__set_flag(self.__is_stop_requested, 1)
+
+    def is_stop_requested(self) -> bool:
+        """
+        Returns whether main has requested only the worker of this controller to exit.
+        """
+        return self.__is_stop_requested.value != 0
+
+    def get_loop_count(self) -> int:
+        """
+        Returns the number of loop iterations of the worker of this controller.
+        """
+        return self.__loop_count.value
 
     def is_exit_requested(self) -> bool:
         """
         Returns whether main has requested the worker process to exit.
-        There is a race condition, but it's fine because the worker process
-        will do at most 1 additional loop.
+        Includes the stop request of this controller.
+        """
+        return self.__is_exit_or_stop_requested()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleeps for the timeout, returning early if exit or pause is requested.
+        Use instead of `time.sleep()` in worker loops so requests are handled immediately.
+
+        Returns whether exit or pause was requested.
+        """
+        if self.__is_exit_or_stop_requested() or self.__is_paused.value:
+            return True
+
+        with self.__condition:
+            return self.__condition.wait_for(
+                lambda: self.__is_exit_or_stop_requested() or self.__is_paused.value, timeout
+            )
+
+    def wait_for_exit(self, timeout: "float | None" = None) -> bool:
+        """
+        Blocks until main has requested exit.
+
+        timeout: Time waiting in seconds, None waits forever.
+
+        Returns whether exit was requested, otherwise timed out.
+        """
+        if self.__is_exit_or_stop_requested():
+            return True
+
+        with self.__condition:
+            return self.__condition.wait_for(self.__is_exit_or_stop_requested, timeout)
+
+    async def check_pause_async(self) -> None:
+        """
+        Same as `check_pause()`, for coroutine workers.
         """
-        return not self.__exit_queue.empty()
+        self.__loop_count.value += 1
+
+        while self.__is_paused.value and not self.__is_exit_or_stop_requested():
+            await asyncio.sleep(self.__ASYNC_POLL_PERIOD)
+
+    async def wait_async(self, timeout: float) -> bool:
+        """
+        Same as `wait()`, for coroutine workers.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.__is_exit_or_stop_requested() and not self.__is_paused.value:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.0:
+                return False
+
+            await asyncio.sleep(min(remaining, self.__ASYNC_POLL_PERIOD))
+
+        return True
@@ -2,14 +2,86 @@
 For managing workers.
 """
 
+import concurrent.futures
+import enum
+import gc
+import inspect
 import multiprocessing as mp
+import multiprocessing.connection
+import threading
+import time
 
 from modules.common.modules.logger import logger
+from utilities.workers import worker_backends
 from utilities.workers import worker_controller
+from utilities.workers import worker_resources
+
+# Only used in annotations
+# pylint: disable-next=unused-import
+from utilities.workers import worker_scheduling
 from utilities.workers import queue_proxy_wrapper
 
 
-class WorkerProperties:
+# Time between checking whether started workers are running
+START_POLL_PERIOD = 0.001  # seconds
+# Time between waking up workers blocked on queues while stopping
+STOP_POLL_PERIOD = 0.01  # seconds
+# Time workers get to exit after SIGTERM, and after SIGKILL, while stopping
+TERMINATE_TIMEOUT = 1.0  # seconds
+# Time removed workers get to exit before scaling up at runtime
+SCALE_TIMEOUT = 5.0  # seconds
+
+# Imported last by the forkserver
+WORKER_PRELOAD_MODULE = "utilities.workers.worker_preload"
+
+
+def configure_start_method(method: str, preload_modules: "list[str] | None" = None) -> None:
+    """
+    Sets how worker processes are started.
+
+    Call at the start of main before creating any managers, queues, controllers or workers,
+    since their locks only work in processes started the same way.
+
+    method: "fork", "spawn", or "forkserver".
+    preload_modules: Modules the forkserver imports once before forking workers
+    (e.g. the worker modules). pymavlink and its dialect are always preloaded,
+    and then `gc.freeze()` is called. Ignored for other methods.
+    """
+    mp.set_start_method(method, force=True)
+    if method == "forkserver":
+        if preload_modules is None:
+            preload_modules = []
+
+        mp.set_forkserver_preload(preload_modules + [WORKER_PRELOAD_MODULE])
+
+
+def run_worker(
+    target: "(...) -> object",  # type: ignore
+    args: "tuple",
+    started_times: "mp.Array",  # type: ignore
+    index: int,
+    scheduling: "worker_scheduling.WorkerScheduling | None" = None,
+    scheduling_failures: "mp.Array | None" = None,  # type: ignore
+) -> object:
+    """
+    Entry point of workers, applies the scheduling,
+    records when the worker started running and runs it.
+    Returns what the target returns, the coroutine for coroutine workers.
+
+    started_times: `time.monotonic()` each worker started running, by worker index.
+    scheduling: CPU affinity and scheduling of the worker, None to inherit from main.
+    scheduling_failures: Set to 1 if any scheduling setting was not applied, by worker index.
+    """
+    if scheduling is not None:
+        failures = scheduling.apply()
+        if scheduling_failures is not None:
+            scheduling_failures[index] = 1 if len(failures) > 0 else 0
+
+    started_times[index] = time.monotonic()
+    return target(*args)
+
+
+class WorkerProperties:  # pylint: disable=too-many-instance-attributes
     """
     Worker Properties.
     """
@@ -26,6 +98,10 @@ class WorkerProperties:
         output_queues: "list[queue_proxy_wrapper.QueueProxyWrapper]",
         controller: worker_controller.WorkerController,
         local_logger: logger.Logger,
+        min_count: "int | None" = None,
+        max_count: "int | None" = None,
+        scheduling: "worker_scheduling.WorkerScheduling | None" = None,
+        backend: worker_backends.WorkerBackend = worker_backends.WorkerBackend.PROCESS,
     ) -> "tuple[bool, WorkerProperties | None]":
         """
         Creates worker properties.
@@ -37,6 +113,12 @@ class WorkerProperties:
         output_queues: Output queues.
         controller: Worker controller.
         local_logger: Existing logger from process.
+        min_count: Fewest workers when autoscaling, None for count.
+        max_count: Most workers when autoscaling, None for count.
+        scheduling: CPU affinity, nice value and scheduling policy applied in each worker,
+        None to inherit from main. Thread workers apply it to their thread.
+        backend: Whether each worker is a process, a thread of main,
+        or a coroutine on the event loop of main. Workers keep the same arguments.
 
         Returns the WorkerProperties object.
         """
@@ -47,6 +129,30 @@ class WorkerProperties:
             )
             return False, None
 
+        if min_count is None:
+            min_count = count
+
+        if max_count is None:
+            max_count = count
+
+        if not 0 < min_count <= count <= max_count:
+            local_logger.error(
+                f"Worker counts must be 0 < min ({min_count}) <= count ({count}) "
+                f"<= max ({max_count})",
+                True,
+            )
+            return False, None
+
+        if backend == worker_backends.WorkerBackend.ASYNCIO:
+            if not inspect.iscoroutinefunction(target):
+                local_logger.error("Coroutine workers need an async target", True)
+                return False, None
+
+            # All coroutine workers share the thread of the event loop
+            if scheduling is not None:
+                local_logger.error("Coroutine workers cannot have their own scheduling", True)
+                return False, None
+
         return True, WorkerProperties(
             cls.__create_key,
             count,
@@ -55,6 +161,10 @@ class WorkerProperties:
             input_queues,
             output_queues,
             controller,
+            min_count,
+            max_count,
+            scheduling,
+            backend,
         )
 
     def __init__(
@@ -66,6 +176,10 @@ class WorkerProperties:
         input_queues: "list[queue_proxy_wrapper.QueueProxyWrapper]",
         output_queues: "list[queue_proxy_wrapper.QueueProxyWrapper]",
         controller: worker_controller.WorkerController,
+        min_count: int,
+        max_count: int,
+        scheduling: "worker_scheduling.WorkerScheduling | None",
+        backend: worker_backends.WorkerBackend,
     ) -> None:
         """
         Private constructor, use create() method.
@@ -78,18 +192,29 @@ class WorkerProperties:
         self.__input_queues = input_queues
         self.__output_queues = output_queues
         self.__controller = controller
+        self.__min_count = min_count
+        self.__max_count = max_count
+        self.__scheduling = scheduling
+        self.__backend = backend
 
-    def get_worker_arguments(self) -> "tuple":
+    def get_worker_arguments(
+        self, controller: "worker_controller.WorkerController | None" = None
+    ) -> "tuple":
         """
         Concatenates the worker properties into a tuple.
 
+        controller: Controller of a single worker, None for the worker controller.
+
         Returns the worker properties as a tuple.
         """
+        if controller is None:
+            controller = self.__controller
+
         return (
             self.__work_arguments
             + tuple(self.__input_queues)
             + tuple(self.__output_queues)
-            + (self.__controller,)
+            + (controller,)
         )
 
     def get_worker_count(self) -> int:
@@ -98,6 +223,36 @@ class WorkerProperties:
         """
         return self.__count
 
+    def get_min_worker_count(self) -> int:
+        """
+        Returns the fewest workers when autoscaling.
+        """
+        return self.__min_count
+
+    def get_max_worker_count(self) -> int:
+        """
+        Returns the most workers when autoscaling.
+        """
+        return self.__max_count
+
+    def get_scheduling(self) -> "worker_scheduling.WorkerScheduling | None":
+        """
+        Returns the scheduling of each worker, None to inherit from main.
+        """
+        return self.__scheduling
+
+    def get_backend(self) -> worker_backends.WorkerBackend:
+        """
+        Returns what each worker runs as.
+        """
+        return self.__backend
+
+    def get_controller(self) -> worker_controller.WorkerController:
+        """
+        Returns the worker controller.
+        """
+        return self.__controller
+
     def get_worker_target(self) -> "(...) -> object":  # type: ignore
         """
         Returns the worker target.
@@ -117,12 +272,25 @@ class WorkerProperties:
         return self.__target.__name__
 
 
-class WorkerManager:
+class WorkerManager:  # pylint: disable=too-many-instance-attributes
     """
     For interprocess communication from main to worker.
     Contains exit and pause requests.
+
+    Each worker gets its own controller from the worker controller, so a single worker
+    can be stopped when scaling down.
     """
 
+    # Input queue depth, as a fraction of the max size, at which there is a backlog
+    __BACKLOG_DEPTH_RATIO = 0.5
+    # Fraction of time consumers wait for items
+    # Below this they are busy, above this they are idle
+    __BUSY_WAIT_RATIO = 0.1
+    __IDLE_WAIT_RATIO = 0.5
+
+    # Whether the objects of main were frozen before forking the first worker
+    __is_gc_frozen = False
+
     __create_key = object()
 
     @classmethod
@@ -139,11 +307,19 @@ class WorkerManager:
 
         Returns whether the workers were able to be created and the Worker Manager.
         """
+        # Written by each worker when it starts running
+        started_times = mp.RawArray("d", worker_properties.get_max_worker_count())
+        scheduling_failures = mp.RawArray("b", worker_properties.get_max_worker_count())
+
         workers = []
-        for _ in range(0, worker_properties.get_worker_count()):
+        controllers = []
+        for i in range(0, worker_properties.get_worker_count()):
+            controller = worker_properties.get_controller().create_worker_controller()
             result, worker = WorkerManager.__create_single_worker(
                 worker_properties.get_worker_target(),
-                worker_properties.get_worker_arguments(),
+                worker_properties.get_worker_arguments(controller),
+                (started_times, i, worker_properties.get_scheduling(), scheduling_failures),
+                worker_properties.get_backend(),
                 local_logger,
             )
             if not result:
@@ -151,19 +327,26 @@ class WorkerManager:
                 return False, None
 
             workers.append(worker)
+            controllers.append(controller)
 
         return True, WorkerManager(
             cls.__create_key,
             workers,
+            controllers,
             worker_properties,
+            started_times,
+            scheduling_failures,
             local_logger,
         )
 
     def __init__(
         self,
         class_private_create_key: object,
-        workers: "list[mp.Process]",
+        workers: "list[mp.Process | worker_backends.LocalWorker]",
+        controllers: "list[worker_controller.WorkerController]",
         worker_properties: WorkerProperties,
+        started_times: "mp.Array",  # type: ignore
+        scheduling_failures: "mp.Array",  # type: ignore
         local_logger: logger.Logger,
     ) -> None:
         """
@@ -172,22 +355,44 @@ class WorkerManager:
         assert class_private_create_key is WorkerManager.__create_key, "Use create() method"
 
         self.__workers = workers
+        self.__controllers = controllers
         self.__worker_properties = worker_properties
+        self.__started_times = started_times
+        self.__scheduling_failures = scheduling_failures
+        # Time each worker was last started, by worker index
+        self.__start_times = [0.0] * worker_properties.get_max_worker_count()
         self.__local_logger = local_logger
+        # Workers can be sampled, restarted and scaled from different threads of main
+        self.__lock = threading.RLock()
+
+        # Last resource sample of each worker for the summary, by worker index
+        self.__resource_samples: "list[worker_resources.WorkerResourceSample | None]" = []
+
+        # Input queue wait times at the last autoscale
+        self.__autoscale_time = time.monotonic()
+        self.__autoscale_wait_times: "list[float] | None" = None
 
     @staticmethod
-    def __create_single_worker(target: "(...) -> object", args: "tuple", local_logger: logger.Logger) -> "tuple[bool, mp.Process | None]":  # type: ignore
+    def __create_single_worker(target: "(...) -> object", args: "tuple", run_arguments: "tuple", backend: worker_backends.WorkerBackend, local_logger: logger.Logger) -> "tuple[bool, mp.Process | worker_backends.LocalWorker | None]":  # type: ignore
         """
         Creates a single worker.
 
         target: Function.
         args: Target function arguments.
+        run_arguments: Remaining arguments of `run_worker()`, from the started times.
+        backend: What the worker runs as.
         local_logger: Existing logger from process.
 
         Returns whether a worker was created and the worker.
         """
+        run_worker_arguments = (target, args) + run_arguments
         try:
-            worker = mp.Process(target=target, args=args)
+            if backend == worker_backends.WorkerBackend.THREAD:
+                worker = worker_backends.ThreadWorker(run_worker, run_worker_arguments)
+            elif backend == worker_backends.WorkerBackend.ASYNCIO:
+                worker = worker_backends.CoroutineWorker(run_worker, run_worker_arguments)
+            else:
+                worker = mp.Process(target=run_worker, args=run_worker_arguments)
         # Catching all exceptions for library call
         # pylint: disable-next=broad-exception-caught
         except Exception as e:
@@ -196,19 +401,279 @@ class WorkerManager:
 
         return True, worker
 
+    def __start_worker(self, index: int) -> None:
+        """
+        Starts the worker at the index.
+        """
+        # Forked workers share the memory of main until it is written,
+        # so keep the collector from writing to the objects which exist before the first fork
+        # Only once, since frozen objects are never collected in main either
+        if (
+            mp.get_start_method() == "fork"
+            and self.get_backend() == worker_backends.WorkerBackend.PROCESS
+            and not WorkerManager.__is_gc_frozen
+        ):
+            gc.freeze()
+            WorkerManager.__is_gc_frozen = True
+
+        self.__started_times[index] = 0.0
+        self.__scheduling_failures[index] = 0
+        self.__start_times[index] = time.monotonic()
+        self.__workers[index].start()
+
+    def __is_fork_unsafe(self) -> bool:
+        """
+        Returns whether starting a worker would fork main while thread or coroutine workers run.
+        """
+        return (
+            mp.get_start_method() == "fork"
+            and self.get_backend() == worker_backends.WorkerBackend.PROCESS
+            and worker_backends.has_threads_in_main()
+        )
+
     def start_workers(self) -> None:
         """
         Start workers.
+
+        Under spawn and forkserver, each start waits for the new process to take its arguments,
+        so the workers are started from concurrent threads. Forking is kept on this thread,
+        since forking while other threads run can copy a held lock into the worker.
+        `worker_manager.start_workers()` forks worker processes before starting any
+        thread or coroutine workers for the same reason.
         """
-        for worker in self.__workers:
-            worker.start()
+        with self.__lock:
+            if mp.get_start_method() == "fork":
+                for i in range(len(self.__workers)):
+                    self.__start_worker(i)
+
+                return
+
+            with concurrent.futures.ThreadPoolExecutor(len(self.__workers)) as executor:
+                # Raise any exception from starting
+                list(executor.map(self.__start_worker, range(len(self.__workers))))
 
-    def join_workers(self) -> None:
+    def is_running(self) -> bool:
         """
-        Join workers.
+        Returns whether every worker has started running since it was last started.
         """
-        for worker in self.__workers:
-            worker.join()
+        return None not in self.get_spawn_times()
+
+    def get_spawn_times(self) -> "list[float | None]":
+        """
+        Returns the time in seconds from starting each worker until it ran,
+        None if it has not run yet.
+        """
+        spawn_times = []
+        for i in range(len(self.__workers)):
+            if self.__started_times[i] < self.__start_times[i]:
+                spawn_times.append(None)
+                continue
+
+            spawn_times.append(self.__started_times[i] - self.__start_times[i])
+
+        return spawn_times
+
+    def get_resource_samples(self) -> "list[worker_resources.WorkerResourceSample | None]":
+        """
+        Samples the CPU time, memory, context switches and loop iterations of each worker.
+        The CPU time and context switches of thread and coroutine workers are of their thread.
+
+        Returns the samples by worker index, None for workers which are not running.
+        Removed workers which have exited are left out.
+        """
+        with self.__lock:
+            self.__remove_stopped_workers()
+            samples = []
+            for worker, controller in zip(self.__workers, self.__controllers):
+                if worker.pid is None or not worker.is_alive():
+                    samples.append(None)
+                    continue
+
+                # Thread and coroutine workers share the process of main
+                thread_id = None
+                if isinstance(worker, worker_backends.LocalWorker):
+                    thread_id = worker.native_id
+
+                samples.append(
+                    worker_resources.read_process_resources(
+                        worker.pid, controller.get_loop_count(), thread_id
+                    )
+                )
+
+            return samples
+
+    def log_resource_summary(self) -> None:
+        """
+        Logs the resource usage of each worker since the last summary. Call periodically from main.
+        """
+        samples = self.get_resource_samples()
+        for i, sample in enumerate(samples):
+            if sample is None:
+                self.__local_logger.info(f"{self.get_target_name()} worker {i}: not running")
+                continue
+
+            previous = None
+            if i < len(self.__resource_samples):
+                previous = self.__resource_samples[i]
+
+            self.__local_logger.info(
+                f"{self.get_target_name()} worker {i}: "
+                f"{worker_resources.format_resource_rates(previous, sample)}"
+            )
+
+        self.__resource_samples = samples
+
+    def __get_run_arguments(self, index: int) -> "tuple":
+        """
+        Returns the arguments of `run_worker()` after the worker arguments, for the worker index.
+        """
+        return (
+            self.__started_times,
+            index,
+            self.__worker_properties.get_scheduling(),
+            self.__scheduling_failures,
+        )
+
+    def check_scheduling(self) -> bool:
+        """
+        Logs a warning for each running worker which could not apply all of its scheduling
+        (e.g. real time without permission), those workers run with the rest of the settings.
+
+        Returns whether every running worker applied all of its scheduling.
+        """
+        is_applied = True
+        for i, worker in enumerate(self.get_workers()):
+            if self.__scheduling_failures[i] == 0:
+                continue
+
+            is_applied = False
+            self.__local_logger.warning(
+                f"{self.get_target_name()} {worker.name} could not apply all of "
+                f"{self.__worker_properties.get_scheduling()}",
+                True,
+            )
+
+        return is_applied
+
+    def join_workers(self, timeout: "float | None" = None) -> bool:
+        """
+        Join workers, waiting on all of them at once.
+
+        timeout: Total time waiting in seconds for all workers, None waits forever.
+
+        Returns whether all workers have exited.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        # Workers which were never started cannot be joined
+        workers = [worker for worker in self.get_workers() if worker.pid is not None]
+        while True:
+            # Also reaps the exited workers
+            alive_workers = [worker for worker in workers if worker.is_alive()]
+            if len(alive_workers) == 0:
+                return True
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    return False
+
+            multiprocessing.connection.wait(
+                [worker.sentinel for worker in alive_workers], remaining
+            )
+
+    def get_workers(self) -> "list[mp.Process | worker_backends.LocalWorker]":
+        """
+        Returns a copy of the list of workers, without the removed workers which have exited.
+        """
+        with self.__lock:
+            self.__remove_stopped_workers()
+            return list(self.__workers)
+
+    def get_target_name(self) -> str:
+        """
+        Returns the name of the target of the workers.
+        """
+        return self.__worker_properties.get_target_name()
+
+    def get_backend(self) -> worker_backends.WorkerBackend:
+        """
+        Returns what each worker runs as.
+        """
+        return self.__worker_properties.get_backend()
+
+    def replace_worker(self, worker: "mp.Process | worker_backends.LocalWorker") -> bool:
+        """
+        Replaces the worker with a new worker and starts it, see `restart_worker()`.
+
+        Returns whether the new worker was started, False if the worker has been removed.
+        """
+        with self.__lock:
+            if worker not in self.__workers:
+                return False
+
+            return self.restart_worker(self.__workers.index(worker))
+
+    def restart_worker(self, index: int) -> bool:
+        """
+        Replaces the worker at the index with a new worker and starts it.
+
+        Under fork, worker processes are not restarted while thread or coroutine workers run
+        in main, since forking can copy a lock held by one of their threads into the worker.
+        Use the forkserver or spawn start method to restart them.
+
+        Returns whether the new worker was started.
+        """
+        with self.__lock:
+            return self.__restart_worker(index)
+
+    def __restart_worker(self, index: int) -> bool:
+        """
+        Same as `restart_worker()`, with the lock held.
+        """
+        target_and_worker_name = (
+            f"{self.__worker_properties.get_target_name()} {self.__workers[index].name}"
+        )
+
+        if self.__is_fork_unsafe():
+            self.__local_logger.error(
+                f"Not restarting {target_and_worker_name}, "
+                "forking while thread or coroutine workers run in main is unsafe",
+                True,
+            )
+            return False
+
+        controller = self.__worker_properties.get_controller().create_worker_controller()
+        result, new_worker = WorkerManager.__create_single_worker(
+            self.__worker_properties.get_worker_target(),
+            self.__worker_properties.get_worker_arguments(controller),
+            self.__get_run_arguments(index),
+            self.__worker_properties.get_backend(),
+            self.__local_logger,
+        )
+        if not result:
+            self.__local_logger.error(f"Failed to restart {target_and_worker_name}", True)
+            return False
+
+        # Get Pylance to stop complaining
+        assert new_worker is not None
+
+        self.__workers[index] = new_worker
+        self.__controllers[index] = controller
+        try:
+            self.__start_worker(index)
+        # Catching all exceptions for library call
+        # pylint: disable-next=broad-exception-caught
+        except Exception as e:
+            self.__local_logger.error(
+                f"Exception raised while restarting {target_and_worker_name}: {e}", True
+            )
+            return False
+
+        return True
 
     def check_and_restart_dead_workers(self) -> bool:
         """
@@ -216,10 +681,8 @@ class WorkerManager:
 
         Returns whether the dead workers were able to be restarted.
         """
-        new_workers = []
-        for worker in self.__workers:
-            if worker.is_alive():
-                new_workers.append(worker)
+        for i, worker in enumerate(self.__workers):
+            if worker.is_alive() or self.__controllers[i].is_stop_requested():
                 continue
 
             # Log dead worker
@@ -229,19 +692,609 @@ class WorkerManager:
                 True,
             )
 
-            # Create a new worker
-            result, new_worker = WorkerManager.__create_single_worker(
-                self.__worker_properties.get_worker_target(),
-                self.__worker_properties.get_worker_arguments(),
-                self.__local_logger,
-            )
-            if not result:
-                self.__local_logger.error(f"Failed to restart {target_and_worker_name}", True)
+            if not self.restart_worker(i):
                 return False
 
-            # Append the new worker
-            new_workers.append(new_worker)
+        return True
 
-        self.__workers = new_workers
+    def get_active_worker_count(self) -> int:
+        """
+        Returns the number of workers which have not been requested to stop.
+        """
+        return sum(1 for controller in self.__controllers if not controller.is_stop_requested())
+
+    def __add_worker(self) -> bool:
+        """
+        Creates and starts a worker at the end of the list.
+
+        Returns whether the worker was started.
+        """
+        with self.__lock:
+            return self.__add_worker_locked()
+
+    def __add_worker_locked(self) -> bool:
+        """
+        Same as `__add_worker()`, with the lock held.
+        """
+        if self.__is_fork_unsafe():
+            self.__local_logger.error(
+                f"Not adding a worker to {self.get_target_name()}, "
+                "forking while thread or coroutine workers run in main is unsafe",
+                True,
+            )
+            return False
+
+        index = len(self.__workers)
+        controller = self.__worker_properties.get_controller().create_worker_controller()
+        result, worker = WorkerManager.__create_single_worker(
+            self.__worker_properties.get_worker_target(),
+            self.__worker_properties.get_worker_arguments(controller),
+            self.__get_run_arguments(index),
+            self.__worker_properties.get_backend(),
+            self.__local_logger,
+        )
+        if not result:
+            return False
+
+        # Get Pylance to stop complaining
+        assert worker is not None
+
+        self.__workers.append(worker)
+        self.__controllers.append(controller)
+        self.__start_worker(index)
 
         return True
+
+    def __remove_worker(self) -> None:
+        """
+        Requests the last active worker to stop, it is removed once it has exited.
+        """
+        for controller in reversed(self.__controllers):
+            if not controller.is_stop_requested():
+                controller.request_stop()
+                return
+
+    def __remove_stopped_workers(self) -> bool:
+        """
+        Removes workers at the end of the list which were requested to stop and have exited.
+
+        Returns whether no stopped worker is still running.
+        """
+        with self.__lock:
+            while len(self.__controllers) > 0 and self.__controllers[-1].is_stop_requested():
+                if self.__workers[-1].is_alive():
+                    return False
+
+                self.__workers.pop().join()
+                self.__controllers.pop()
+
+        return True
+
+    def __get_input_load(self) -> "tuple[bool, float | None]":
+        """
+        Returns whether any input queue has a backlog, and the fraction of time
+        the consumers waited for items since the last call (None if no input queue is instrumented).
+        """
+        now = time.monotonic()
+        elapsed = now - self.__autoscale_time
+        self.__autoscale_time = now
+
+        is_backlogged = False
+        wait_times = []
+        for queue in self.__worker_properties.get_input_queues():
+            statistics = queue.get_statistics()
+            backlog_depth = max(1, int(queue.maxsize * self.__BACKLOG_DEPTH_RATIO))
+            if queue.maxsize <= 0:
+                backlog_depth = max(1, self.get_active_worker_count())
+
+            if statistics.depth is not None and statistics.depth >= backlog_depth:
+                is_backlogged = True
+
+            if queue.is_instrumented:
+                wait_times.append(statistics.wait_time)
+
+        previous_wait_times = self.__autoscale_wait_times
+        self.__autoscale_wait_times = wait_times
+        if len(wait_times) == 0 or previous_wait_times is None or elapsed <= 0.0:
+            return is_backlogged, None
+
+        wait_time = sum(wait_times) - sum(previous_wait_times)
+        # Average over the queues and workers
+        return is_backlogged, wait_time / (elapsed * len(wait_times) * len(self.__workers))
+
+    def autoscale(self) -> int:
+        """
+        Adds or removes a worker based on the load on the input queues,
+        within the min and max counts of the worker properties.
+
+        Scales up while an input queue has a backlog and the consumers are busy.
+        Scales down while the consumers are mostly waiting for items,
+        which needs at least 1 instrumented input queue.
+        Workers with no input queues are not scaled. Call periodically from main.
+        Like `restart_worker()`, worker processes are not added under fork
+        while thread or coroutine workers run in main.
+
+        Returns the change in the number of active workers.
+        """
+        if len(self.__worker_properties.get_input_queues()) == 0:
+            return 0
+
+        # Only scale once the last removed worker has exited, so removed workers are always last
+        if not self.__remove_stopped_workers():
+            return 0
+
+        is_backlogged, wait_ratio = self.__get_input_load()
+        count = len(self.__workers)
+
+        is_busy = wait_ratio is None or wait_ratio < self.__BUSY_WAIT_RATIO
+        if is_backlogged and is_busy and count < self.__worker_properties.get_max_worker_count():
+            if not self.__add_worker():
+                self.__local_logger.error("Failed to add worker", True)
+                return 0
+
+            self.__local_logger.info(
+                f"Scaled up {self.get_target_name()} to {count + 1} workers", True
+            )
+            return 1
+
+        is_idle = wait_ratio is not None and wait_ratio > self.__IDLE_WAIT_RATIO
+        if is_idle and count > self.__worker_properties.get_min_worker_count():
+            self.__remove_worker()
+            self.__local_logger.info(
+                f"Scaling down {self.get_target_name()} to {count - 1} workers", True
+            )
+            return -1
+
+        return 0
+
+    def scale_to(self, count: int, timeout: float = SCALE_TIMEOUT) -> bool:
+        """
+        Starts or stops workers at runtime until count workers are active,
+        within the min and max counts of the worker properties.
+
+        New workers are started with the arguments of the worker properties. Surplus workers
+        are requested to stop through their own controller, so they finish their current item,
+        and are removed once they have exited. Scaling up first waits for removed workers
+        which are still running, so removed workers are always last. Like `restart_worker()`,
+        worker processes are not added under fork while thread or coroutine workers run in main.
+
+        count: Number of active workers.
+        timeout: Time waiting for removed workers to exit in seconds.
+
+        Returns whether count workers are active.
+        """
+        min_count = self.__worker_properties.get_min_worker_count()
+        max_count = self.__worker_properties.get_max_worker_count()
+        if not min_count <= count <= max_count:
+            self.__local_logger.error(
+                f"Worker count {count} of {self.get_target_name()} "
+                f"is not from {min_count} to {max_count}",
+                True,
+            )
+            return False
+
+        with self.__lock:
+            previous_count = self.get_active_worker_count()
+            for _ in range(previous_count - count):
+                self.__remove_worker()
+
+            # Removed workers are last
+            removed_workers = [
+                worker
+                for worker, controller in zip(self.__workers, self.__controllers)
+                if controller.is_stop_requested()
+            ]
+
+        if count > previous_count:
+            # Without the lock, so the workers can be sampled and restarted meanwhile
+            deadline = time.monotonic() + timeout
+            for worker in removed_workers:
+                if worker.pid is not None:
+                    worker.join(max(deadline - time.monotonic(), 0.0))
+
+            with self.__lock:
+                if not self.__remove_stopped_workers():
+                    self.__local_logger.error(
+                        f"Removed workers of {self.get_target_name()} did not exit, "
+                        f"not scaling up",
+                        True,
+                    )
+                    return False
+
+                for _ in range(count - self.get_active_worker_count()):
+                    if not self.__add_worker_locked():
+                        self.__local_logger.error(
+                            f"Failed to add worker, {self.get_target_name()} has "
+                            f"{self.get_active_worker_count()} workers",
+                            True,
+                        )
+                        return False
+
+        if count != previous_count:
+            self.__local_logger.info(
+                f"Scaled {self.get_target_name()} from {previous_count} to {count} workers", True
+            )
+
+        return True
+
+
+class WorkerSupervisor:  # pylint: disable=too-many-instance-attributes
+    """
+    Restarts crashed workers, call `supervise()` periodically from main.
+
+    Crashes are seen when `supervise()` is called, or while it waits on the workers
+    for its timeout. Workers are restarted from the thread which calls it, so the supervisor
+    adds no thread of its own to main. Under fork, worker processes are not restarted
+    while thread or coroutine workers run in main, see `WorkerManager.restart_worker()`.
+    A crashed worker (non-zero exit code) is restarted after an exponential backoff,
+    at the first call once the backoff has passed. A worker which crashes too often within
+    the crash loop period is not restarted again. Workers which exit normally
+    are not restarted, and nothing is restarted once exit is requested.
+    """
+
+    __create_key = object()
+
+    @classmethod
+    def create(
+        cls,
+        worker_managers: "list[WorkerManager]",
+        controller: worker_controller.WorkerController,
+        local_logger: logger.Logger,
+        backoff_initial: float = 0.1,
+        backoff_max: float = 5.0,
+        crash_loop_count: int = 5,
+        crash_loop_period: float = 60.0,
+    ) -> "tuple[bool, WorkerSupervisor | None]":
+        """
+        Creates a supervisor, call `supervise()` after starting the workers.
+
+        worker_managers: Managers of the workers to supervise.
+        controller: Controller of the workers.
+        local_logger: Existing logger from process.
+        backoff_initial: Delay in seconds before the first restart of a worker.
+        backoff_max: Longest delay in seconds before a restart, doubled for each recent crash.
+        crash_loop_count: Number of crashes of a worker within the period to stop restarting it.
+        crash_loop_period: Time in seconds which crashes are counted over.
+
+        Returns the WorkerSupervisor object.
+        """
+        if backoff_initial < 0.0 or backoff_max < backoff_initial:
+            local_logger.error("Backoff must be non-negative and at most the max", True)
+            return False, None
+
+        if crash_loop_count <= 0 or crash_loop_period <= 0.0:
+            local_logger.error("Crash loop count and period must be greater than 0", True)
+            return False, None
+
+        return True, WorkerSupervisor(
+            cls.__create_key,
+            worker_managers,
+            controller,
+            local_logger,
+            backoff_initial,
+            backoff_max,
+            crash_loop_count,
+            crash_loop_period,
+        )
+
+    def __init__(
+        self,
+        class_private_create_key: object,
+        worker_managers: "list[WorkerManager]",
+        controller: worker_controller.WorkerController,
+        local_logger: logger.Logger,
+        backoff_initial: float,
+        backoff_max: float,
+        crash_loop_count: int,
+        crash_loop_period: float,
+    ) -> None:
+        """
+        Private constructor, use create() method.
+        """
+        assert class_private_create_key is WorkerSupervisor.__create_key, "Use create() method"
+
+        self.__worker_managers = worker_managers
+        self.__controller = controller
+        self.__local_logger = local_logger
+        self.__backoff_initial = backoff_initial
+        self.__backoff_max = backoff_max
+        self.__crash_loop_count = crash_loop_count
+        self.__crash_loop_period = crash_loop_period
+
+        # Workers which are not watched anymore
+        self.__finished: "set[mp.Process | worker_backends.LocalWorker]" = set()
+        # Crashed workers to manager index, restart time, and crash time
+        self.__pending: (
+            "dict[mp.Process | worker_backends.LocalWorker, tuple[int, float, float]]"
+        ) = {}
+        # Manager index and worker index to recent crash times
+        self.__crash_times: "dict[tuple[int, int], list[float]]" = {}
+
+        # Seconds from seeing each crash to the replacement starting
+        self.__restart_latencies: "list[float]" = []
+
+    def get_restart_latencies(self) -> "list[float]":
+        """
+        Returns the time in seconds from seeing each crash to the replacement starting,
+        including the backoff.
+        """
+        return list(self.__restart_latencies)
+
+    def __get_watched_sentinels(
+        self,
+    ) -> "dict[int, tuple[int, mp.Process | worker_backends.LocalWorker]]":
+        """
+        Returns the sentinels of the started workers which are still watched
+        to the manager index and worker.
+        """
+        sentinels = {}
+        for i, manager in enumerate(self.__worker_managers):
+            for worker in manager.get_workers():
+                if worker.pid is None or worker in self.__finished or worker in self.__pending:
+                    continue
+
+                sentinels[worker.sentinel] = (i, worker)
+
+        return sentinels
+
+    def __handle_crash(
+        self,
+        manager_index: int,
+        worker: "mp.Process | worker_backends.LocalWorker",
+        crash_times: "list[float]",
+        now: float,
+    ) -> "float | None":
+        """
+        Records the crash and returns the backoff in seconds, None if the worker is crash looping.
+        """
+        crash_times.append(now)
+        while crash_times[0] < now - self.__crash_loop_period:
+            crash_times.pop(0)
+
+        name = f"{self.__worker_managers[manager_index].get_target_name()} {worker.name}"
+
+        if len(crash_times) >= self.__crash_loop_count:
+            self.__local_logger.error(
+                f"{name} crashed {len(crash_times)} times in {self.__crash_loop_period}s, "
+                "not restarting",
+                True,
+            )
+            return None
+
+        backoff = min(self.__backoff_initial * 2 ** (len(crash_times) - 1), self.__backoff_max)
+        self.__local_logger.warning(
+            f"{name} crashed with exit code {worker.exitcode}, restarting in {backoff:.3f}s",
+            True,
+        )
+        return backoff
+
+    def supervise(self, timeout: float = 0.0) -> int:
+        """
+        Records the workers which crashed and restarts those whose backoff has passed.
+
+        timeout: Longest time in seconds waiting for a worker to exit,
+        returns early once a worker has been restarted.
+
+        Returns the number of workers restarted.
+        """
+        # Workers stop on their own once exit is requested
+        if self.__controller.is_exit_requested():
+            return 0
+
+        deadline = time.monotonic() + timeout
+        while True:
+            restart_count = self.__restart_due_workers()
+            remaining = deadline - time.monotonic()
+            if restart_count > 0 or remaining <= 0.0:
+                return restart_count
+
+            for _, restart_time, _ in self.__pending.values():
+                remaining = min(remaining, max(0.0, restart_time - time.monotonic()))
+
+            # Also returns on timeout to watch workers added by autoscaling
+            sentinels = self.__get_watched_sentinels()
+            if len(multiprocessing.connection.wait(list(sentinels), remaining)) == 0:
+                if len(self.__pending) == 0:
+                    return 0
+
+    def __restart_due_workers(self) -> int:
+        """
+        Records the workers which have crashed, and restarts those whose backoff has passed.
+
+        Returns the number of workers restarted.
+        """
+        sentinels = self.__get_watched_sentinels()
+        now = time.monotonic()
+        for sentinel in multiprocessing.connection.wait(list(sentinels), 0.0):
+            manager_index, worker = sentinels[sentinel]  # type: ignore
+            worker.join()
+            workers = self.__worker_managers[manager_index].get_workers()
+            # Exited normally, or was removed by scaling down
+            if worker.exitcode == 0 or worker not in workers:
+                self.__finished.add(worker)
+                continue
+
+            key = (manager_index, workers.index(worker))
+            backoff = self.__handle_crash(
+                manager_index, worker, self.__crash_times.setdefault(key, []), now
+            )
+            if backoff is None:
+                self.__finished.add(worker)
+                continue
+
+            self.__pending[worker] = (manager_index, now + backoff, now)
+
+        restart_count = 0
+        for worker, (manager_index, restart_time, crash_time) in list(self.__pending.items()):
+            if restart_time > time.monotonic():
+                continue
+
+            del self.__pending[worker]
+            self.__finished.add(worker)
+            manager = self.__worker_managers[manager_index]
+            if not manager.replace_worker(worker):
+                continue
+
+            restart_count += 1
+            latency = time.monotonic() - crash_time
+            self.__restart_latencies.append(latency)
+            self.__local_logger.info(
+                f"Restarted {manager.get_target_name()} {worker.name} "
+                f"{latency * 1000:.1f}ms after it crashed",
+                True,
+            )
+
+        return restart_count
+
+
+def start_workers(worker_managers: "list[WorkerManager]", timeout: "float | None" = None) -> bool:
+    """
+    Starts the workers of all managers and waits until every worker has started running,
+    see `WorkerManager.get_spawn_times()` for the time each worker took.
+
+    worker_managers: Managers of the workers to start.
+    timeout: Total time waiting in seconds, None waits forever.
+
+    Returns whether all workers are running.
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+
+    # Fork the processes before main has worker threads, which could hold a lock while forking
+    for manager in sorted(
+        worker_managers,
+        key=lambda manager: manager.get_backend() != worker_backends.WorkerBackend.PROCESS,
+    ):
+        manager.start_workers()
+
+    while not all(manager.is_running() for manager in worker_managers):
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+
+        time.sleep(START_POLL_PERIOD)
+
+    return True
+
+
+class StopPhase(enum.Enum):
+    """
+    How a worker was made to exit, each phase is more forceful than the last.
+    """
+
+    EXIT_REQUEST = "exit request"
+    TERMINATE = "SIGTERM"
+    KILL = "SIGKILL"
+
+
+class WorkerStopTime:
+    """
+    When a worker exited while stopping, or when it was left running
+    because its backend cannot force it to stop (e.g. a thread).
+    """
+
+    def __init__(
+        self, name: str, phase: StopPhase, stop_time: float, is_stopped: bool = True
+    ) -> None:
+        self.name = name
+        self.phase = phase
+        self.stop_time = stop_time  # s, from the exit request
+        self.is_stopped = is_stopped
+
+    def __str__(self) -> str:
+        if not self.is_stopped:
+            return (
+                f"{self.name} is still running, cannot be sent {self.phase.value} "
+                f"after {self.stop_time * 1000:.1f}ms"
+            )
+
+        return f"{self.name} exited on {self.phase.value} after {self.stop_time * 1000:.1f}ms"
+
+
+def stop_workers(
+    controller: worker_controller.WorkerController,
+    worker_managers: "list[WorkerManager]",
+    queues: "list[queue_proxy_wrapper.QueueProxyWrapper]",
+    timeout: "float | None" = None,
+    terminate_timeout: float = TERMINATE_TIMEOUT,
+) -> "tuple[bool, list[WorkerStopTime]]":
+    """
+    Requests exit and then fills and drains the queues until all workers have exited.
+    Workers still running after the timeout are sent SIGTERM,
+    and those still running after the terminate timeout are sent SIGKILL.
+    Workers whose backend cannot be forced to stop (threads) are left running
+    and reported as not stopped.
+
+    Workers waiting on the controller wake up on the request, and workers blocked on a queue
+    are woken up by the sentinels or the drain, so stopping takes milliseconds.
+
+    controller: Controller of the workers.
+    worker_managers: Managers of the workers to stop.
+    queues: Queues between the workers, from END TO START.
+    timeout: Time waiting in seconds for the workers to exit on the request,
+    None waits forever.
+    terminate_timeout: Time waiting in seconds after each signal.
+
+    Returns whether all workers have exited, and when each worker exited in order of exiting.
+    """
+    start_time = time.monotonic()
+    phase = StopPhase.EXIT_REQUEST
+    phase_deadline = None
+    if timeout is not None:
+        phase_deadline = start_time + timeout
+
+    # Workers which were never started cannot be joined
+    running = {}
+    for manager in worker_managers:
+        for worker in manager.get_workers():
+            if worker.pid is not None:
+                running[worker.sentinel] = (manager, worker)
+
+    controller.request_exit()
+
+    stop_times = []
+    is_stopped = True
+    while len(running) > 0:
+        if phase == StopPhase.EXIT_REQUEST:
+            for queue in queues:
+                queue.fill_and_drain_queue()
+
+        ready = multiprocessing.connection.wait(list(running), STOP_POLL_PERIOD)
+        now = time.monotonic()
+        for sentinel in ready:
+            manager, worker = running.pop(sentinel)  # type: ignore
+            worker.join()
+            stop_times.append(
+                WorkerStopTime(
+                    f"{manager.get_target_name()} {worker.name}", phase, now - start_time
+                )
+            )
+
+        if len(running) == 0 or phase_deadline is None or now < phase_deadline:
+            continue
+
+        if phase == StopPhase.KILL:
+            return False, stop_times
+
+        phase = StopPhase.TERMINATE if phase == StopPhase.EXIT_REQUEST else StopPhase.KILL
+        phase_deadline = now + terminate_timeout
+        for sentinel, (manager, worker) in list(running.items()):
+            if phase == StopPhase.TERMINATE:
+                is_forced = worker.terminate()
+            else:
+                is_forced = worker.kill()
+
+            # Processes return None, local workers whether they can be forced
+            if is_forced is False:
+                del running[sentinel]
+                is_stopped = False
+                stop_times.append(
+                    WorkerStopTime(
+                        f"{manager.get_target_name()} {worker.name}",
+                        phase,
+                        now - start_time,
+                        False,
+                    )
+                )
+
+    return is_stopped, stop_times
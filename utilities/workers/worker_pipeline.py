@@ -0,0 +1,640 @@
+"""
+Pipeline of worker stages connected by queues.
+"""
+
+import multiprocessing.managers
+import os
+import queue
+import threading
+import traceback
+
+from modules.common.modules.logger import logger
+from utilities.workers import queue_proxy_wrapper
+from utilities.workers import worker_backends
+from utilities.workers import worker_controller
+from utilities.workers import worker_manager
+
+# Only used in annotations
+# pylint: disable-next=unused-import
+from utilities.workers import worker_scheduling
+
+
+class PipelineStage:  # pylint: disable=too-many-instance-attributes
+    """
+    Workers running the same target, declared with `Pipeline.add_stage()`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        target: "(...) -> object",  # type: ignore
+        work_arguments: "tuple",
+        count: int,
+        min_count: "int | None",
+        max_count: "int | None",
+        scheduling: "worker_scheduling.WorkerScheduling | None",
+        backend: worker_backends.WorkerBackend,
+    ) -> None:
+        self.name = name
+        self.target = target
+        self.work_arguments = work_arguments
+        self.count = count
+        self.min_count = min_count
+        self.max_count = max_count
+        self.scheduling = scheduling
+        self.backend = backend
+        # Names of the queues in order of declaration
+        self.input_queues: "list[str]" = []
+        self.output_queues: "list[str]" = []
+
+    def is_single_process(self) -> bool:
+        """
+        Returns whether the stage always has exactly 1 worker, which is a process.
+        """
+        return (
+            self.backend == worker_backends.WorkerBackend.PROCESS
+            and self.count == 1
+            and self.min_count in (None, 1)
+            and self.max_count in (None, 1)
+        )
+
+
+class PipelineQueue:
+    """
+    Queue between 2 stages or a stage and main, declared with `Pipeline.add_queue()`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        producer: "str | None",
+        consumer: "str | None",
+        fuse: bool,
+        options: dict,
+    ) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.producer = producer  # Stage name, None for main
+        self.consumer = consumer  # Stage name, None for main
+        self.fuse = fuse  # Whether the producer and consumer always run in 1 process
+        self.options = options  # Keyword arguments of `QueueProxyWrapper`
+
+
+class FusedWorkers:
+    """
+    Runs the workers of several single worker stages as threads of 1 process,
+    so the queues between them are local to the process instead of hosted by the manager.
+
+    Passed to the worker manager as the target. Each stage is a tuple of the target,
+    its work arguments, its input and output queues, where a queue is
+    either a queue wrapper or the index of a fused queue, and its scheduling.
+    Each worker applies the scheduling of its stage to its own thread, so stages keep
+    their own scheduling when fused. Settings which could not be applied are printed,
+    since `WorkerManager.check_scheduling()` only sees the scheduling of whole processes.
+
+    A worker which raises exits the whole process, so the supervisor restarts all of them.
+    A worker which returns puts the sentinel (None) in its fused output queues, which only wakes up
+    the workers after it if they are waiting on those queues. Like any worker, they exit
+    once exit is requested, not on the sentinel.
+    """
+
+    __SENTINEL_TIMEOUT = 1.0  # seconds
+
+    def __init__(
+        self, stages: "list[tuple]", fused_queues: "list[tuple[int, dict]]", name: str
+    ) -> None:
+        """
+        stages: Workers in topological order.
+        fused_queues: Max size and options of each queue between the workers.
+        name: Name of the fused stages, for logging.
+        """
+        self.__stages = stages
+        self.__fused_queues = fused_queues
+        # Read as the name of the target by the worker properties
+        self.__name__ = name
+
+    @staticmethod
+    def __run_worker(
+        target: "(...) -> object",  # type: ignore
+        args: "tuple",
+        output_queues: "list[queue_proxy_wrapper.QueueProxyWrapper]",
+        scheduling: "worker_scheduling.WorkerScheduling | None",
+    ) -> None:
+        """
+        Applies the scheduling, runs the worker and then wakes up the workers it feeds.
+        """
+        if scheduling is not None:
+            failures = scheduling.apply()
+            if len(failures) > 0:
+                print(f"WARNING: {target.__name__} could not apply {failures} of {scheduling}")
+
+        try:
+            target(*args)
+        # The whole process is restarted on any crash
+        # pylint: disable-next=broad-exception-caught
+        except BaseException:
+            traceback.print_exc()
+            # pylint: disable-next=protected-access
+            os._exit(1)
+
+        # Fused stages have 1 worker, so 1 sentinel is enough
+        for output_queue in output_queues:
+            try:
+                output_queue.queue.put(None, timeout=FusedWorkers.__SENTINEL_TIMEOUT)
+            except queue.Full:
+                pass
+
+    def __call__(self, controller: worker_controller.WorkerController) -> None:
+        """
+        Creates the fused queues and runs each worker in its own thread.
+        """
+        fused_queues = [
+            queue_proxy_wrapper.QueueProxyWrapper(None, maxsize, **options)
+            for maxsize, options in self.__fused_queues
+        ]
+
+        def resolve(stage_queue: "queue_proxy_wrapper.QueueProxyWrapper | int") -> object:
+            if isinstance(stage_queue, int):
+                return fused_queues[stage_queue]
+
+            return stage_queue
+
+        threads = []
+        for target, work_arguments, input_queues, output_queues, scheduling in self.__stages:
+            inputs = [resolve(stage_queue) for stage_queue in input_queues]
+            outputs = [resolve(stage_queue) for stage_queue in output_queues]
+            fused_outputs = [
+                fused_queues[stage_queue]
+                for stage_queue in output_queues
+                if isinstance(stage_queue, int)
+            ]
+            threads.append(
+                threading.Thread(
+                    target=self.__run_worker,
+                    args=(
+                        target,
+                        work_arguments + tuple(inputs) + tuple(outputs) + (controller,),
+                        fused_outputs,
+                        scheduling,
+                    ),
+                    name=target.__name__,
+                )
+            )
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+
+class Pipeline:  # pylint: disable=too-many-instance-attributes
+    """
+    Graph of worker stages and the queues between them.
+
+    Declare the stages and queues, then `build()` creates the queues, worker properties
+    and worker managers. Stages are started in topological order (producers first),
+    and on stop the queues are drained in reverse (END TO START).
+    Queues produced or consumed by main have no producer or consumer stage.
+
+    Adjacent stages which always have exactly 1 worker process can be fused into 1 process,
+    see `FusedWorkers`, which skips the manager round trip between them.
+    Stages are fused if their queue is declared with `fuse`, or by `build()`
+    if they have equal scheduling.
+    """
+
+    # Queue options which only matter between processes, left out of fused queues
+    __PROCESS_QUEUE_OPTIONS = ("layout", "codec", "doorbell")
+
+    __create_key = object()
+
+    @classmethod
+    def create(
+        cls,
+        mp_manager: multiprocessing.managers.SyncManager,
+        controller: worker_controller.WorkerController,
+        local_logger: logger.Logger,
+    ) -> "tuple[bool, Pipeline | None]":
+        """
+        Creates an empty pipeline.
+
+        mp_manager: Manager which hosts the queues.
+        controller: Controller of all workers in the pipeline.
+        local_logger: Existing logger from process.
+
+        Returns the Pipeline object.
+        """
+        return True, Pipeline(cls.__create_key, mp_manager, controller, local_logger)
+
+    def __init__(
+        self,
+        class_private_create_key: object,
+        mp_manager: multiprocessing.managers.SyncManager,
+        controller: worker_controller.WorkerController,
+        local_logger: logger.Logger,
+    ) -> None:
+        """
+        Private constructor, use create() method.
+        """
+        assert class_private_create_key is Pipeline.__create_key, "Use create() method"
+
+        self.__mp_manager = mp_manager
+        self.__controller = controller
+        self.__local_logger = local_logger
+
+        self.__stages: "dict[str, PipelineStage]" = {}
+        self.__queue_specs: "dict[str, PipelineQueue]" = {}
+        # Build fails after a failed declaration, so declarations do not each need checking
+        self.__is_declaration_failed = False
+
+        # Created by build()
+        self.__is_built = False
+        self.__queues: "dict[str, queue_proxy_wrapper.QueueProxyWrapper]" = {}
+        self.__worker_managers: "list[worker_manager.WorkerManager]" = []
+        # Managers of stages which were not fused, for scaling a single stage
+        self.__stage_managers: "dict[str, worker_manager.WorkerManager]" = {}
+        # Queues between processes, from END TO START
+        self.__drain_order: "list[queue_proxy_wrapper.QueueProxyWrapper]" = []
+
+    def add_stage(
+        self,
+        name: str,
+        target: "(...) -> object",  # type: ignore
+        work_arguments: "tuple" = (),
+        count: int = 1,
+        min_count: "int | None" = None,
+        max_count: "int | None" = None,
+        scheduling: "worker_scheduling.WorkerScheduling | None" = None,
+        backend: worker_backends.WorkerBackend = worker_backends.WorkerBackend.PROCESS,
+    ) -> bool:
+        """
+        Declares a stage, see `worker_manager.WorkerProperties.create()` for the arguments.
+        Its queues are passed after the work arguments, in order of declaration.
+
+        name: Unique name of the stage, used by the queues.
+
+        Returns whether the stage was added, otherwise `build()` fails.
+        """
+        if self.__is_built:
+            self.__local_logger.error("Pipeline is already built", True)
+            return False
+
+        if name in self.__stages:
+            self.__local_logger.error(f"Stage {name} already exists", True)
+            self.__is_declaration_failed = True
+            return False
+
+        self.__stages[name] = PipelineStage(
+            name, target, work_arguments, count, min_count, max_count, scheduling, backend
+        )
+        return True
+
+    def add_queue(
+        self,
+        name: str,
+        maxsize: int = 0,
+        producer: "str | None" = None,
+        consumer: "str | None" = None,
+        fuse: bool = False,
+        **options: object,
+    ) -> bool:
+        """
+        Declares a queue from the producer stage to the consumer stage.
+
+        name: Unique name of the queue.
+        maxsize: See `queue_proxy_wrapper.QueueProxyWrapper`.
+        producer: Name of the stage which puts into the queue, None for main.
+        consumer: Name of the stage which gets from the queue, None for main.
+        fuse: Whether the producer and consumer always run in 1 process, each stage with
+        its own scheduling. Both must always have exactly 1 worker process.
+        options: Other keyword arguments of `queue_proxy_wrapper.QueueProxyWrapper`.
+
+        Returns whether the queue was added, otherwise `build()` fails.
+        """
+        if self.__is_built:
+            self.__local_logger.error("Pipeline is already built", True)
+            return False
+
+        if name in self.__queue_specs:
+            self.__local_logger.error(f"Queue {name} already exists", True)
+            self.__is_declaration_failed = True
+            return False
+
+        if producer is None and consumer is None:
+            self.__local_logger.error(f"Queue {name} needs a producer or a consumer stage", True)
+            self.__is_declaration_failed = True
+            return False
+
+        for stage_name in (producer, consumer):
+            if stage_name is not None and stage_name not in self.__stages:
+                self.__local_logger.error(f"Queue {name} has unknown stage {stage_name}", True)
+                self.__is_declaration_failed = True
+                return False
+
+        if fuse and (
+            producer is None
+            or consumer is None
+            or not self.__stages[producer].is_single_process()
+            or not self.__stages[consumer].is_single_process()
+        ):
+            self.__local_logger.error(
+                f"Queue {name} can only be fused between stages of exactly 1 worker process",
+                True,
+            )
+            self.__is_declaration_failed = True
+            return False
+
+        self.__queue_specs[name] = PipelineQueue(name, maxsize, producer, consumer, fuse, options)
+        if producer is not None:
+            self.__stages[producer].output_queues.append(name)
+
+        if consumer is not None:
+            self.__stages[consumer].input_queues.append(name)
+
+        return True
+
+    def __sort_stages(self) -> "list[str] | None":
+        """
+        Returns the stage names in topological order, keeping the order of declaration
+        where there is a choice, or None if the stages form a cycle.
+        """
+        remaining_inputs = {
+            name: sum(
+                1
+                for queue_name in stage.input_queues
+                if self.__queue_specs[queue_name].producer is not None
+            )
+            for name, stage in self.__stages.items()
+        }
+
+        order = []
+        while len(order) < len(self.__stages):
+            ready = [name for name, count in remaining_inputs.items() if count == 0]
+            if len(ready) == 0:
+                return None
+
+            name = ready[0]
+            del remaining_inputs[name]
+            order.append(name)
+            for queue_name in self.__stages[name].output_queues:
+                consumer = self.__queue_specs[queue_name].consumer
+                if consumer is not None:
+                    remaining_inputs[consumer] -= 1
+
+        return order
+
+    def __is_fusable(self, queue_spec: PipelineQueue) -> bool:
+        """
+        Returns whether the stages at either end of the queue can be fused by `build()`.
+        """
+        if queue_spec.producer is None or queue_spec.consumer is None:
+            return False
+
+        producer = self.__stages[queue_spec.producer]
+        consumer = self.__stages[queue_spec.consumer]
+        return (
+            producer.is_single_process()
+            and consumer.is_single_process()
+            and producer.scheduling == consumer.scheduling
+        )
+
+    def __group_stages(self, order: "list[str]", fuse: bool) -> "list[list[str]]":
+        """
+        Returns the stages of each process in topological order.
+        """
+        # Representative stage of each group
+        group_of = {name: name for name in order}
+
+        def find(name: str) -> str:
+            while group_of[name] != name:
+                name = group_of[name]
+
+            return name
+
+        for queue_spec in self.__queue_specs.values():
+            if queue_spec.fuse or (fuse and self.__is_fusable(queue_spec)):
+                group_of[find(queue_spec.consumer)] = find(queue_spec.producer)  # type: ignore
+
+        groups: "dict[str, list[str]]" = {}
+        for name in order:
+            groups.setdefault(find(name), []).append(name)
+
+        return list(groups.values())
+
+    def __create_fused_target(self, group: "list[str]") -> FusedWorkers:
+        """
+        Creates the target which runs the stages of the group in 1 process.
+        """
+        fused_queue_indices = {}
+        fused_queues = []
+        for name in group:
+            for queue_name in self.__stages[name].output_queues:
+                if self.__queue_specs[queue_name].consumer not in group:
+                    continue
+
+                queue_spec = self.__queue_specs[queue_name]
+                options = {
+                    key: value
+                    for key, value in queue_spec.options.items()
+                    if key not in self.__PROCESS_QUEUE_OPTIONS
+                }
+                fused_queue_indices[queue_name] = len(fused_queues)
+                fused_queues.append((queue_spec.maxsize, options))
+
+        stages = []
+        for name in group:
+            stage = self.__stages[name]
+            stages.append(
+                (
+                    stage.target,
+                    stage.work_arguments,
+                    [
+                        fused_queue_indices.get(queue_name, self.__queues.get(queue_name))
+                        for queue_name in stage.input_queues
+                    ],
+                    [
+                        fused_queue_indices.get(queue_name, self.__queues.get(queue_name))
+                        for queue_name in stage.output_queues
+                    ],
+                    stage.scheduling,
+                )
+            )
+
+        return FusedWorkers(stages, fused_queues, "+".join(group))
+
+    def __create_worker_properties(
+        self, group: "list[str]"
+    ) -> "tuple[bool, worker_manager.WorkerProperties | None]":
+        """
+        Creates the worker properties of a process group.
+        """
+        if len(group) > 1:
+            return worker_manager.WorkerProperties.create(
+                count=1,
+                target=self.__create_fused_target(group),
+                work_arguments=(),
+                input_queues=[],
+                output_queues=[],
+                controller=self.__controller,
+                local_logger=self.__local_logger,
+            )
+
+        stage = self.__stages[group[0]]
+        return worker_manager.WorkerProperties.create(
+            count=stage.count,
+            target=stage.target,
+            work_arguments=stage.work_arguments,
+            input_queues=[self.__queues[queue_name] for queue_name in stage.input_queues],
+            output_queues=[self.__queues[queue_name] for queue_name in stage.output_queues],
+            controller=self.__controller,
+            local_logger=self.__local_logger,
+            min_count=stage.min_count,
+            max_count=stage.max_count,
+            scheduling=stage.scheduling,
+            backend=stage.backend,
+        )
+
+    def build(self, fuse: bool = True) -> bool:
+        """
+        Creates the queues, worker properties and worker managers. Call once, after declaring.
+
+        fuse: Whether to also fuse adjacent single worker stages with equal scheduling
+        into 1 process, queues declared with `fuse` are always fused.
+
+        Returns whether the pipeline was built.
+        """
+        if self.__is_built:
+            self.__local_logger.error("Pipeline is already built", True)
+            return False
+
+        if self.__is_declaration_failed:
+            self.__local_logger.error("Pipeline has a failed declaration", True)
+            return False
+
+        order = self.__sort_stages()
+        if order is None:
+            self.__local_logger.error("Pipeline stages form a cycle", True)
+            return False
+
+        groups = self.__group_stages(order, fuse)
+        process_of = {name: i for i, group in enumerate(groups) for name in group}
+
+        # Queues inside a process are created by the process
+        for name, queue_spec in self.__queue_specs.items():
+            if (
+                queue_spec.producer is not None
+                and queue_spec.consumer is not None
+                and process_of[queue_spec.producer] == process_of[queue_spec.consumer]
+            ):
+                continue
+
+            self.__queues[name] = queue_proxy_wrapper.QueueProxyWrapper(
+                self.__mp_manager, queue_spec.maxsize, **queue_spec.options
+            )
+
+        for group in groups:
+            result, worker_properties = self.__create_worker_properties(group)
+            if not result:
+                self.__local_logger.error(f"Failed to create worker properties of {group}", True)
+                return False
+
+            # Get Pylance to stop complaining
+            assert worker_properties is not None
+
+            result, manager = worker_manager.WorkerManager.create(
+                worker_properties, self.__local_logger
+            )
+            if not result:
+                self.__local_logger.error(f"Failed to create worker manager of {group}", True)
+                return False
+
+            # Get Pylance to stop complaining
+            assert manager is not None
+
+            self.__worker_managers.append(manager)
+            if len(group) == 1:
+                self.__stage_managers[group[0]] = manager
+
+        # Queues nearest the end first, main is the end
+        position = {name: i for i, name in enumerate(order)}
+
+        def drain_key(name: str) -> "tuple[int, int]":
+            queue_spec = self.__queue_specs[name]
+            consumer_position = len(order)
+            if queue_spec.consumer is not None:
+                consumer_position = position[queue_spec.consumer]
+
+            producer_position = -1
+            if queue_spec.producer is not None:
+                producer_position = position[queue_spec.producer]
+
+            return consumer_position, producer_position
+
+        self.__drain_order = [
+            self.__queues[name] for name in sorted(self.__queues, key=drain_key, reverse=True)
+        ]
+
+        self.__is_built = True
+        return True
+
+    def get_queue(self, name: str) -> "queue_proxy_wrapper.QueueProxyWrapper | None":
+        """
+        Returns the queue, None if it was fused into a process or the pipeline is not built.
+        """
+        return self.__queues.get(name)
+
+    def get_queues(self) -> "dict[str, queue_proxy_wrapper.QueueProxyWrapper]":
+        """
+        Returns the queues between processes by name, in order of declaration.
+        """
+        return dict(self.__queues)
+
+    def get_worker_manager(self, stage_name: str) -> "worker_manager.WorkerManager | None":
+        """
+        Returns the worker manager of the stage, e.g. to scale it at runtime,
+        None if it was fused with other stages or the pipeline is not built.
+        """
+        return self.__stage_managers.get(stage_name)
+
+    def get_worker_managers(self) -> "list[worker_manager.WorkerManager]":
+        """
+        Returns the worker managers of each process group, in topological order.
+        """
+        return list(self.__worker_managers)
+
+    def start(self, timeout: "float | None" = None) -> bool:
+        """
+        Starts the workers in topological order and waits until all are running,
+        see `worker_manager.start_workers()`.
+        """
+        return worker_manager.start_workers(self.__worker_managers, timeout)
+
+    def stop(
+        self,
+        timeout: "float | None" = None,
+        other_queues: "list[queue_proxy_wrapper.QueueProxyWrapper] | None" = None,
+    ) -> "tuple[bool, list[worker_manager.WorkerStopTime]]":
+        """
+        Stops the workers, draining the queues from END TO START,
+        see `worker_manager.stop_workers()`.
+
+        other_queues: Queues created outside the pipeline (e.g. with several producers),
+        which are drained after the queues of the pipeline, from END TO START.
+        """
+        if other_queues is None:
+            other_queues = []
+
+        return worker_manager.stop_workers(
+            self.__controller,
+            self.__worker_managers,
+            self.__drain_order + other_queues,
+            timeout,
+        )
+
+    def close(self) -> None:
+        """
+        Frees the shared memory of the queues, call after stopping.
+        """
+        for pipeline_queue in self.__queues.values():
+            pipeline_queue.close()
@@ -0,0 +1,15 @@
+"""
+Imported once by the forkserver, so forked workers share the imports instead of repeating them.
+Must be the last module to preload.
+"""
+
+import gc
+
+# Importing mavutil also loads the dialect tables, which are the bulk of the import time
+# pylint: disable-next=unused-import
+from pymavlink import mavutil
+
+
+# Move everything imported so far out of the collector's reach, so collections in the workers
+# do not write to the shared pages and copy them
+gc.freeze()
@@ -0,0 +1,125 @@
+"""
+Resource usage of worker processes.
+"""
+
+import os
+import time
+
+
+class WorkerResourceSample:
+    """
+    Resource usage of a worker process at one point in time, totals since it started.
+    """
+
+    def __init__(
+        self,
+        pid: int,
+        timestamp: float,
+        cpu_time: float,
+        rss: int,
+        voluntary_context_switches: int,
+        involuntary_context_switches: int,
+        loop_count: int,
+    ) -> None:
+        self.pid = pid
+        self.timestamp = timestamp  # s, `time.monotonic()`
+        self.cpu_time = cpu_time  # s, user and system
+        self.rss = rss  # bytes
+        # Blocked (e.g. on a queue) and preempted
+        self.voluntary_context_switches = voluntary_context_switches
+        self.involuntary_context_switches = involuntary_context_switches
+        self.loop_count = loop_count
+
+    def __str__(self) -> str:
+        return (
+            f"pid: {self.pid}, "
+            f"cpu time: {self.cpu_time:.3f}s, "
+            f"rss: {self.rss / 2**20:.1f}MiB, "
+            f"context switches: {self.voluntary_context_switches} voluntary "
+            f"{self.involuntary_context_switches} involuntary, "
+            f"loops: {self.loop_count}"
+        )
+
+
+def read_process_resources(
+    pid: int, loop_count: int, thread_id: "int | None" = None
+) -> "WorkerResourceSample | None":
+    """
+    Reads the resource usage of the process from /proc.
+
+    pid: Process id.
+    loop_count: Loop iterations of the worker, from its controller.
+    thread_id: Native id of a thread of the process to read the CPU time and context switches
+    of, None for the whole process. Memory is always of the whole process.
+
+    Returns the sample, None if the process has exited or /proc is not available.
+    """
+    path = f"/proc/{pid}"
+    if thread_id is not None:
+        path = f"/proc/{pid}/task/{thread_id}"
+
+    timestamp = time.monotonic()
+    try:
+        with open(f"{path}/stat", "r", encoding="utf-8") as stat_file:
+            stat = stat_file.read()
+
+        with open(f"{path}/status", "r", encoding="utf-8") as status_file:
+            status = status_file.read()
+    except OSError:
+        return None
+
+    # The name in parentheses can contain spaces, the fields after it start at the state
+    fields = stat[stat.rindex(")") + 2 :].split()
+    # utime and stime, fields 14 and 15 counting from the pid
+    cpu_time = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    values = {}
+    for line in status.splitlines():
+        name, _, value = line.partition(":")
+        values[name] = value.split()
+
+    # Zombies have no memory
+    rss = int(values.get("VmRSS", ["0"])[0]) * 1024
+
+    return WorkerResourceSample(
+        pid,
+        timestamp,
+        cpu_time,
+        rss,
+        int(values["voluntary_ctxt_switches"][0]),
+        int(values["nonvoluntary_ctxt_switches"][0]),
+        loop_count,
+    )
+
+
+def format_resource_rates(
+    previous: "WorkerResourceSample | None", current: WorkerResourceSample
+) -> str:
+    """
+    Formats the usage between 2 samples of the same process as rates,
+    or the totals since it started if there is no previous sample.
+    """
+    if previous is None or previous.pid != current.pid:
+        return str(current)
+
+    elapsed = current.timestamp - previous.timestamp
+    if elapsed <= 0.0:
+        return str(current)
+
+    cpu_ratio = (current.cpu_time - previous.cpu_time) / elapsed
+    voluntary_rate = (
+        current.voluntary_context_switches - previous.voluntary_context_switches
+    ) / elapsed
+    involuntary_rate = (
+        current.involuntary_context_switches - previous.involuntary_context_switches
+    ) / elapsed
+    loop_rate = (current.loop_count - previous.loop_count) / elapsed
+    rss_change = current.rss - previous.rss
+
+    return (
+        f"pid: {current.pid}, "
+        f"cpu: {cpu_ratio * 100:.1f}%, "
+        f"rss: {current.rss / 2**20:.1f}MiB ({rss_change / 2**10:+.0f}KiB), "
+        f"context switches: {voluntary_rate:.1f}/s voluntary {involuntary_rate:.1f}/s involuntary, "
+        f"loops: {loop_rate:.1f}/s"
+    )
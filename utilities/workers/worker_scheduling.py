@@ -0,0 +1,115 @@
+"""
+CPU affinity and scheduling of workers.
+"""
+
+import enum
+import os
+
+
+class SchedulingPolicy(enum.Enum):
+    """
+    Linux scheduling policies, real time policies run ahead of every normal process.
+    """
+
+    # Default time sharing, ordered by nice value
+    OTHER = "SCHED_OTHER"
+    # Real time, runs until it blocks or a higher priority process is ready
+    FIFO = "SCHED_FIFO"
+    # Real time, takes turns with processes of the same priority
+    RR = "SCHED_RR"
+
+
+class WorkerScheduling:
+    """
+    CPU affinity, nice value and scheduling policy which a worker applies to its thread
+    before its target runs, so latency critical workers can be kept away from noisy ones.
+
+    Settings which are not permitted (e.g. real time without root or CAP_SYS_NICE)
+    or not supported on the platform are skipped, and the worker runs anyway.
+    """
+
+    def __init__(
+        self,
+        cpus: "set[int] | None" = None,
+        nice: "int | None" = None,
+        policy: SchedulingPolicy = SchedulingPolicy.OTHER,
+        priority: int = 0,
+    ) -> None:
+        """
+        cpus: CPU cores the worker may run on, None for any.
+        nice: Nice value from -20 (most favoured) to 19, None to inherit from main.
+        Lowering it below the nice value of main needs CAP_SYS_NICE.
+        policy: Scheduling policy.
+        priority: Real time priority from 1 to 99, must be 0 for SCHED_OTHER.
+        """
+        assert cpus is None or len(cpus) > 0, "Worker must be allowed at least 1 CPU"
+        assert nice is None or -20 <= nice <= 19, "Nice value must be from -20 to 19"
+        if policy == SchedulingPolicy.OTHER:
+            assert priority == 0, "SCHED_OTHER has no priority"
+        else:
+            assert 1 <= priority <= 99, "Real time priority must be from 1 to 99"
+
+        self.cpus = None if cpus is None else frozenset(cpus)
+        self.nice = nice
+        self.policy = policy
+        self.priority = priority
+
+    def apply(self) -> "list[str]":
+        """
+        Applies the settings to the calling thread, call in the worker before its target runs.
+
+        On Linux each setting is per thread: other threads of the process keep theirs,
+        and threads started afterwards inherit them from the calling thread.
+
+        Returns the settings which could not be applied, empty if all were.
+        """
+        failures = []
+
+        if self.cpus is not None:
+            try:
+                os.sched_setaffinity(0, self.cpus)
+            # Not permitted, CPUs do not exist, or not on Linux
+            except (AttributeError, OSError):
+                failures.append("cpus")
+
+        if self.policy != SchedulingPolicy.OTHER:
+            try:
+                os.sched_setscheduler(
+                    0, getattr(os, self.policy.value), os.sched_param(self.priority)
+                )
+            except (AttributeError, OSError):
+                failures.append("policy")
+
+        if self.nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, 0, self.nice)
+            except (AttributeError, OSError):
+                failures.append("nice")
+
+        return failures
+
+    def __eq__(self, other: object) -> bool:
+        """
+        Equal if all settings are equal, so copies (e.g. pickled by spawn) compare equal.
+        """
+        if not isinstance(other, WorkerScheduling):
+            return NotImplemented
+
+        return (self.cpus, self.nice, self.policy, self.priority) == (
+            other.cpus,
+            other.nice,
+            other.policy,
+            other.priority,
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.cpus, self.nice, self.policy, self.priority))
+
+    def __str__(self) -> str:
+        """
+        To string.
+        """
+        return (
+            f"{self.__class__}, cpus: {None if self.cpus is None else sorted(self.cpus)}, "
+            f"nice: {self.nice}, policy: {self.policy.value}, priority: {self.priority}"
+        )